@@ -14,3 +14,13 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_flashlearn.settings')
 
 application = get_asgi_application()
+
+# Load the reranker once per worker instead of on the first request. The
+# flashcard models are only loaded if this process also runs jobs.
+from django.conf import settings  # noqa: E402
+from flashlearn.utils.flashcard_generator import warm_up_models  # noqa: E402
+from flashlearn.utils.reranker import warm_up_reranker  # noqa: E402
+
+if getattr(settings, 'FLASHLEARN_IN_PROCESS_JOB_WORKERS', 0):
+    warm_up_models()
+warm_up_reranker()
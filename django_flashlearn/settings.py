@@ -44,6 +44,7 @@ SITE_ID = 1
 
 
 MIDDLEWARE = [
+    'flashlearn.utils.telemetry.CorrelationIdMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +82,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds a writer waits for the database lock before failing
+            'timeout': 20,
+        },
     }
 }
 
@@ -134,3 +139,187 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Model registry
+# Models loaded by the flashcard generator are shared process-wide. When the
+# estimated size of loaded models exceeds the budget, the least recently used
+# model is evicted. Warm-up loads the models when a ``run_jobs`` worker starts,
+# and in WSGI/ASGI workers only if they run jobs in process.
+
+FLASHLEARN_MODEL_MEMORY_BUDGET_MB = 2048
+
+FLASHLEARN_WARM_UP_MODELS = True
+
+# Number of paragraphs sent through question generation per batched call
+
+FLASHLEARN_FLASHCARD_BATCH_SIZE = 8
+
+# Decoding profile of the flashcard models: 'beam' (4 beams, 2 questions per
+# paragraph), 'small_beam', 'greedy', or 'early_exit' (greedy, retrying only
+# rejected questions with a 2-beam search). Compare them with bench_flashcards.
+
+FLASHLEARN_FLASHCARD_DECODING = 'beam'
+
+# Embed the summary's paragraphs before flashcard generation and pick them by
+# maximal marginal relevance, skipping near-duplicates, and drop questions
+# that are near-duplicates of earlier cards'. Off means document order and
+# no Ollama embedding calls during flashcard jobs.
+
+FLASHLEARN_FLASHCARD_SELECTION = False
+
+# Inference backend of the flashcard T5 models on CPU: 'torch', 'int8'
+# (dynamically quantized) or 'onnx' (ONNX Runtime; needs optimum[onnxruntime]).
+# ONNX exports are cached in FLASHLEARN_T5_ARTIFACT_DIR. FLASHLEARN_T5_THREADS
+# caps the CPU threads used for inference (None leaves the library default).
+
+FLASHLEARN_T5_BACKEND = 'torch'
+
+FLASHLEARN_T5_ARTIFACT_DIR = os.path.join(BASE_DIR, 'model_cache')
+
+FLASHLEARN_T5_THREADS = None
+
+# Background jobs
+# Jobs are queued in the database and run by dedicated worker processes:
+# ``python manage.py run_jobs``. For development without a worker, set this
+# to the number of threads the web process should drain the queue with.
+
+FLASHLEARN_IN_PROCESS_JOB_WORKERS = 0
+
+FLASHLEARN_JOB_POLL_INTERVAL = 1.0
+
+# Workers renew a running job's lease every FLASHLEARN_JOB_HEARTBEAT_SECONDS.
+# A job whose heartbeat is older than FLASHLEARN_JOB_LEASE_SECONDS is requeued,
+# or failed after FLASHLEARN_JOB_MAX_ATTEMPTS. On shutdown, ``run_jobs`` lets
+# workers finish their current job for FLASHLEARN_JOB_SHUTDOWN_SECONDS.
+
+FLASHLEARN_JOB_HEARTBEAT_SECONDS = 15
+
+FLASHLEARN_JOB_LEASE_SECONDS = 120
+
+FLASHLEARN_JOB_MAX_ATTEMPTS = 2
+
+FLASHLEARN_JOB_SHUTDOWN_SECONDS = 300
+
+# Ollama server used for chat, summarization and embeddings
+
+OLLAMA_BASE_URL = 'http://localhost:11434'
+
+# Per-process caches of Chroma clients and chatbots (QA chains). Entries not
+# used for FLASHLEARN_CACHE_IDLE_SECONDS are dropped.
+
+FLASHLEARN_VECTOR_STORE_CACHE_SIZE = 8
+
+FLASHLEARN_CHATBOT_CACHE_SIZE = 16
+
+FLASHLEARN_CACHE_IDLE_SECONDS = 30 * 60
+
+# Embeddings are cached on disk by (model, text hash) so repeated chunks and
+# questions are not sent to Ollama again. Set the path to None to disable.
+
+FLASHLEARN_EMBEDDING_CACHE_PATH = BASE_DIR / 'embedding_cache.sqlite3'
+
+FLASHLEARN_EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+
+# Knowledge-base ingestion: PDF pages are extracted in a pool of this many
+# processes (None uses every CPU) and embedded in batches of this many chunks.
+
+FLASHLEARN_INGEST_WORKERS = None
+
+FLASHLEARN_INGEST_BATCH_SIZE = 64
+
+# Long topics are summarized map-reduce style: split into chunks of about this
+# many tokens, with at most this many summarization requests to Ollama at once.
+
+FLASHLEARN_SUMMARY_CHUNK_TOKENS = 1500
+
+FLASHLEARN_SUMMARY_CONCURRENCY = 2
+
+# Semantic answer cache for the chatbot: a question at least this cosine-similar
+# to one asked before about the same knowledge base gets the earlier answer.
+# Answers expire after FLASHLEARN_ANSWER_CACHE_TTL seconds (None keeps them).
+
+FLASHLEARN_ANSWER_CACHE_ENABLED = True
+
+FLASHLEARN_ANSWER_CACHE_THRESHOLD = 0.92
+
+FLASHLEARN_ANSWER_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Every request to Ollama goes through one pooled client per process. At most
+# FLASHLEARN_OLLAMA_MAX_CONCURRENCY requests are in flight (match the server's
+# OLLAMA_NUM_PARALLEL); chat requests are sent before queued batch work.
+
+FLASHLEARN_OLLAMA_MAX_CONCURRENCY = 2
+
+FLASHLEARN_OLLAMA_TIMEOUT = 300
+
+FLASHLEARN_OLLAMA_RETRIES = 2
+
+# Chatbot retrieval: 'hybrid' fuses a BM25 keyword index with vector search,
+# 'vector' uses vector search (MMR) alone. In hybrid mode, questions fall back
+# to keyword results when the embedding model takes longer than the timeout.
+
+FLASHLEARN_RETRIEVAL_MODE = 'hybrid'
+
+FLASHLEARN_DENSE_SEARCH_TIMEOUT = 2.0
+
+# Optional cross-encoder reranking for the chatbot (needs transformers and
+# torch): FLASHLEARN_RERANK_CANDIDATES chunks are retrieved, scored for at most
+# FLASHLEARN_RERANK_LATENCY_BUDGET seconds, and the best FLASHLEARN_RERANK_TOP_N
+# that fit in FLASHLEARN_RERANK_CONTEXT_TOKENS go into the prompt.
+
+FLASHLEARN_RERANK_ENABLED = False
+
+FLASHLEARN_RERANK_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+FLASHLEARN_RERANK_CANDIDATES = 12
+
+FLASHLEARN_RERANK_TOP_N = 3
+
+FLASHLEARN_RERANK_LATENCY_BUDGET = 0.5
+
+FLASHLEARN_RERANK_CONTEXT_TOKENS = 1500
+
+# Token budget for the retrieved context in a chat prompt. Repeated and
+# overlapping chunks are removed before the budget is applied.
+
+FLASHLEARN_CONTEXT_TOKENS = 1500
+
+# Chat memory: the chatbot sees the last FLASHLEARN_CHAT_HISTORY_TURNS
+# question/answer pairs word for word, plus a running summary (at most
+# FLASHLEARN_CHAT_SUMMARY_TOKENS) of everything before them.
+
+FLASHLEARN_CHAT_HISTORY_TURNS = 3
+
+FLASHLEARN_CHAT_SUMMARY_TOKENS = 300
+
+# Stage timings and error counts for Prometheus at /metrics, which answers
+# staff users and the scraper addresses below. With metrics disabled the
+# instrumentation does nothing.
+
+FLASHLEARN_METRICS_ENABLED = True
+
+FLASHLEARN_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Application logs carry the correlation id of the request or job
+# (also returned in the X-Request-ID response header).
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'correlation_id': {'()': 'flashlearn.utils.telemetry.CorrelationIdFilter'},
+    },
+    'formatters': {
+        'flashlearn': {'format': '%(asctime)s %(levelname)s [%(correlation_id)s] %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'flashlearn_console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['correlation_id'],
+            'formatter': 'flashlearn',
+        },
+    },
+    'loggers': {
+        'flashlearn': {'handlers': ['flashlearn_console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -0,0 +1 @@
+"""Offline fixtures and helpers for the ``bench_*`` management commands."""
@@ -0,0 +1,119 @@
+import random
+
+WORDS = (
+    "cell energy light plant water carbon oxygen glucose membrane protein enzyme "
+    "reaction molecule nucleus gene chromosome evolution species habitat climate "
+    "force motion mass velocity acceleration gravity friction pressure density "
+    "atom electron charge current voltage circuit magnet wave frequency heat"
+).split()
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def synthetic_page_lines(page_number, lines_per_page=40, words_per_line=12, seed=0):
+    """Deterministic pseudo-text for one page."""
+    rng = random.Random(seed * 1_000_003 + page_number)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(words_per_line)).capitalize() + "."
+        for _ in range(lines_per_page)
+    ]
+
+
+def make_synthetic_pdf(path, pages=100, chapters=10, lines_per_page=40, seed=0):
+    """Write a text PDF with an outline of ``chapters`` main headings.
+
+    The file is written by hand so benchmarks need no PDF authoring library.
+    Chapter titles contain no '.' so ``extract_main_headings`` keeps them.
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for page_number in range(pages):
+        lines = synthetic_page_lines(page_number, lines_per_page, seed=seed)
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 40 760 Td 11 TL {text} ET".encode('latin-1')
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (page_tree, font, content)
+        ))
+
+    outline = add(None)
+    chapter_starts = [i * pages // chapters for i in range(chapters)]
+    item_ids = list(range(len(objects) + 1, len(objects) + 1 + chapters))
+    for i, start in enumerate(chapter_starts):
+        links = b""
+        if i > 0:
+            links += b" /Prev %d 0 R" % item_ids[i - 1]
+        if i < chapters - 1:
+            links += b" /Next %d 0 R" % item_ids[i + 1]
+        add(
+            b"<< /Title (Chapter %d Topic %s) /Parent %d 0 R /Dest [%d 0 R /XYZ 0 792 0]%s >>"
+            % (i + 1, WORDS[i % len(WORDS)].encode(), outline, page_ids[start], links)
+        )
+
+    objects[outline - 1] = b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>" % (
+        item_ids[0], item_ids[-1], chapters
+    )
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), pages
+    )
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R /Outlines %d 0 R /PageMode /UseOutlines >>" % (
+        page_tree, outline
+    )
+
+    with open(path, 'wb') as pdf:
+        pdf.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(pdf.tell())
+            pdf.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = pdf.tell()
+        pdf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            pdf.write(b"%010d 00000 n \n" % offset)
+        pdf.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1, catalog, xref
+        ))
+    return path
+
+
+def _pseudo_word(rng):
+    syllables = ["ka", "lo", "ven", "tir", "mo", "zan", "el", "qu", "dra", "fen", "sor", "bi", "nex", "pa"]
+    return "".join(rng.choice(syllables) for _ in range(3)).capitalize()
+
+
+def make_glossary_corpus(chunks=300, seed=0):
+    """Chunks of pseudo-text, each defining one made-up named law, plus questions about them.
+
+    Returns ``(documents, queries)`` where each query is ``(text, relevant
+    chunk id, kind)``. 'term' queries name the law exactly, as glossary
+    questions do; 'loose' queries name it in lower case without the
+    possessive and add what it relates.
+    """
+    from langchain_core.documents import Document
+
+    rng = random.Random(seed)
+    documents, queries = [], []
+    for i in range(chunks):
+        name = _pseudo_word(rng)
+        term = f"{name}'s law"
+        subject, target = rng.choice(WORDS), rng.choice(WORDS)
+        lines = synthetic_page_lines(i, lines_per_page=8, seed=seed)
+        definition = f"{term} relates {subject} to {target}."
+        lines.insert(rng.randrange(len(lines)), definition)
+        chunk_id = f"chunk-{i}"
+        documents.append(Document(id=chunk_id, page_content=" ".join(lines), metadata={'page': i, 'source': 'glossary'}))
+        queries.append((f"What does {term} say?", chunk_id, 'term'))
+        queries.append((f"how does the {name.lower()} law relate {subject} and {target}", chunk_id, 'loose'))
+    return documents, queries
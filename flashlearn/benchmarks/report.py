@@ -0,0 +1,67 @@
+"""Latency summaries and JSON result files shared by the ``bench_*`` commands."""
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def latency_summary(seconds):
+    """p50/p95/mean/max in milliseconds of a list of durations in seconds."""
+    if not seconds:
+        return {'n': 0}
+    return {
+        'n': len(seconds),
+        'p50_ms': statistics.median(seconds) * 1000,
+        'p95_ms': percentile(seconds, 0.95) * 1000,
+        'mean_ms': statistics.mean(seconds) * 1000,
+        'max_ms': max(seconds) * 1000,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path, results, options):
+    """Write ``results`` with what is needed to tell runs apart."""
+    data = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'options': options,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare_results(old, new):
+    """Return (metric, old, new, relative change) for every number in both result sets."""
+    old_values = dict(_flatten(old))
+    rows = []
+    for name, value in _flatten(new):
+        if name in old_values:
+            before = old_values[name]
+            change = (value - before) / before if before else None
+            rows.append((name, before, value, change))
+    return rows
@@ -0,0 +1,245 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings that sleep like a remote embedding model would."""
+
+    latency_per_call: float = 0.0
+    latency_per_text: float = 0.0
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency_per_call + self.latency_per_text * len(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.latency_per_call + self.latency_per_text)
+        return super().embed_query(text)
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-words vectors (hashed into ``size`` buckets) with simulated latency.
+
+    Unlike random fake embeddings, texts that share words are close, so
+    retrieval quality can be compared between search strategies.
+    """
+
+    def __init__(self, size=256, latency_per_call=0.0, latency_per_text=0.0):
+        self.size = size
+        self.latency_per_call = latency_per_call
+        self.latency_per_text = latency_per_text
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.size] += 1.0
+        norm = sum(x * x for x in vector) ** 0.5 or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency_per_call + self.latency_per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency_per_call + self.latency_per_text)
+        return self._embed(text)
+
+
+def _estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+def extractive_reply(prompt, ratio=3, max_words=300):
+    """A deterministic stand-in answer: every ``ratio``-th sentence of the prompt's text."""
+    text = prompt.split(":\n", 1)[-1]
+    sentences = re.split(r"(?<=[.!?])\s+", text)
+    words = " ".join(sentences[::ratio]).split()
+    return " ".join(words[:max_words]) or "No answer."
+
+
+class StubOllamaServer:
+    """Local HTTP server speaking enough of the Ollama API for the pipelines.
+
+    ``/api/chat`` answers with ``reply(prompt)`` after simulating prefill
+    (``latency_per_call`` plus ``latency_per_prompt_token`` per prompt token)
+    and decoding (``latency_per_output_token`` per answer token, spread over
+    the streamed chunks). ``/api/embed`` returns hashed bag-of-words vectors.
+    Use as a context manager; ``url`` is the base URL to point clients at.
+    """
+
+    def __init__(self, reply=extractive_reply, latency_per_call=0.0, latency_per_prompt_token=0.0,
+                 latency_per_output_token=0.0, chunk_words=4):
+        self.reply = reply
+        self.latency_per_call = latency_per_call
+        self.latency_per_prompt_token = latency_per_prompt_token
+        self.latency_per_output_token = latency_per_output_token
+        self.chunk_words = chunk_words
+        self.embeddings = HashingEmbeddings()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server._lock:
+                    server.calls += 1
+                if self.path == '/api/chat':
+                    self._chat(body)
+                elif self.path == '/api/embed':
+                    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    self._send_json({"model": body["model"], "embeddings": server.embeddings.embed_documents(inputs)})
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chat(self, body):
+                prompt = "\n".join(message.get("content", "") for message in body["messages"])
+                prompt_tokens = _estimate_tokens(prompt)
+                prefill = server.latency_per_call + server.latency_per_prompt_token * prompt_tokens
+                time.sleep(prefill)
+                words = server.reply(prompt).split(" ")
+                pieces = [" ".join(words[i:i + server.chunk_words]) + " "
+                          for i in range(0, len(words), server.chunk_words)]
+                message = {"model": body["model"], "created_at": "2025-01-01T00:00:00Z"}
+                final = dict(
+                    message, done=True, done_reason="stop", prompt_eval_count=prompt_tokens,
+                    prompt_eval_duration=int(prefill * 1e9), eval_count=_estimate_tokens("".join(pieces))
+                )
+                if not body.get("stream", True):
+                    time.sleep(server.latency_per_output_token * final["eval_count"])
+                    final["message"] = {"role": "assistant", "content": "".join(pieces).strip()}
+                    self._send_json(final)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                for piece in pieces:
+                    time.sleep(server.latency_per_output_token * _estimate_tokens(piece))
+                    chunk = dict(message, message={"role": "assistant", "content": piece}, done=False)
+                    self.wfile.write((json.dumps(chunk) + "\n").encode())
+                    self.wfile.flush()
+                final["message"] = {"role": "assistant", "content": ""}
+                self.wfile.write((json.dumps(final) + "\n").encode())
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _StubTokens:
+    def __init__(self, texts):
+        self.input_ids = list(texts)
+        self.attention_mask = None
+
+    def to(self, device):
+        return self
+
+
+class StubT5Tokenizer:
+    """Passes texts through unchanged, so ``StubT5Model`` can read them."""
+
+    def __call__(self, texts, **kwargs):
+        return _StubTokens(texts)
+
+    def batch_decode(self, outputs, skip_special_tokens=True):
+        return list(outputs)
+
+
+class StubHiddenState:
+    """Stands in for an encoder hidden-state tensor: the input texts, indexable by a list of rows."""
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+
+    def __getitem__(self, rows):
+        return StubHiddenState(self.texts[i] for i in rows)
+
+
+class StubEncoderOutput:
+    def __init__(self, last_hidden_state):
+        self.last_hidden_state = last_hidden_state
+
+
+class StubT5Model:
+    """Imitates the question-generation and question-answering T5 models.
+
+    Encoding sleeps ``latency_per_encode`` per input, paid by
+    ``get_encoder()`` or by ``generate`` when given ``input_ids``.
+    ``generate`` sleeps ``latency_per_call`` plus ``latency_per_sequence``
+    for every input, return sequence and beam, then returns strings.
+    Questions are made from the paragraph's words; one in three is
+    deliberately malformed so the generator's filters have work to do.
+    Answers are the first sentence of the context.
+    """
+
+    def __init__(self, latency_per_call=0.0, latency_per_sequence=0.0, latency_per_encode=0.0):
+        self.latency_per_call = latency_per_call
+        self.latency_per_sequence = latency_per_sequence
+        self.latency_per_encode = latency_per_encode
+        self.calls = 0
+        self.encoded = 0
+
+    def _encode(self, input_ids, attention_mask=None):
+        self.encoded += len(input_ids)
+        time.sleep(self.latency_per_encode * len(input_ids))
+        return StubEncoderOutput(StubHiddenState(input_ids))
+
+    def get_encoder(self):
+        return self._encode
+
+    def generate(self, input_ids=None, encoder_outputs=None, num_return_sequences=1, num_beams=1, **kwargs):
+        self.calls += 1
+        if encoder_outputs is None:
+            encoder_outputs = self._encode(input_ids)
+        texts = encoder_outputs.last_hidden_state.texts
+        time.sleep(self.latency_per_call
+                   + self.latency_per_sequence * len(texts) * max(num_return_sequences, num_beams))
+        outputs = []
+        for text in texts:
+            if text.startswith("question: "):
+                context = text.split(" context: ", 1)[-1]
+                outputs.append(re.split(r"(?<=[.!?])\s+", context)[0][:150])
+                continue
+            words = re.findall(r"[A-Za-z]+", text)[2:] or ["this"]
+            for i in range(num_return_sequences):
+                seed = int(hashlib.md5(f"{text}{num_beams}{i}".encode()).hexdigest(), 16)
+                subject = " and ".join(words[(seed + j) % len(words)].lower() for j in range(2))
+                outputs.append(f"How are {subject} related" if seed % 3 == 0 else f"How are {subject} related?")
+        return outputs
+
+
+class StubModelRegistry:
+    """Hands out the stub T5 pair for every model, in place of ``get_registry()``."""
+
+    def __init__(self, latency_per_call=0.0, latency_per_sequence=0.0, latency_per_encode=0.0):
+        self.model = StubT5Model(latency_per_call, latency_per_sequence, latency_per_encode)
+        self.tokenizer = StubT5Tokenizer()
+
+    def get(self, key, loader):
+        return self.tokenizer, self.model
+
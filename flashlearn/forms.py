@@ -23,6 +23,11 @@ class PDFUploadForm(forms.ModelForm):
 
 class SummaryTopicForm(forms.Form):
     topic = forms.ChoiceField(widget=forms.Select(attrs={'class': 'form-select'}))
+    regenerate = forms.BooleanField(
+        required=False,
+        label="Regenerate instead of reusing an earlier summary",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
     
     def __init__(self, *args, topics=None, **kwargs):
         super().__init__(*args, **kwargs)
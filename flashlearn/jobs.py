@@ -0,0 +1,276 @@
+"""Database-backed background job queue.
+
+Views enqueue a ``Job`` row and return immediately. Jobs are claimed with an
+atomic status update, so any number of workers can drain the same table
+without Redis: the worker processes started by ``manage.py run_jobs`` and,
+if FLASHLEARN_IN_PROCESS_JOB_WORKERS is set for development, a thread pool
+in the web process.
+
+A running job holds a lease that its worker renews with a heartbeat. If a
+worker dies, its job's heartbeat goes stale and the next worker to poll
+requeues it, or fails it once it has used up its attempts.
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+from .utils.telemetry import correlation_scope, span
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+DEFAULT_HEARTBEAT_SECONDS = 15
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 2
+STALE_JOB_ERROR = "The worker running this job stopped responding."
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+
+def task(kind):
+    """Register a function as the handler for jobs of ``kind``."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def get_handler(kind):
+    """Return the handler for ``kind``, importing the task modules on first use."""
+    if kind not in HANDLERS:
+        from . import tasks  # noqa: F401  (registers the handlers)
+    return HANDLERS[kind]
+
+
+class JobContext:
+    """Handed to handlers so they can report progress and notice cancellation."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def progress(self, fraction, message=""):
+        """Record progress and raise JobCancelled if the job was cancelled."""
+        Job.objects.filter(id=self.job.id).update(
+            progress=max(0.0, min(1.0, fraction)),
+            message=message[:255],
+            heartbeat_at=timezone.now()
+        )
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if Job.objects.filter(id=self.job.id, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def enqueue(kind, user=None, **payload):
+    """Create a queued job and wake the in-process workers once it is committed."""
+    job = Job.objects.create(kind=kind, user=user, payload=payload)
+    transaction.on_commit(_wake_in_process_workers)
+    return job
+
+
+def cancel(job):
+    """Cancel a queued job, or ask a running job to stop at its next checkpoint.
+
+    A running job whose worker has stopped responding is cancelled at once.
+    """
+    if Job.objects.filter(id=job.id, status='queued').update(
+        status='cancelled', finished_at=timezone.now()
+    ):
+        return True
+    if not Job.objects.filter(id=job.id, status='running').update(cancel_requested=True):
+        return False
+    recover_stale_jobs()
+    return True
+
+
+def recover_stale_jobs():
+    """Requeue running jobs whose heartbeat is older than the lease.
+
+    Jobs that have used FLASHLEARN_JOB_MAX_ATTEMPTS are failed instead, and
+    jobs with a pending cancellation are cancelled. Returns the number of
+    jobs changed.
+    """
+    lease = getattr(settings, 'FLASHLEARN_JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+    max_attempts = getattr(settings, 'FLASHLEARN_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=lease)
+    # The status filter is re-applied by each update, so no job is changed twice
+    stale = Job.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    cancelled = stale.filter(cancel_requested=True).update(status='cancelled', finished_at=now)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='failed', finished_at=now, error=STALE_JOB_ERROR
+    )
+    requeued = stale.update(
+        status='queued', worker='', started_at=None, heartbeat_at=None, progress=0,
+        message="Waiting for a worker (the previous one stopped responding)..."
+    )
+    if cancelled or failed or requeued:
+        logger.warning("Recovered stale jobs: %d requeued, %d failed, %d cancelled", requeued, failed, cancelled)
+    return cancelled + failed + requeued
+
+
+_last_recovery = 0.0
+
+
+def _recover_stale_jobs_periodically():
+    """Run ``recover_stale_jobs`` at most a few times per lease period per process."""
+    global _last_recovery
+    interval = getattr(settings, 'FLASHLEARN_JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS) / 4
+    if time.monotonic() - _last_recovery < interval:
+        return
+    _last_recovery = time.monotonic()
+    recover_stale_jobs()
+
+
+def claim_next_job(worker_name):
+    """Atomically move the oldest queued job to running and return it, or None."""
+    _recover_stale_jobs_periodically()
+    while True:
+        job_id = (Job.objects.filter(status='queued')
+                  .order_by('created_at', 'id')
+                  .values_list('id', flat=True)
+                  .first())
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(id=job_id, status='queued').update(
+            status='running', worker=worker_name, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+        # Another worker won the race for this job; try the next one
+
+
+def _send_heartbeats(job, stop):
+    """Renew ``job``'s lease every FLASHLEARN_JOB_HEARTBEAT_SECONDS until ``stop`` is set."""
+    interval = getattr(settings, 'FLASHLEARN_JOB_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+    try:
+        while not stop.wait(interval):
+            try:
+                Job.objects.filter(id=job.id, status='running', attempts=job.attempts).update(
+                    heartbeat_at=timezone.now()
+                )
+            except Exception as e:
+                logger.warning("Heartbeat for job %s failed: %s", job.id, e)
+    finally:
+        connection.close()
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome."""
+    context = JobContext(job)
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(target=_send_heartbeats, args=(job, stop_heartbeat), daemon=True)
+    heartbeat.start()
+    try:
+        with correlation_scope(f"job-{job.id}"), span(f'job.{job.kind}'):
+            context.check_cancelled()
+            result = get_handler(job.kind)(context, **job.payload)
+    except JobCancelled:
+        status, fields = 'cancelled', {}
+    except Exception as e:
+        logger.exception("Job %s failed", job.id)
+        status, fields = 'failed', {'error': str(e)}
+    else:
+        status, fields = 'succeeded', {'result': result, 'progress': 1.0}
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+    # A job that was requeued while this worker was unresponsive belongs to its new attempt
+    if not Job.objects.filter(id=job.id, status='running', attempts=job.attempts).update(
+        status=status, finished_at=timezone.now(), **fields
+    ):
+        logger.warning("Job %s was recovered by another worker; dropping this attempt's outcome", job.id)
+    job.refresh_from_db()
+    return job
+
+
+def run_worker(worker_name=None, poll_interval=1.0, stop_event=None, max_idle=None):
+    """Claim and run jobs until ``stop_event`` is set or the queue stays idle.
+
+    ``stop_event`` is only checked between jobs, so a running job is finished first.
+    """
+    worker_name = worker_name or f"{socket.gethostname()}:{os.getpid()}"
+    idle_since = time.monotonic()
+    while stop_event is None or not stop_event.is_set():
+        close_old_connections()
+        job = claim_next_job(worker_name)
+        if job is None:
+            if max_idle is not None and time.monotonic() - idle_since >= max_idle:
+                break
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        run_job(job)
+        idle_since = time.monotonic()
+    close_old_connections()
+
+
+def worker_process_main(worker_name, poll_interval, stop_event=None):
+    """Entry point for worker processes started by ``manage.py run_jobs``.
+
+    SIGTERM sets ``stop_event``, so the worker exits after its current job.
+    SIGINT is ignored; the parent process decides when workers stop.
+    """
+    import django
+    django.setup()
+    if stop_event is not None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    from .utils.flashcard_generator import warm_up_models
+    warm_up_models()
+    run_worker(worker_name, poll_interval=poll_interval, stop_event=stop_event)
+
+
+_in_process_pool = None
+_in_process_lock = threading.Lock()
+_in_process_draining = 0
+
+
+def _drain_queue():
+    """Run queued jobs on a pool thread until the queue is empty."""
+    global _in_process_draining
+    try:
+        run_worker(f"{socket.gethostname()}:{os.getpid()}:thread", max_idle=0)
+    finally:
+        with _in_process_lock:
+            _in_process_draining -= 1
+        # A job enqueued while this thread was exiting would otherwise wait
+        if Job.objects.filter(status='queued').exists():
+            _wake_in_process_workers()
+        close_old_connections()
+
+
+def _wake_in_process_workers():
+    """Start a drainer thread if the web process is configured to run jobs itself."""
+    global _in_process_pool, _in_process_draining
+    workers = getattr(settings, 'FLASHLEARN_IN_PROCESS_JOB_WORKERS', 0)
+    if not workers:
+        return
+    with _in_process_lock:
+        if _in_process_pool is None:
+            _in_process_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='flashlearn-job')
+        if _in_process_draining >= workers:
+            return
+        _in_process_draining += 1
+    _in_process_pool.submit(_drain_queue)
@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from flashlearn.benchmarks.fixtures import synthetic_page_lines
+from flashlearn.benchmarks.report import latency_summary, write_results
+from flashlearn.benchmarks.stubs import HashingEmbeddings, StubModelRegistry
+
+OPTION_NAMES = (
+    'profiles', 'summaries', 'paragraphs', 'num_cards', 't5_latency_ms', 'encode_latency_ms', 'real_models',
+    'no_selection',
+)
+
+
+class Command(BaseCommand):
+    help = ("Compare the flashcard decoding profiles: cards/s, acceptance rate and model work. "
+            "Uses stub T5 models unless --real-models is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='beam,small_beam,greedy,early_exit')
+        parser.add_argument('--summaries', type=int, default=10)
+        parser.add_argument('--paragraphs', type=int, default=12, help="Paragraphs per summary.")
+        parser.add_argument('--num-cards', type=int, default=8)
+        parser.add_argument('--t5-latency-ms', type=float, default=5.0,
+                            help="Stub T5 latency per generated sequence and beam.")
+        parser.add_argument('--encode-latency-ms', type=float, default=3.0, help="Stub T5 latency per encoded input.")
+        parser.add_argument('--real-models', action='store_true',
+                            help="Download and run the real T5 models, with the configured embeddings.")
+        parser.add_argument('--no-selection', action='store_true',
+                            help="Take paragraphs in document order, without embedding-based selection.")
+        parser.add_argument('--json', help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        from flashlearn.utils.flashcard_generator import FlashcardGenerator
+
+        summaries = [
+            " ".join(" ".join(synthetic_page_lines(s * options['paragraphs'] + p, lines_per_page=3))
+                     for p in range(options['paragraphs']))
+            for s in range(options['summaries'])
+        ]
+        results = {}
+        for profile in options['profiles'].split(','):
+            registry = embeddings = None
+            if not options['real_models']:
+                registry = StubModelRegistry(latency_per_sequence=options['t5_latency_ms'] / 1000,
+                                             latency_per_encode=options['encode_latency_ms'] / 1000)
+                embeddings = HashingEmbeddings()
+            with override_settings(FLASHLEARN_FLASHCARD_SELECTION=not options['no_selection']):
+                generator = FlashcardGenerator(registry=registry, decoding=profile,
+                                               embeddings=None if options['no_selection'] else embeddings)
+            totals = {'cards': 0, 'paragraphs': 0, 'questions': 0, 'valid_questions': 0,
+                      'duplicate_questions': 0, 'valid_answers': 0}
+            latencies = []
+            for summary in summaries:
+                stats = {}
+                start = time.perf_counter()
+                generator.generate_flashcards(summary, options['num_cards'], stats=stats)
+                latencies.append(time.perf_counter() - start)
+                for key in totals:
+                    totals[key] += stats[key]
+            elapsed = sum(latencies)
+            results[profile] = dict(
+                totals,
+                cards_per_second=totals['cards'] / elapsed if elapsed else 0.0,
+                acceptance_rate=totals['valid_answers'] / totals['paragraphs'] if totals['paragraphs'] else 0.0,
+                question_acceptance=(totals['valid_questions'] / totals['questions']
+                                     if totals['questions'] else 0.0),
+                latency=latency_summary(latencies),
+            )
+            if registry:
+                results[profile].update(model_calls=registry.model.calls, encoded_inputs=registry.model.encoded)
+
+        self.stdout.write(f"{'profile':<12}{'cards/s':>9}{'cards':>7}{'paragraphs':>12}"
+                          f"{'accept':>8}{'q accept':>10}{'dup q':>7}{'p50 ms':>9}")
+        for profile, row in results.items():
+            self.stdout.write(
+                f"{profile:<12}{row['cards_per_second']:>9.2f}{row['cards']:>7}{row['paragraphs']:>12}"
+                f"{row['acceptance_rate']:>8.2f}{row['question_acceptance']:>10.0%}{row['duplicate_questions']:>7}"
+                f"{row['latency'].get('p50_ms', 0.0):>9.0f}"
+            )
+        if options['json']:
+            write_results(options['json'], results, {name: options[name] for name in OPTION_NAMES})
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PDFPlumberLoader
+
+from flashlearn.benchmarks.fixtures import make_synthetic_pdf
+from flashlearn.benchmarks.stubs import SlowFakeEmbeddings
+from flashlearn.utils.embedding_store import EmbeddingStore
+from flashlearn.utils.model_registry import process_rss_bytes
+from flashlearn.utils.pdf_processor import iter_document_chunks, CHUNK_SIZE, CHUNK_OVERLAP
+
+
+class PeakRSS:
+    """Sample the process RSS in the background and keep the maximum."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = process_rss_bytes() or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, process_rss_bytes() or 0)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = "Benchmark knowledge-base ingestion on a synthetic PDF with stub embeddings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=500)
+        parser.add_argument('--mode', choices=['streaming', 'eager'], default='streaming',
+                            help="'eager' loads and splits the whole PDF before embedding, as before.")
+        parser.add_argument('--workers', type=int, default=None, help="Page extraction processes.")
+        parser.add_argument('--batch-size', type=int, default=64)
+        parser.add_argument('--embed-latency-ms', type=float, default=5.0, help="Stub latency per embedded chunk.")
+        parser.add_argument('--pdf', help="Use this PDF instead of generating one.")
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='flashlearn-bench-')
+        try:
+            pdf_path = options['pdf'] or make_synthetic_pdf(
+                os.path.join(workdir, 'synthetic.pdf'), pages=options['pages'], chapters=20
+            )
+            store = EmbeddingStore('bench', persist_directory=os.path.join(workdir, 'chroma'))
+            store.embeddings = SlowFakeEmbeddings(size=768, latency_per_text=options['embed_latency_ms'] / 1000)
+
+            pages_seen = set()
+
+            def progress(last_chunk, stats):
+                pages_seen.add(last_chunk.metadata['page'])
+
+            start = time.perf_counter()
+            with PeakRSS() as rss:
+                if options['mode'] == 'eager':
+                    documents = PDFPlumberLoader(pdf_path).load()
+                    chunks = RecursiveCharacterTextSplitter(
+                        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+                    ).split_documents(documents)
+                    total_pages = len(documents)
+                else:
+                    chunks = iter_document_chunks(pdf_path, workers=options['workers'])
+                    total_pages = None
+                stats = store.sync_vector_store(chunks, batch_size=options['batch_size'], progress=progress)
+            elapsed = time.perf_counter() - start
+
+            total_pages = total_pages or max(pages_seen) + 1
+            self.stdout.write(f"mode:       {options['mode']}")
+            self.stdout.write(f"pages:      {total_pages}")
+            self.stdout.write(f"chunks:     {stats['added']}")
+            self.stdout.write(f"elapsed:    {elapsed:.2f}s")
+            self.stdout.write(f"pages/s:    {total_pages / elapsed:.1f}")
+            self.stdout.write(f"chunks/s:   {stats['added'] / elapsed:.1f}")
+            self.stdout.write(f"peak RSS:   {rss.peak / (1024 * 1024):.1f} MB")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
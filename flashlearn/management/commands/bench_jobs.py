@@ -0,0 +1,76 @@
+import multiprocessing
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test.utils import override_settings
+
+from flashlearn.jobs import enqueue, worker_process_main
+from flashlearn.models import Job
+
+
+class Command(BaseCommand):
+    help = "Measure job queue throughput with N concurrent simulated users."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help="Concurrent simulated users.")
+        parser.add_argument('--jobs-per-user', type=int, default=5)
+        parser.add_argument('--workers', type=int, default=4, help="Worker processes draining the queue.")
+        parser.add_argument('--task-seconds', type=float, default=0.2, help="Simulated work per job.")
+        parser.add_argument('--poll-interval', type=float, default=0.05)
+
+    def handle(self, *args, **options):
+        # Only the worker processes should run jobs, not threads in this process
+        with override_settings(FLASHLEARN_IN_PROCESS_JOB_WORKERS=0):
+            self.run_benchmark(options)
+
+    def run_benchmark(self, options):
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(
+                target=worker_process_main,
+                args=(f"bench-worker-{i}", options['poll_interval'])
+            )
+            for i in range(options['workers'])
+        ]
+        for process in workers:
+            process.start()
+
+        job_ids = []
+        lock = threading.Lock()
+
+        def simulated_user():
+            # Enqueue a job, then poll it like the browser does before submitting the next
+            for _ in range(options['jobs_per_user']):
+                job = enqueue('sleep', seconds=options['task_seconds'])
+                with lock:
+                    job_ids.append(job.id)
+                while not Job.objects.get(id=job.id).is_finished:
+                    time.sleep(options['poll_interval'])
+            close_old_connections()
+
+        start = time.perf_counter()
+        users = [threading.Thread(target=simulated_user) for _ in range(options['users'])]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - start
+
+        for process in workers:
+            process.terminate()
+
+        jobs = Job.objects.filter(id__in=job_ids)
+        latencies = sorted((job.finished_at - job.created_at).total_seconds() for job in jobs)
+        queue_waits = [(job.started_at - job.created_at).total_seconds() for job in jobs]
+        failed = jobs.exclude(status='succeeded').count()
+        jobs.delete()
+
+        self.stdout.write(f"jobs:        {len(latencies)} ({failed} not succeeded)")
+        self.stdout.write(f"elapsed:     {elapsed:.2f}s")
+        self.stdout.write(f"throughput:  {len(latencies) / elapsed:.2f} jobs/s")
+        self.stdout.write(f"latency p50: {statistics.median(latencies):.3f}s")
+        self.stdout.write(f"latency p95: {latencies[int(0.95 * (len(latencies) - 1))]:.3f}s")
+        self.stdout.write(f"queue wait:  {statistics.mean(queue_waits):.3f}s mean")
@@ -0,0 +1,184 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from flashlearn.benchmarks.fixtures import make_synthetic_pdf, synthetic_page_lines
+from flashlearn.benchmarks.report import latency_summary, write_results, compare_results
+from flashlearn.benchmarks.stubs import HashingEmbeddings, StubOllamaServer, StubModelRegistry
+from flashlearn.utils.chatbot import Chatbot
+from flashlearn.utils.embedding_store import EmbeddingStore
+from flashlearn.utils.pdf_processor import (
+    extract_heading_text, extract_main_headings, file_sha256, iter_document_chunks
+)
+from flashlearn.utils.summarizer import summarize_text
+
+OPTION_NAMES = (
+    'pages', 'chapters', 'repeat', 'llm_latency_ms', 'llm_ms_per_prompt_token', 'llm_ms_per_output_token',
+    'embed_latency_ms', 't5_latency_ms', 'num_cards', 'chat_requests', 'concurrency', 'ollama_slots',
+    'ingest_workers',
+)
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every pipeline stage offline: a synthetic PDF, a stub Ollama server and stub "
+            "T5 models with configurable latency. Results can be written as JSON and compared.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=60)
+        parser.add_argument('--chapters', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs of the upload step.")
+        parser.add_argument('--llm-latency-ms', type=float, default=50.0, help="Stub LLM latency per call.")
+        parser.add_argument('--llm-ms-per-prompt-token', type=float, default=0.05,
+                            help="Stub LLM prefill time per prompt token.")
+        parser.add_argument('--llm-ms-per-output-token', type=float, default=0.5,
+                            help="Stub LLM decoding time per generated token.")
+        parser.add_argument('--embed-latency-ms', type=float, default=2.0, help="Stub latency per embedded text.")
+        parser.add_argument('--t5-latency-ms', type=float, default=5.0,
+                            help="Stub T5 latency per generated sequence and beam.")
+        parser.add_argument('--num-cards', type=int, default=10)
+        parser.add_argument('--chat-requests', type=int, default=40)
+        parser.add_argument('--concurrency', type=int, default=4, help="Simultaneous chat users.")
+        parser.add_argument('--ollama-slots', type=int, default=2,
+                            help="FLASHLEARN_OLLAMA_MAX_CONCURRENCY for the run.")
+        parser.add_argument('--ingest-workers', type=int, default=0, help="Page extraction processes.")
+        parser.add_argument('--json', help="Write the results to this file.")
+        parser.add_argument('--compare', help="Print the change against an earlier --json file.")
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='flashlearn-bench-')
+        server = StubOllamaServer(
+            latency_per_call=options['llm_latency_ms'] / 1000,
+            latency_per_prompt_token=options['llm_ms_per_prompt_token'] / 1000,
+            latency_per_output_token=options['llm_ms_per_output_token'] / 1000,
+        )
+        try:
+            with server, override_settings(OLLAMA_BASE_URL=server.url,
+                                           FLASHLEARN_OLLAMA_MAX_CONCURRENCY=options['ollama_slots']):
+                results = self._run(workdir, server, options)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self._print(results)
+        if options['json']:
+            write_results(options['json'], results, {name: options[name] for name in OPTION_NAMES})
+        if options['compare']:
+            with open(options['compare']) as f:
+                self._print_comparison(json.load(f)['results'], results)
+
+    def _run(self, workdir, server, options):
+        pdf_path = make_synthetic_pdf(os.path.join(workdir, 'synthetic.pdf'),
+                                      pages=options['pages'], chapters=options['chapters'])
+        results = {}
+        results['upload_to_topics'] = self._upload_to_topics(workdir, pdf_path, options)
+        results['topic_to_summary'], summaries = self._topic_to_summary(pdf_path, server)
+        results['summary_to_flashcards'] = self._summary_to_flashcards(summaries, options)
+        results['ingest'], store = self._ingest(workdir, pdf_path, options)
+        results['chat'] = self._chat(store, server, options)
+        return results
+
+    def _upload_to_topics(self, workdir, pdf_path, options):
+        """Hash the upload and read its outline, on fresh copies and then from the cache."""
+        cold, warm = [], []
+        for run in range(options['repeat']):
+            copy_path = shutil.copy(pdf_path, os.path.join(workdir, f"upload-{run}.pdf"))
+            start = time.perf_counter()
+            file_sha256(copy_path)
+            topics = extract_main_headings(copy_path)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            extract_main_headings(copy_path)
+            warm.append(time.perf_counter() - start)
+        return {'topics': len(topics), 'cold': latency_summary(cold), 'cached': latency_summary(warm)}
+
+    def _topic_to_summary(self, pdf_path, server):
+        headings = extract_main_headings(pdf_path)
+        latencies, summaries, llm_calls = [], [], 0
+        for i, (title, page) in enumerate(headings):
+            start = time.perf_counter()
+            # The same pages generate_summary_task reads for this topic
+            text = extract_heading_text(pdf_path, headings, i, page)
+            stats = {}
+            summaries.append(summarize_text(text, stats=stats))
+            latencies.append(time.perf_counter() - start)
+            llm_calls += stats['llm_calls']
+        return {'topics': len(headings), 'llm_calls': llm_calls, 'latency': latency_summary(latencies)}, summaries
+
+    def _summary_to_flashcards(self, summaries, options):
+        from flashlearn.utils.flashcard_generator import FlashcardGenerator
+
+        registry = StubModelRegistry(latency_per_sequence=options['t5_latency_ms'] / 1000)
+        generator = FlashcardGenerator(registry=registry, embeddings=HashingEmbeddings())
+        latencies, cards = [], 0
+        for summary in summaries:
+            start = time.perf_counter()
+            cards += len(generator.generate_flashcards(summary, options['num_cards']))
+            latencies.append(time.perf_counter() - start)
+        elapsed = sum(latencies)
+        return {
+            'cards': cards,
+            'model_calls': registry.model.calls,
+            'cards_per_second': cards / elapsed if elapsed else 0.0,
+            'latency': latency_summary(latencies),
+        }
+
+    def _ingest(self, workdir, pdf_path, options):
+        store = EmbeddingStore('bench_pipeline', persist_directory=os.path.join(workdir, 'chroma'))
+        store.embeddings = HashingEmbeddings(latency_per_text=options['embed_latency_ms'] / 1000)
+        start = time.perf_counter()
+        stats = store.sync_vector_store(iter_document_chunks(pdf_path, workers=options['ingest_workers']))
+        store.build_lexical_index()
+        elapsed = time.perf_counter() - start
+        store.embeddings.latency_per_text = 0.0
+        store.embeddings.latency_per_call = options['embed_latency_ms'] / 1000
+        return {
+            'pages': options['pages'],
+            'chunks': stats['added'],
+            'seconds': elapsed,
+            'pages_per_second': options['pages'] / elapsed,
+            'chunks_per_second': stats['added'] / elapsed,
+        }, store
+
+    def _chat(self, store, server, options):
+        chatbot = Chatbot(store.get_retriever(), base_url=server.url)
+        questions = []
+        for i in range(options['chat_requests']):
+            words = synthetic_page_lines(i, lines_per_page=1, seed=1)[0].rstrip('.').lower().split()
+            questions.append(f"How are {words[0]} and {words[1]} related?")
+
+        def ask(question):
+            start = time.perf_counter()
+            chatbot.get_response(question)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            latencies = list(pool.map(ask, questions))
+        elapsed = time.perf_counter() - start
+        return {
+            'concurrency': options['concurrency'],
+            'requests_per_second': len(questions) / elapsed,
+            'latency': latency_summary(latencies),
+        }
+
+    def _print(self, results):
+        for stage, metrics in results.items():
+            self.stdout.write(stage)
+            for name, value in metrics.items():
+                if isinstance(value, dict):
+                    value = "  ".join(f"{key}={number:.1f}" if isinstance(number, float) else f"{key}={number}"
+                                      for key, number in value.items())
+                elif isinstance(value, float):
+                    value = f"{value:.2f}"
+                self.stdout.write(f"  {name:<20}{value}")
+
+    def _print_comparison(self, old, new):
+        self.stdout.write(f"\n{'metric':<44}{'before':>12}{'after':>12}{'change':>9}")
+        for name, before, after, change in compare_results(old, new):
+            change_text = f"{change:+.0%}" if change is not None else "-"
+            self.stdout.write(f"{name:<44}{before:>12.2f}{after:>12.2f}{change_text:>9}")
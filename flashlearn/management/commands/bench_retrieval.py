@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from flashlearn.benchmarks.fixtures import make_glossary_corpus
+from flashlearn.benchmarks.report import percentile
+from flashlearn.benchmarks.stubs import HashingEmbeddings
+from flashlearn.utils.embedding_store import EmbeddingStore
+from flashlearn.utils.hybrid_retriever import HybridRetriever
+
+
+class Command(BaseCommand):
+    help = "Compare latency and recall of vector, keyword and hybrid retrieval on a fixture corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=300)
+        parser.add_argument('-k', type=int, default=3, help="Results per question.")
+        parser.add_argument('--embed-latency-ms', type=float, default=20.0,
+                            help="Stub latency of one query embedding.")
+        parser.add_argument('--slow-embed-latency-ms', type=float, default=1000.0,
+                            help="Query embedding latency for the 'embeddings slow' run.")
+        parser.add_argument('--dense-timeout', type=float, default=0.5)
+        parser.add_argument('--json', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='flashlearn-bench-')
+        try:
+            results = self._run(workdir, options)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f"{'strategy':<26}{'p50 ms':>9}{'p95 ms':>9}{'recall term':>13}{'recall loose':>14}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<26}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                f"{row['recall']['term']:>13.2f}{row['recall']['loose']:>14.2f}"
+            )
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def _run(self, workdir, options):
+        documents, queries = make_glossary_corpus(options['chunks'])
+        embeddings = HashingEmbeddings()
+        store = EmbeddingStore('bench_retrieval', persist_directory=os.path.join(workdir, 'chroma'))
+        store.embeddings = embeddings
+        store.sync_vector_store(documents)
+        lexical_index = store.build_lexical_index()
+        vector_store = store.get_vector_store()
+        k = options['k']
+
+        def hybrid():
+            return HybridRetriever(vector_store=vector_store, lexical_index=lexical_index, k=k,
+                                   dense_timeout=options['dense_timeout'])
+
+        strategies = {
+            'vector (mmr, previous)': lambda: vector_store.as_retriever(search_type="mmr", search_kwargs={"k": k}),
+            'vector': lambda: vector_store.as_retriever(search_kwargs={"k": k}),
+            'keyword (bm25)': lambda: _LexicalOnly(lexical_index, k),
+            'hybrid (rrf)': hybrid,
+            'hybrid, embeddings slow': hybrid,
+        }
+
+        results = {}
+        for name, make_retriever in strategies.items():
+            slow = name.endswith('slow')
+            embeddings.latency_per_call = (options['slow_embed_latency_ms'] if slow else options['embed_latency_ms']) / 1000
+            retriever = make_retriever()
+            latencies, hits = [], {'term': [], 'loose': []}
+            for text, relevant_id, kind in queries:
+                start = time.perf_counter()
+                found = retriever.invoke(text)
+                latencies.append(time.perf_counter() - start)
+                relevant_page = int(relevant_id.split('-')[1])
+                hits[kind].append(any(doc.metadata.get('page') == relevant_page for doc in found))
+            results[name] = {
+                'p50_ms': statistics.median(latencies) * 1000,
+                'p95_ms': percentile(latencies, 0.95) * 1000,
+                'recall': {kind: sum(values) / len(values) for kind, values in hits.items()},
+                'queries': len(queries),
+                'k': k,
+            }
+        return results
+
+
+class _LexicalOnly:
+    def __init__(self, index, k):
+        self.index = index
+        self.k = k
+
+    def invoke(self, query):
+        return self.index.get_documents(query, self.k)
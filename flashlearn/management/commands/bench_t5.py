@@ -0,0 +1,67 @@
+import gc
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from flashlearn.benchmarks.fixtures import synthetic_page_lines
+from flashlearn.benchmarks.report import write_results
+from flashlearn.utils.model_registry import ModelRegistry, process_rss_bytes
+
+
+class Command(BaseCommand):
+    help = ("Compare the T5 inference backends for flashcard generation on CPU: load time, "
+            "memory growth, cards/s and agreement with the PyTorch output. Downloads the models.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default='torch,int8,onnx')
+        parser.add_argument('--paragraphs', type=int, default=16, help="Paragraphs of summary text.")
+        parser.add_argument('--num-cards', type=int, default=8)
+        parser.add_argument('--threads', type=int, default=None, help="FLASHLEARN_T5_THREADS for the run.")
+        parser.add_argument('--json', help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        from flashlearn.utils.flashcard_generator import FlashcardGenerator
+
+        text = " ".join(" ".join(synthetic_page_lines(i, lines_per_page=3)) for i in range(options['paragraphs']))
+        results, reference = {}, None
+        for backend in options['backends'].split(','):
+            gc.collect()
+            rss_before = process_rss_bytes() or 0
+            registry = ModelRegistry()
+            with override_settings(FLASHLEARN_T5_THREADS=options['threads']):
+                start = time.perf_counter()
+                generator = FlashcardGenerator(registry=registry, backend=backend)
+                load_seconds = time.perf_counter() - start
+
+            # The first call warms up kernels and caches; time the second
+            generator.generate_flashcards(text, options['num_cards'])
+            start = time.perf_counter()
+            cards = generator.generate_flashcards(text, options['num_cards'])
+            elapsed = time.perf_counter() - start
+
+            questions = [question for question, _ in cards]
+            reference = reference if reference is not None else questions
+            matching = sum(a == b for a, b in zip(questions, reference))
+            results[backend] = {
+                'load_seconds': load_seconds,
+                'rss_growth_mb': ((process_rss_bytes() or 0) - rss_before) / (1024 * 1024),
+                'cards': len(cards),
+                'seconds': elapsed,
+                'cards_per_second': len(cards) / elapsed if elapsed else 0.0,
+                'questions_matching_first_backend': matching / max(len(reference), 1),
+            }
+            del generator, registry
+
+        self.stdout.write(f"{'backend':<10}{'load s':>9}{'RSS MB':>9}{'cards/s':>10}{'speed-up':>10}{'match':>8}")
+        baseline = next(iter(results.values()))['cards_per_second'] or 1.0
+        for backend, row in results.items():
+            self.stdout.write(
+                f"{backend:<10}{row['load_seconds']:>9.1f}{row['rss_growth_mb']:>9.0f}"
+                f"{row['cards_per_second']:>10.2f}{row['cards_per_second'] / baseline:>9.2f}x"
+                f"{row['questions_matching_first_backend']:>8.0%}"
+            )
+        if options['json']:
+            write_results(options['json'], results, {
+                key: options[key] for key in ('backends', 'paragraphs', 'num_cards', 'threads')
+            })
@@ -0,0 +1,62 @@
+import multiprocessing
+import multiprocessing.connection
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from flashlearn.jobs import worker_process_main
+
+
+class Command(BaseCommand):
+    help = "Run a pool of worker processes that drain the background job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker processes.")
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=getattr(settings, 'FLASHLEARN_JOB_POLL_INTERVAL', 1.0),
+            help="Seconds to wait between polls when the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        stop_event = context.Event()
+        processes = []
+        for i in range(options['workers']):
+            # Not daemonic: workers start their own process pools for PDF ingestion
+            process = context.Process(
+                target=worker_process_main,
+                args=(f"{socket.gethostname()}:worker-{i}", options['poll_interval'], stop_event)
+            )
+            process.start()
+            processes.append(process)
+        self.stdout.write(f"Started {len(processes)} job workers. Press Ctrl+C to stop.")
+
+        grace = getattr(settings, 'FLASHLEARN_JOB_SHUTDOWN_SECONDS', 300)
+        deadline = None
+
+        def stop(signum, frame):
+            # The first signal lets running jobs finish; a second one stops the workers at once
+            nonlocal deadline
+            if stop_event.is_set():
+                deadline = time.monotonic()
+                return
+            stop_event.set()
+            deadline = time.monotonic() + grace
+            self.stdout.write(f"Stopping after the current jobs (at most {grace:.0f}s)...")
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        while any(process.is_alive() for process in processes):
+            if deadline is not None and time.monotonic() >= deadline:
+                # Their jobs are requeued once the lease runs out
+                for process in processes:
+                    if process.is_alive():
+                        process.terminate()
+                break
+            multiprocessing.connection.wait([process.sentinel for process in processes], timeout=1.0)
+        for process in processes:
+            process.join()
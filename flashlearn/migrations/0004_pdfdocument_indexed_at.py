@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashlearn', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='indexed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
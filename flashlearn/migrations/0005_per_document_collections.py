@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:40
+
+from django.db import migrations
+
+
+def reset_processed(apps, schema_editor):
+    # Knowledge bases used to share one Chroma collection. They now live in a
+    # collection per document, so existing documents have to be re-indexed.
+    PDFDocument = apps.get_model('flashlearn', 'PDFDocument')
+    PDFDocument.objects.filter(processed=True).update(processed=False, indexed_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashlearn', '0004_pdfdocument_indexed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_processed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashlearn', '0006_pdfdocument_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='from_cache',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='generation_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='model_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='prompt_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
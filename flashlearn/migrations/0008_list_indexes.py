@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashlearn', '0007_summary_cache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'timestamp'], name='chatmessage_session_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcard',
+            index=models.Index(fields=['summary', 'id'], name='flashcard_summary_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pdfdocument',
+            index=models.Index(fields=['user', 'uploaded_at'], name='document_user_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='summary',
+            index=models.Index(fields=['document', 'created_at'], name='summary_document_created_idx'),
+        ),
+    ]
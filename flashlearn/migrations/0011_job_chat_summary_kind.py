@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashlearn', '0010_job_lease'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('summary', 'Summary'), ('flashcards', 'Flashcards'), ('knowledge_base', 'Knowledge Base'), ('chat_summary', 'Chat Summary'), ('sleep', 'Sleep (benchmark)')], max_length=20),
+        ),
+    ]
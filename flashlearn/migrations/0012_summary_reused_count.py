@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashlearn', '0011_job_chat_summary_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='reused_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -8,8 +8,15 @@ class PDFDocument(models.Model):
     file = models.FileField(upload_to='pdf_uploads/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
+    indexed_at = models.DateTimeField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='documents', null=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'uploaded_at'], name='document_user_uploaded_idx'),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -18,6 +25,19 @@ class Summary(models.Model):
     topic_title = models.CharField(max_length=255)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Summaries are reused for identical topic text, model and prompt version
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    model_name = models.CharField(max_length=100, blank=True)
+    prompt_version = models.PositiveIntegerField(default=0)
+    generation_seconds = models.FloatField(null=True, blank=True)
+    from_cache = models.BooleanField(default=False)
+    # Times this summary was served again for its own document and topic
+    reused_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['document', 'created_at'], name='summary_document_created_idx'),
+        ]
     
     def __str__(self):
         return f"Summary of {self.topic_title}"
@@ -28,12 +48,20 @@ class Flashcard(models.Model):
     answer = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['summary', 'id'], name='flashcard_summary_id_idx'),
+        ]
+    
     def __str__(self):
         return self.question
 
 class ChatSession(models.Model):
     document = models.ForeignKey(PDFDocument, on_delete=models.CASCADE, related_name='chat_sessions')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Running summary of the messages that have left the chatbot's history window
+    summary = models.TextField(blank=True, default='')
+    summarized_through = models.PositiveIntegerField(default=0)  # id of the last message in the summary
     
     def __str__(self):
         return f"Chat Session {self.id} for {self.document.title}"
@@ -49,5 +77,51 @@ class ChatMessage(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'timestamp'], name='chatmessage_session_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.role}: {self.content[:50]}..."
+
+
+class Job(models.Model):
+    KIND_CHOICES = [
+        ('summary', 'Summary'),
+        ('flashcards', 'Flashcards'),
+        ('knowledge_base', 'Knowledge Base'),
+        ('chat_summary', 'Chat Summary'),
+        ('sleep', 'Sleep (benchmark)'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs', null=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    progress = models.FloatField(default=0)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=64, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
     def __str__(self):
-        return f"{self.role}: {self.content[:50]}..."
\ No newline at end of file
+        return f"{self.get_kind_display()} job {self.id} ({self.status})"
@@ -0,0 +1,69 @@
+"""Keyset (cursor) pagination for the list views.
+
+Pages are selected with ``WHERE (field, id) < (value, id)`` on an indexed
+ordering rather than ``OFFSET``, so every page costs the same single query
+however deep the user scrolls, and rows added meanwhile do not shift pages.
+"""
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """One page of results and the cursor of the page after it."""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value, pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """Return (value, pk) from a cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        return field.to_python(value), int(pk)
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def keyset_paginate(queryset, field_name, cursor=None, page_size=20, descending=True):
+    """Return the page of ``queryset`` ordered by ``field_name`` (then id) after ``cursor``.
+
+    An invalid cursor yields the first page.
+    """
+    field = queryset.model._meta.get_field(field_name)
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(f'{prefix}{field_name}', f'{prefix}id')
+
+    position = decode_cursor(cursor, field) if cursor else None
+    if position is not None:
+        value, pk = position
+        after = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field_name}__{after}': value}) | Q(**{field_name: value, f'id__{after}': pk})
+        )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field_name), last.pk)
+    return KeysetPage(items, next_cursor)
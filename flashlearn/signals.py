@@ -0,0 +1,39 @@
+import os
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import PDFDocument
+
+
+@receiver(post_delete, sender=PDFDocument)
+def delete_document_vectors(sender, instance, **kwargs):
+    """Drop a document's parsed-PDF sidecar, vector collection, answer cache and chatbots when it is deleted.
+
+    Collections are shared by uploads of the same file, so the collection is
+    kept while another document with the same content hash still uses it.
+    """
+    from .utils.embedding_store import EmbeddingStore, document_collection_name
+    from .utils.answer_cache import AnswerCache
+    from .utils.chatbot import invalidate_chatbots
+    from .utils.pdf_processor import delete_parsed_pdf
+    invalidate_chatbots(instance.id)
+    if instance.file:
+        delete_parsed_pdf(os.path.join(settings.MEDIA_ROOT, instance.file.name))
+    if not instance.processed:
+        return
+    if instance.sha256 and PDFDocument.objects.filter(sha256=instance.sha256).exists():
+        return
+    EmbeddingStore(document_collection_name(instance)).delete_collection()
+    AnswerCache(document_collection_name(instance)).clear()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Use write-ahead logging on SQLite so readers are not blocked by writers."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL and avoids an fsync on every commit
+        cursor.execute("PRAGMA synchronous=NORMAL")
@@ -0,0 +1,231 @@
+"""Job handlers for the long-running document pipelines."""
+import os
+import time
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.utils import timezone
+from .jobs import task
+from .models import PDFDocument, Summary, Flashcard, ChatSession
+from .utils.pdf_processor import (
+    extract_main_headings, extract_heading_text, iter_document_chunks,
+    file_sha256, CHUNK_SIZE, CHUNK_OVERLAP
+)
+from .utils.summarizer import summarize_text, text_fingerprint, SUMMARY_MODEL, PROMPT_VERSION
+from .utils.flashcard_generator import FlashcardGenerator
+from .utils.embedding_store import EmbeddingStore, EMBEDDING_MODEL, document_collection_name
+from .utils.answer_cache import AnswerCache
+from .utils.chatbot import invalidate_chatbots
+from .utils.conversation import update_running_summary, history_window, summary_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def find_cached_summary(content_hash, document=None, topic_title=None,
+                        model_name=SUMMARY_MODEL, prompt_version=PROMPT_VERSION):
+    """Most recent summary generated for the same topic text, model and prompt.
+
+    The document's own summary of the topic is preferred over other copies.
+    """
+    summaries = (Summary.objects
+                 .filter(content_hash=content_hash, model_name=model_name, prompt_version=prompt_version)
+                 .exclude(content='')
+                 .order_by('-created_at', '-id'))
+    own = summaries.filter(document=document, topic_title=topic_title).first() if document else None
+    return own or summaries.first()
+
+
+def summary_cache_stats():
+    """Summaries served from the cache and the LLM time that saved.
+
+    Hits are copies made for other documents plus reuses of a document's
+    own summary.
+    """
+    copies = Summary.objects.filter(from_cache=True).aggregate(
+        hits=Count('id'), seconds=Sum('generation_seconds')
+    )
+    reuses = Summary.objects.filter(reused_count__gt=0).aggregate(
+        hits=Sum('reused_count'),
+        seconds=Sum(F('reused_count') * F('generation_seconds'), output_field=FloatField())
+    )
+    return {
+        'hits': copies['hits'] + (reuses['hits'] or 0),
+        'misses': Summary.objects.filter(from_cache=False).exclude(content_hash='').count(),
+        'seconds_saved': (copies['seconds'] or 0.0) + (reuses['seconds'] or 0.0),
+    }
+
+
+@task('summary')
+def generate_summary_task(job, document_id, topic_index, topic_title, start_page, regenerate=False):
+    """Summarize one topic of a document.
+
+    A summary of identical topic text made with the same model and prompt
+    version is reused unless ``regenerate`` is set.
+    """
+    document = PDFDocument.objects.get(id=document_id)
+    file_path = os.path.join(settings.MEDIA_ROOT, document.file.name)
+
+    job.progress(0.1, "Extracting topic text")
+    headings = extract_main_headings(file_path)
+    topic_text = extract_heading_text(file_path, headings, topic_index, start_page)
+    content_hash = text_fingerprint(topic_text)
+
+    cached = None if regenerate else find_cached_summary(content_hash, document, topic_title)
+    if cached is not None:
+        if cached.document_id == document.id and cached.topic_title == topic_title:
+            summary = cached
+            Summary.objects.filter(id=cached.id).update(reused_count=F('reused_count') + 1)
+        else:
+            summary = Summary.objects.create(
+                document=document,
+                topic_title=topic_title,
+                content=cached.content,
+                content_hash=content_hash,
+                model_name=cached.model_name,
+                prompt_version=cached.prompt_version,
+                generation_seconds=cached.generation_seconds,
+                from_cache=True
+            )
+        seconds_saved = cached.generation_seconds or 0.0
+        logger.info("Reused summary %s for topic %r of document %s, saving %.1fs",
+                    cached.id, topic_title, document.id, seconds_saved)
+        return {'summary_id': summary.id, 'cached': True, 'seconds_saved': seconds_saved}
+
+    job.progress(0.2, "Summarizing")
+    stats = {}
+    start = time.perf_counter()
+    summary_content = summarize_text(
+        topic_text,
+        max_chunk_tokens=getattr(settings, 'FLASHLEARN_SUMMARY_CHUNK_TOKENS', 1500),
+        concurrency=getattr(settings, 'FLASHLEARN_SUMMARY_CONCURRENCY', 2),
+        stats=stats
+    )
+    generation_seconds = time.perf_counter() - start
+    job.check_cancelled()
+    logger.info("Summarized topic %r of document %s: %s", topic_title, document.id, stats)
+
+    summary = Summary.objects.create(
+        document=document,
+        topic_title=topic_title,
+        content=summary_content,
+        content_hash=content_hash,
+        model_name=SUMMARY_MODEL,
+        prompt_version=PROMPT_VERSION,
+        generation_seconds=generation_seconds
+    )
+    return {'summary_id': summary.id, 'cached': False, 'seconds': generation_seconds}
+
+
+@task('flashcards')
+def generate_flashcards_task(job, summary_id, num_cards):
+    """Generate flashcards for a summary, replacing the existing ones."""
+    summary = Summary.objects.get(id=summary_id)
+
+    job.progress(0.05, "Loading models")
+    generator = FlashcardGenerator()
+    stats = {}
+    flashcard_data = generator.generate_flashcards(
+        summary.content,
+        num_cards,
+        progress=lambda cards, total: job.progress(0.1 + 0.9 * cards / total, f"{cards} of {total} flashcards"),
+        stats=stats
+    )
+    logger.info("Generated flashcards for summary %s: %s", summary.id, stats)
+
+    # Swap old cards for new in one transaction, so a failed run keeps the old set
+    with transaction.atomic():
+        Flashcard.objects.filter(summary=summary).delete()
+        Flashcard.objects.bulk_create([
+            Flashcard(summary=summary, question=question, answer=answer)
+            for question, answer in flashcard_data
+        ])
+    return {'summary_id': summary.id, 'count': len(flashcard_data)}
+
+
+def _index_signature(sha256):
+    """Identifies an index built from one file with the current chunking and model."""
+    return f"{sha256}:{EMBEDDING_MODEL}:{CHUNK_SIZE}:{CHUNK_OVERLAP}"
+
+
+@task('knowledge_base')
+def create_knowledge_base_task(job, document_id):
+    """Split, embed and index a document for the chatbot.
+
+    Identical PDFs share a collection, so a file that is already indexed is
+    not parsed or embedded again; otherwise only chunks missing from the
+    collection are embedded.
+    """
+    document = PDFDocument.objects.get(id=document_id)
+    file_path = os.path.join(settings.MEDIA_ROOT, document.file.name)
+
+    if not document.sha256:
+        document.sha256 = file_sha256(file_path)
+        document.save(update_fields=['sha256'])
+
+    embedding_store = EmbeddingStore(document_collection_name(document))
+    signature = _index_signature(document.sha256)
+
+    def report(last_chunk, stats):
+        page, total_pages = last_chunk.metadata['page'] + 1, last_chunk.metadata['total_pages']
+        job.progress(0.05 + 0.9 * page / total_pages, f"Indexed page {page} of {total_pages}")
+
+    if embedding_store.is_indexed(signature):
+        stats = {'reused': True}
+    else:
+        # Pages are extracted, split, embedded and stored as a stream
+        job.progress(0.05, "Reading document")
+        chunks = iter_document_chunks(file_path, workers=getattr(settings, 'FLASHLEARN_INGEST_WORKERS', None))
+        stats = embedding_store.sync_vector_store(
+            chunks,
+            signature=signature,
+            batch_size=getattr(settings, 'FLASHLEARN_INGEST_BATCH_SIZE', 64),
+            progress=report
+        )
+        stats['reused'] = False
+        if stats['added'] or stats['removed']:
+            # Earlier answers may rest on chunks that are gone
+            AnswerCache(embedding_store.collection_name).clear()
+        logger.info("Indexed document %s: %s, embedding cache %s",
+                    document.id, stats, getattr(embedding_store.embeddings, 'stats', None))
+
+    # Keyword index for hybrid retrieval, built from the stored chunks
+    job.progress(0.97, "Building keyword index")
+    embedding_store.build_lexical_index(signature)
+
+    document.processed = True
+    document.indexed_at = timezone.now()
+    document.save()
+    invalidate_chatbots(document.id)
+    return {'document_id': document.id, **stats}
+
+
+@task('chat_summary')
+def update_chat_summary_task(job, session_id):
+    """Fold the messages that have left the chat history window into the session's summary."""
+    session = ChatSession.objects.get(id=session_id)
+    recent_ids = session.messages.order_by('-id').values_list('id', flat=True)[:history_window()]
+    older = list(
+        session.messages.filter(id__gt=session.summarized_through)
+        .exclude(id__in=list(recent_ids))
+        .order_by('id')
+    )
+    if not older:
+        return {'session_id': session.id, 'summarized': 0}
+
+    summary = update_running_summary(
+        session.summary,
+        [(message.role, message.content) for message in older],
+        max_tokens=summary_tokens(),
+        base_url=settings.OLLAMA_BASE_URL
+    )
+    ChatSession.objects.filter(id=session.id).update(summary=summary, summarized_through=older[-1].id)
+    return {'session_id': session.id, 'summarized': len(older)}
+
+
+@task('sleep')
+def sleep_task(job, seconds=0.1):
+    """Do nothing for a while; used by the ``bench_jobs`` command."""
+    time.sleep(seconds)
+    job.progress(1.0)
+    return {'slept': seconds}
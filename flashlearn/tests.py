@@ -1,3 +1,1622 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import ollama
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.retrievers import BaseRetriever
+from langchain_ollama import OllamaEmbeddings
+
+from . import jobs
+from .benchmarks.fixtures import make_synthetic_pdf, make_glossary_corpus
+from .benchmarks.stubs import HashingEmbeddings, StubEncoderOutput, StubHiddenState, StubT5Model, StubT5Tokenizer
+from .models import Job, PDFDocument, ChatMessage, ChatSession, Flashcard, Summary
+from .tasks import summary_cache_stats
+from .views import _save_chat_turn, _conversation_memory, _schedule_chat_summary
+from .utils.answer_cache import AnswerCache, answer_cache_stats
+from .utils.cache import BoundedCache
+from .utils.chatbot import Chatbot, ThinkFilter, prompt_stats
+from .utils.context_builder import ContextBuilder
+from .utils.conversation import ConversationMemory, needs_rewrite
+from .utils import telemetry
+from .utils.embedding_cache import EmbeddingCache, CachedEmbeddings, embedding_cache_stats
+from .utils.embedding_store import EmbeddingStore, document_collection_name
+from .utils import flashcard_generator
+from .utils.flashcard_generator import FlashcardGenerator, split_paragraphs
+from .utils.model_registry import ModelRegistry
+from .utils.paragraph_selection import NearDuplicateFilter, rank_paragraphs
+from .utils import pdf_processor
+from .utils.pdf_processor import (
+    iter_document_chunks, extract_heading_text, extract_main_headings, extract_topic_text
+)
+from .utils.ollama_client import (
+    OllamaClient, PriorityGate, get_ollama_client, use_priority, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+)
+from .utils.bm25_index import BM25Index, tokenize
+from .utils.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from .utils.reranker import CrossEncoderReranker, RerankingRetriever
+from .utils.summarizer import summarize_text, split_into_chunks, estimate_tokens
+
+
+class FakeOllamaServer:
+    """Minimal local stand-in for the Ollama HTTP API.
+
+    ``/api/chat`` streams ``reply`` back in small NDJSON chunks, so tests
+    exercise the same client code as a real server without any model.
+    ``/api/embed`` returns a constant vector per input. The first
+    ``fail_first`` requests are answered with 503, like a busy server.
+    """
+
+    def __init__(self, reply="<think>pondering</think>\n\nPlants make food from light.", chunk_size=4, fail_first=0):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.fail_first = fail_first
+        self.requests = []
+
+    def __enter__(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                server.requests.append((self.path, body))
+                if len(server.requests) <= server.fail_first:
+                    self.send_error(503, "server busy")
+                elif self.path == '/api/chat':
+                    self._chat(body)
+                elif self.path == '/api/embed':
+                    self._embed(body)
+                else:
+                    self.send_error(404)
+
+            def _embed(self, body):
+                inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                payload = json.dumps({"model": body["model"], "embeddings": [[0.5, 0.5] for _ in inputs]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _chat(self, body):
+                message = {"model": body["model"], "created_at": "2025-01-01T00:00:00Z"}
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                if body.get("stream", True):
+                    text = server.reply
+                    for i in range(0, len(text), server.chunk_size):
+                        chunk = dict(message, message={"role": "assistant", "content": text[i:i + server.chunk_size]}, done=False)
+                        self.wfile.write((json.dumps(chunk) + "\n").encode())
+                        self.wfile.flush()
+                    text = ""
+                else:
+                    text = server.reply
+                final = dict(
+                    message, message={"role": "assistant", "content": text}, done=True, done_reason="stop",
+                    total_duration=1, load_duration=1, prompt_eval_count=10, prompt_eval_duration=1,
+                    eval_count=10, eval_duration=1
+                )
+                self.wfile.write((json.dumps(final) + "\n").encode())
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content="Photosynthesis turns light into chemical energy.")]
+
+
+class FakeTokens:
+    def __init__(self, texts):
+        self.input_ids = texts
+        self.attention_mask = None
+
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    def __call__(self, texts, **kwargs):
+        return FakeTokens([texts] if isinstance(texts, str) else list(texts))
+
+    def batch_decode(self, outputs, skip_special_tokens=True):
+        return list(outputs)
+
+
+class FakeQGModel:
+    def generate(self, input_ids, num_return_sequences=1, **kwargs):
+        outputs = []
+        for text in input_ids:
+            word = text.split()[2]
+            outputs += [f"What is {word} about?", f"{word}"][:num_return_sequences]
+        return outputs
+
+
+class FakeQAModel:
+    def generate(self, input_ids, **kwargs):
+        # Reject every third topic so answer filtering is exercised
+        answers = []
+        for text in input_ids:
+            topic = text.split()[3]
+            answers.append("short" if int(topic[5:]) % 3 == 2 else f"Answer to {topic}")
+        return answers
+
+
+class EncoderFakeQGModel:
+    """Greedy questions for odd topics are malformed; beam search fixes them."""
+
+    def __init__(self):
+        self.encoded = []
+        self.decoded = []
+
+    def get_encoder(self):
+        def encode(input_ids, attention_mask=None):
+            self.encoded.append(list(input_ids))
+            return StubEncoderOutput(StubHiddenState(input_ids))
+        return encode
+
+    def generate(self, encoder_outputs, num_beams=1, num_return_sequences=1, **kwargs):
+        texts = encoder_outputs.last_hidden_state.texts
+        self.decoded.append((len(texts), num_beams))
+        outputs = []
+        for text in texts:
+            word = text.split()[2]
+            if num_beams == 1 and int(word[5:]) % 2:
+                outputs.append(word)
+            else:
+                outputs += [f"What is {word} about?", f"Why does {word} matter?"][:num_return_sequences]
+        return outputs
+
+
+def make_generator(batch_size, decoding='beam'):
+    generator = FlashcardGenerator.__new__(FlashcardGenerator)
+    generator.device = "cpu"
+    generator.batch_size = batch_size
+    generator.decoding = decoding
+    generator.embeddings = None
+    generator.qg_tokenizer = generator.qa_tokenizer = FakeTokenizer()
+    generator.qg_model = FakeQGModel()
+    generator.qa_model = FakeQAModel()
+    return generator
+
+
+class FakeTensor:
+    def __init__(self, size):
+        self.size = size
+
+    def numel(self):
+        return self.size
+
+    def element_size(self):
+        return 1
+
+
+class FakeModel:
+    """Reports ``megabytes`` of parameters to the registry's size estimate."""
+
+    def __init__(self, megabytes):
+        self.megabytes = megabytes
+
+    def parameters(self):
+        return [FakeTensor(self.megabytes * 1024 * 1024)]
+
+    def buffers(self):
+        return []
+
+
+def isolate_embedding_cache(test, directory):
+    """Keep the embedding cache of ``test`` in ``directory`` instead of the project's cache file."""
+    override = override_settings(FLASHLEARN_EMBEDDING_CACHE_PATH=os.path.join(directory, "embeddings.sqlite3"))
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+class ModelRegistryTests(TestCase):
+    def test_least_recently_used_model_is_evicted_over_budget(self):
+        registry = ModelRegistry(memory_budget_mb=3)
+        registry.get('a', lambda: FakeModel(1))
+        registry.get('b', lambda: FakeModel(1))
+        registry.get('a', lambda: self.fail("'a' loaded twice"))
+        registry.get('c', lambda: FakeModel(2))
+
+        self.assertIn('a', registry)
+        self.assertNotIn('b', registry)
+        self.assertIn('c', registry)
+        self.assertEqual(registry.resident_bytes(), 3 * 1024 * 1024)
+        metrics = registry.metrics()
+        self.assertEqual((metrics['hits'], metrics['misses'], metrics['evictions']), (1, 3, 1))
+        self.assertEqual(metrics['models']["c"]['size_bytes'], 2 * 1024 * 1024)
+        self.assertIsNotNone(metrics['models']["c"]['load_seconds'])
+
+    def test_a_model_larger_than_the_budget_is_still_kept(self):
+        registry = ModelRegistry(memory_budget_mb=1)
+        registry.get('small', lambda: FakeModel(1))
+        model = registry.get('large', lambda: FakeModel(4))
+        self.assertIs(registry.get('large', lambda: FakeModel(4)), model)
+        self.assertNotIn('small', registry)
+
+    def test_concurrent_gets_load_once(self):
+        registry = ModelRegistry()
+        loads = []
+        start = threading.Barrier(8)
+
+        def loader():
+            loads.append(1)
+            time.sleep(0.05)
+            return FakeModel(1)
+
+        def get():
+            start.wait()
+            return registry.get('shared', loader)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            models = list(pool.map(lambda _: get(), range(8)))
+
+        self.assertEqual(len(loads), 1)
+        self.assertTrue(all(model is models[0] for model in models))
+        self.assertEqual((registry.hits, registry.misses), (7, 1))
+
+    def test_evict_and_clear_are_counted(self):
+        registry = ModelRegistry()
+        registry.get('a', lambda: FakeModel(1))
+        registry.get('b', lambda: FakeModel(1))
+        registry.evict('a')
+        registry.evict('missing')
+        registry.clear()
+        self.assertEqual(registry.resident_bytes(), 0)
+        self.assertEqual(registry.evictions, 2)
+
+
+class RecordingRegistry:
+    def __init__(self):
+        self.keys = []
+
+    def get(self, key, loader):
+        self.keys.append(key)
+        return FakeTokenizer(), FakeQGModel()
+
+
+class FlashcardGeneratorTests(TestCase):
+    text = " ".join(
+        f"Topic{i} " + "word " * 30 + "ends here." for i in range(12)
+    )
+
+    def test_split_paragraphs(self):
+        paragraphs = split_paragraphs(self.text)
+        self.assertEqual(len(paragraphs), 12)
+        self.assertTrue(paragraphs[3].startswith("Topic3"))
+
+    def test_batched_matches_sequential(self):
+        sequential = make_generator(1).generate_flashcards(self.text, num_cards=6)
+        for batch_size in (2, 5, 16):
+            batched = make_generator(batch_size).generate_flashcards(self.text, num_cards=6)
+            self.assertEqual(batched, sequential)
+        self.assertEqual(len(sequential), 6)
+
+    def test_batches_do_not_depend_on_earlier_calls(self):
+        def batches(text):
+            generator = make_generator(8)
+            calls = []
+            original = generator._generate_questions
+            generator._generate_questions = lambda batch: calls.append(batch) or original(batch)
+            generator.generate_flashcards(text, num_cards=2)
+            return calls
+
+        first = batches(self.text)
+        # Sized by the acceptance prior, not by the batch size
+        self.assertEqual(first[0], split_paragraphs(self.text)[:5])
+        # A summary whose paragraphs yield no cards must not change how the next one is batched
+        barren = " ".join(f"Topic{3 * i + 2} " + "word " * 30 + "ends here." for i in range(12))
+        self.assertEqual(batches(barren)[0], split_paragraphs(barren)[:5])
+        self.assertEqual(batches(self.text), first)
+
+    def test_stops_at_num_cards(self):
+        generator = make_generator(4)
+        calls = []
+        original = generator._generate_questions
+        generator._generate_questions = lambda batch: calls.append(batch) or original(batch)
+        generator.generate_flashcards(self.text, num_cards=2)
+        self.assertEqual(len(calls), 1)
+
+    def test_backend_is_part_of_the_model_key(self):
+        registry = RecordingRegistry()
+        FlashcardGenerator(registry=registry, backend='int8')
+        self.assertEqual([key[-1] for key in registry.keys], ['int8', 'int8'])
+        with override_settings(FLASHLEARN_T5_BACKEND='onnx'):
+            FlashcardGenerator(registry=registry)
+        self.assertEqual(registry.keys[-1], ("t5", "valhalla/t5-small-qa-qg-hl", "cpu", "onnx"))
+        with self.assertRaises(ValueError):
+            FlashcardGenerator(registry=registry, backend='fp8')
+        with self.assertRaises(ValueError):
+            FlashcardGenerator(registry=registry, decoding='sampling')
+
+    def test_early_exit_retries_rejected_questions_from_the_encoder_output(self):
+        generator = make_generator(4, decoding='early_exit')
+        generator.qg_model = EncoderFakeQGModel()
+        cards = generator.generate_flashcards(self.text, num_cards=3)
+
+        self.assertEqual(len(generator.qg_model.encoded), 1)
+        self.assertEqual(len(generator.qg_model.encoded[0]), 4)
+        # A greedy pass over the batch, then a 2-beam pass over Topic1 and Topic3 only
+        self.assertEqual(generator.qg_model.decoded, [(4, 1), (2, 2)])
+        self.assertEqual([question for question, _ in cards],
+                         ["What is Topic0 about?", "What is Topic1 about?", "Why does Topic1 matter?"])
+
+    def test_micro_batches_follow_the_acceptance_rate(self):
+        with mock.patch.object(flashcard_generator, 'ACCEPTANCE_PRIOR', (100, 200)):
+            stats = {}
+            cards = make_generator(8).generate_flashcards(self.text, num_cards=2, stats=stats)
+        self.assertEqual(len(cards), 2)
+        self.assertEqual(stats['paragraphs'], 2)
+        self.assertEqual((stats['questions'], stats['valid_questions']), (4, 2))
+        self.assertEqual(stats['acceptance_rate'], 1.0)
+        self.assertGreater(stats['cards_per_second'], 0)
+
+        with mock.patch.object(flashcard_generator, 'ACCEPTANCE_PRIOR', (100, 1)):
+            stats = {}
+            make_generator(8).generate_flashcards(self.text, num_cards=2, stats=stats)
+        self.assertEqual(stats['paragraphs'], 8)
+
+    def test_decoding_benchmark_reports_each_profile(self):
+        out = io.StringIO()
+        call_command('bench_flashcards', profiles='greedy,early_exit', summaries=2, paragraphs=4, num_cards=3,
+                     t5_latency_ms=0, encode_latency_ms=0, stdout=out)
+        self.assertIn("early_exit", out.getvalue())
+        self.assertIn("greedy", out.getvalue())
+
+
+class ParagraphSelectionTests(TestCase):
+    topics = ["photosynthesis light chlorophyll", "mitosis chromosome spindle", "enzyme substrate catalysis",
+              "osmosis membrane water", "respiration glucose mitochondria"]
+
+    def paragraph(self, topic, filler="cells"):
+        return f"{topic.split()[0].capitalize()} is about {topic}. " + f"{topic} {filler} " * 8 + "That is all."
+
+    def test_rank_paragraphs_leaves_out_near_duplicates(self):
+        embeddings = HashingEmbeddings()
+        paragraphs = [self.paragraph(topic) for topic in self.topics]
+        paragraphs.insert(2, paragraphs[0])
+        ranking = rank_paragraphs(embeddings.embed_documents(paragraphs))
+        self.assertEqual(sorted(ranking), [0, 1, 3, 4, 5])
+
+    def test_near_duplicate_filter_remembers_added_vectors(self):
+        embeddings = HashingEmbeddings()
+        duplicates = NearDuplicateFilter()
+        first = embeddings.embed_documents(["What is osmosis?", "What does an enzyme do?"])
+        self.assertEqual(duplicates.keep(first), [True, True])
+        self.assertTrue(duplicates.add(first[0]))
+        self.assertFalse(duplicates.add(first[0]))
+        second = embeddings.embed_documents(["What is osmosis?", "Where does mitosis happen?"])
+        self.assertEqual(duplicates.keep(second), [False, True])
+
+    def test_rejected_question_does_not_block_its_paraphrases(self):
+        text = " ".join(self.paragraph(topic) for topic in self.topics)
+        paragraphs = split_paragraphs(text)
+        for batch_size in (1, 8):
+            generator = make_generator(batch_size)
+            generator.embeddings = HashingEmbeddings()
+            order = generator._select_paragraphs(paragraphs)
+            # Every paragraph yields the same question; the first one's answer is rejected
+            generator._generate_questions = lambda batch: [["What is this paragraph about?"] for _ in batch]
+            generator._answer_questions = lambda candidates: [
+                "bad" if paragraph == paragraphs[order[0]] else f"Paragraph {paragraphs.index(paragraph)}"
+                for _, paragraph in candidates
+            ]
+            stats = {}
+            cards = generator.generate_flashcards(text, num_cards=2, stats=stats)
+            self.assertEqual(cards, [("What is this paragraph about?", f"Paragraph {order[1]}")])
+            self.assertGreater(stats['duplicate_questions'], 0)
+
+    def test_generator_skips_repeated_paragraphs_and_questions(self):
+        text = " ".join(f"Topic{i} " + "word " * 30 + "ends here." for i in range(6))
+        generator = make_generator(8)
+        generator.embeddings = HashingEmbeddings()
+        asked = []
+        original = generator._generate_questions
+        generator._generate_questions = lambda batch: asked.extend(batch) or original(batch)
+        stats = {}
+        cards = generator.generate_flashcards(text, num_cards=6, stats=stats)
+
+        # The paragraphs differ in one word out of 33, so only one is worth generating from
+        self.assertEqual(stats['selected_paragraphs'], 1)
+        self.assertEqual(len(asked), 1)
+        self.assertEqual(len(cards), 1)
+
+    def test_cards_come_back_in_document_order(self):
+        # The closing overview is the most central paragraph, so it is generated from first
+        overview = "In short, " + " ".join(self.topics) + " all matter in biology."
+        text = " ".join(self.paragraph(topic) for topic in self.topics) + " " + overview
+        generator = make_generator(8)
+        generator.embeddings = HashingEmbeddings()
+        generator.qg_model = StubT5Model()
+        generator.qa_model = StubT5Model()
+        generator.qg_tokenizer = generator.qa_tokenizer = StubT5Tokenizer()
+        paragraphs = split_paragraphs(text)
+        self.assertEqual(generator._select_paragraphs(paragraphs)[0], len(paragraphs) - 1)
+        generator._answer_questions = lambda candidates: [f"Paragraph {paragraphs.index(paragraph)}"
+                                                          for _, paragraph in candidates]
+        cards = generator.generate_flashcards(text, num_cards=20)
+        positions = [int(answer.split()[1]) for _, answer in cards]
+        self.assertEqual(positions, sorted(positions))
+        self.assertGreater(len(set(positions)), 1)
+
+
+@unittest.skipUnless(os.environ.get('FLASHLEARN_MODEL_TESTS'), "downloads the T5 models")
+class T5BackendParityTests(TestCase):
+    text = (
+        "Photosynthesis is the process by which green plants use sunlight to make glucose from carbon dioxide "
+        "and water. It takes place in the chloroplasts, which contain the pigment chlorophyll. Oxygen is "
+        "released as a by-product. The light reactions capture energy, and the Calvin cycle uses it to fix "
+        "carbon into sugars that the plant uses for growth and respiration."
+    )
+
+    def cards(self, backend):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        with override_settings(FLASHLEARN_T5_ARTIFACT_DIR=workdir):
+            generator = FlashcardGenerator(registry=ModelRegistry(), backend=backend)
+        return generator.generate_flashcards(self.text, num_cards=4)
+
+    def test_quantized_and_onnx_backends_match_pytorch(self):
+        reference = self.cards('torch')
+        for backend, min_agreement in (('onnx', 0.75), ('int8', 0.5)):
+            with self.subTest(backend=backend):
+                cards = self.cards(backend)
+                agreement = sum(a == b for a, b in zip(cards, reference)) / len(reference)
+                self.assertGreaterEqual(agreement, min_agreement)
+
+
+@jobs.task('test_echo')
+def echo_task(job, value):
+    job.progress(0.5, "halfway")
+    return {'value': value}
+
+
+@jobs.task('test_fail')
+def failing_task(job):
+    raise ValueError("broken")
+
+
+@override_settings(FLASHLEARN_IN_PROCESS_JOB_WORKERS=0)
+class JobQueueTests(TestCase):
+    def test_worker_runs_queued_jobs_in_order(self):
+        first = jobs.enqueue('test_echo', value=1)
+        failing = jobs.enqueue('test_fail')
+        cancelled = jobs.enqueue('test_echo', value=2)
+        self.assertTrue(jobs.cancel(cancelled))
+
+        jobs.run_worker('test-worker', max_idle=0)
+
+        first.refresh_from_db()
+        failing.refresh_from_db()
+        cancelled.refresh_from_db()
+        self.assertEqual(first.status, 'succeeded')
+        self.assertEqual(first.result, {'value': 1})
+        self.assertEqual(first.message, "halfway")
+        self.assertEqual(failing.status, 'failed')
+        self.assertEqual(failing.error, "broken")
+        self.assertEqual(cancelled.status, 'cancelled')
+        self.assertIsNone(jobs.claim_next_job('test-worker'))
+
+    def test_running_job_stops_at_next_checkpoint(self):
+        job = jobs.enqueue('test_echo', value=1)
+        claimed = jobs.claim_next_job('test-worker')
+        self.assertEqual(claimed.id, job.id)
+        self.assertTrue(jobs.cancel(job))
+
+        jobs.run_job(claimed)
+        self.assertEqual(claimed.status, 'cancelled')
+
+
+    def test_every_task_kind_is_a_declared_choice(self):
+        jobs.get_handler('summary')
+        declared = {kind for kind, _ in Job.KIND_CHOICES}
+        self.assertLessEqual({kind for kind in jobs.HANDLERS if not kind.startswith('test_')}, declared)
+        self.assertEqual(Job._meta.get_field('kind').clean('chat_summary', None), 'chat_summary')
+
+    def make_stale(self, job):
+        Job.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(minutes=10))
+
+    @override_settings(FLASHLEARN_JOB_MAX_ATTEMPTS=2)
+    def test_jobs_of_dead_workers_are_requeued_then_failed(self):
+        job = jobs.enqueue('test_echo', value=1)
+        jobs.claim_next_job('dead-worker')
+        self.assertEqual(jobs.recover_stale_jobs(), 0)
+
+        self.make_stale(job)
+        self.assertEqual(jobs.recover_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), ('queued', '', 1))
+
+        jobs.claim_next_job('another-dead-worker')
+        self.make_stale(job)
+        jobs.recover_stale_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', jobs.STALE_JOB_ERROR))
+
+    def test_cancelling_a_job_of_a_dead_worker_finishes_it(self):
+        job = jobs.enqueue('test_echo', value=1)
+        jobs.claim_next_job('dead-worker')
+        self.make_stale(job)
+        self.assertTrue(jobs.cancel(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'cancelled')
+        self.assertTrue(job.is_finished)
+
+    def test_progress_renews_the_lease(self):
+        job = jobs.enqueue('test_echo', value=1)
+        claimed = jobs.claim_next_job('test-worker')
+        self.make_stale(job)
+        jobs.JobContext(claimed).progress(0.5, "working")
+        self.assertEqual(jobs.recover_stale_jobs(), 0)
+
+    def test_outcome_of_a_superseded_attempt_is_dropped(self):
+        job = jobs.enqueue('test_echo', value=1)
+        slow = jobs.claim_next_job('slow-worker')
+        self.make_stale(job)
+        jobs.recover_stale_jobs()
+        current = jobs.claim_next_job('new-worker')
+
+        jobs.run_job(slow)
+        self.assertEqual((slow.status, slow.worker), ('running', 'new-worker'))
+        jobs.run_job(current)
+        self.assertEqual(current.status, 'succeeded')
+
+
+class ChatStreamingTests(TestCase):
+    def test_think_filter_handles_split_tags(self):
+        think_filter = ThinkFilter()
+        chunks = ["<th", "ink>secret", " plan</thi", "nk>\n\nThe ", "answer <b>"]
+        output = "".join(think_filter.feed(chunk) for chunk in chunks) + think_filter.flush()
+        self.assertEqual(output, "The answer <b>")
+
+    def test_stream_response_from_ollama_stub(self):
+        with FakeOllamaServer() as server:
+            chatbot = Chatbot(FakeRetriever(), base_url=server.url)
+
+            async def collect():
+                return [chunk async for chunk in chatbot.astream_response("What is photosynthesis?")]
+
+            chunks = asyncio.run(collect())
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), "Plants make food from light.")
+        path, body = server.requests[0]
+        self.assertEqual(path, '/api/chat')
+        self.assertIn("Photosynthesis turns light", body["messages"][-1]["content"])
+
+    def test_get_response_reports_prompt_usage(self):
+        before = prompt_stats()
+        with FakeOllamaServer() as server:
+            chatbot = Chatbot(FakeRetriever(), base_url=server.url)
+            self.assertEqual(chatbot.get_response("What is photosynthesis?"), "Plants make food from light.")
+        after = prompt_stats()
+        self.assertEqual(after['requests'], before['requests'] + 1)
+        self.assertEqual(after['prompt_tokens'], before['prompt_tokens'] + 10)
+
+
+@override_settings(ROOT_URLCONF='flashlearn.urls')
+class ChatStreamViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='secret')
+        self.document = PDFDocument.objects.create(title="Biology", file='pdf_uploads/bio.pdf', user=self.user)
+
+    async def test_streams_tokens_and_saves_messages_at_the_end(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        self.async_client.cookies = self.client.cookies
+        with FakeOllamaServer() as server:
+            chatbot = Chatbot(FakeRetriever(), base_url=server.url)
+            with mock.patch('flashlearn.views._get_chatbot', return_value=chatbot):
+                response = await self.async_client.post(
+                    f'/document/{self.document.id}/chat/stream/',
+                    {'message': "What is photosynthesis?"}
+                )
+                body = "".join([chunk.decode() async for chunk in response.streaming_content])
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        tokens = [
+            json.loads(line[len("data: "):])['token']
+            for line in body.splitlines()
+            if line.startswith("data: ") and '"token"' in line
+        ]
+        self.assertEqual("".join(tokens), "Plants make food from light.")
+        self.assertIn("event: done", body)
+
+        messages = await sync_to_async(list)(
+            ChatMessage.objects.filter(session__document=self.document).order_by('id').values_list('role', 'content')
+        )
+        self.assertEqual(messages, [
+            ('user', "What is photosynthesis?"),
+            ('assistant', "Plants make food from light."),
+        ])
+
+
+class BoundedCacheTests(TestCase):
+    def test_lru_eviction_and_invalidation(self):
+        cache = BoundedCache(max_size=2)
+        built = []
+        for key in [(1, 'a'), (2, 'a'), (1, 'a'), (3, 'a')]:
+            cache.get_or_create(key, lambda: built.append(key) or key)
+        self.assertEqual(built, [(1, 'a'), (2, 'a'), (3, 'a')])
+        self.assertIsNone(cache.get((2, 'a')))
+
+        cache.invalidate(lambda key: key[0] == 1)
+        self.assertIsNone(cache.get((1, 'a')))
+        self.assertEqual(cache.get((3, 'a')), (3, 'a'))
+
+    def test_idle_entries_expire_and_none_is_not_cached(self):
+        cache = BoundedCache(idle_seconds=0)
+        cache.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
+        self.assertIsNone(cache.get_or_create('missing', lambda: None))
+        self.assertEqual(len(cache), 0)
+
+
+class PerDocumentCollectionTests(TestCase):
+    def setUp(self):
+        self.persist_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.persist_directory, ignore_errors=True)
+        isolate_embedding_cache(self, self.persist_directory)
+        self.user = User.objects.create_user('student')
+        self.embeddings = mock.Mock(wraps=DeterministicFakeEmbedding(size=16))
+
+    def make_document(self, sha256=""):
+        return PDFDocument.objects.create(title="Book", file='pdf_uploads/book.pdf', user=self.user, sha256=sha256)
+
+    def make_store(self, document):
+        store = EmbeddingStore(document_collection_name(document), persist_directory=self.persist_directory)
+        store.embeddings = self.embeddings
+        return store
+
+    def test_retrieval_only_searches_the_documents_own_chunks(self):
+        biology, history = self.make_document(), self.make_document()
+        self.make_store(biology).sync_vector_store([Document(page_content=f"biology {i}") for i in range(4)])
+        self.make_store(history).sync_vector_store([Document(page_content=f"history {i}") for i in range(4)])
+
+        results = self.make_store(biology).get_retriever().invoke("history 1")
+        self.assertTrue(results)
+        self.assertTrue(all(doc.page_content.startswith("biology") for doc in results))
+
+    def test_identical_uploads_share_an_index_and_only_new_chunks_are_embedded(self):
+        first, second = self.make_document("ab" * 32), self.make_document("ab" * 32)
+        self.assertEqual(document_collection_name(first), document_collection_name(second))
+
+        chunks = [Document(page_content=f"chunk {i}") for i in range(3)]
+        stats = self.make_store(first).sync_vector_store(chunks, signature="v1")
+        self.assertEqual(stats, {'added': 3, 'removed': 0, 'unchanged': 0})
+
+        store = self.make_store(second)
+        self.assertTrue(store.is_indexed("v1"))
+        self.embeddings.reset_mock()
+        stats = store.sync_vector_store(chunks[1:] + [Document(page_content="chunk 3")], signature="v2")
+        self.assertEqual(stats, {'added': 1, 'removed': 1, 'unchanged': 2})
+        embedded = [text for call in self.embeddings.embed_documents.call_args_list for text in call.args[0]]
+        self.assertEqual(embedded, ["chunk 3"])
+
+    def test_deleting_a_document_keeps_a_shared_collection(self):
+        first, second = self.make_document("cd" * 32), self.make_document("cd" * 32)
+        PDFDocument.objects.update(processed=True)
+        first.refresh_from_db()
+        second.refresh_from_db()
+
+        with mock.patch('flashlearn.utils.embedding_store.EmbeddingStore.delete_collection') as delete_collection, \
+                mock.patch('flashlearn.utils.answer_cache.AnswerCache.clear') as clear_answers:
+            first.delete()
+            delete_collection.assert_not_called()
+            clear_answers.assert_not_called()
+            second.delete()
+        delete_collection.assert_called_once_with()
+        clear_answers.assert_called_once_with()
+
+
+class EmbeddingCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.cache = EmbeddingCache(f"{directory}/embeddings.sqlite3", max_entries=10)
+        self.backend = mock.Mock(wraps=DeterministicFakeEmbedding(size=8))
+        self.embeddings = CachedEmbeddings(self.backend, self.cache, "fake-model")
+
+    def test_repeated_texts_are_embedded_once(self):
+        first = self.embeddings.embed_documents(["a", "b", "a"])
+        second = self.embeddings.embed_documents(["b", "c"])
+
+        self.assertEqual(first[0], first[2])
+        self.assertEqual(second[0], first[1])
+        self.backend.embed_documents.assert_has_calls([mock.call(["a", "b"]), mock.call(["c"])])
+        self.assertEqual(self.embeddings.stats['documents'], {'hits': 1, 'misses': 4})
+
+        self.embeddings.embed_query("a")
+        self.embeddings.embed_query("a")
+        self.assertEqual(self.embeddings.stats['queries'], {'hits': 1, 'misses': 1})
+        self.backend.embed_query.assert_called_once_with("a")
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.embeddings.embed_documents([f"text {i}" for i in range(10)])
+        self.embeddings.embed_documents(["text 0"])
+        self.embeddings.embed_documents(["new"])
+
+        self.assertEqual(len(self.cache), 9)
+        self.assertIsNotNone(self.cache.get_many("fake-model", ["text 0"])[0])
+        self.assertIsNone(self.cache.get_many("fake-model", ["text 1"])[0])
+
+    def test_rows_are_only_counted_near_the_limit(self):
+        self.cache.max_entries = 100
+        statements = []
+        self.cache._connection().set_trace_callback(statements.append)
+        for i in range(20):
+            self.embeddings.embed_documents([f"text {i}"])
+        counts = [statement for statement in statements if "COUNT(*)" in statement]
+        self.assertEqual(len(counts), 1)
+
+
+class StreamingIngestionTests(TestCase):
+    def test_streamed_chunks_match_loading_the_whole_pdf(self):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        from langchain_community.document_loaders import PDFPlumberLoader
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        pdf_path = make_synthetic_pdf(f"{directory}/book.pdf", pages=5, chapters=2)
+
+        streamed = list(iter_document_chunks(pdf_path, workers=0, pages_per_task=2))
+        loaded = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=150).split_documents(
+            PDFPlumberLoader(pdf_path).load()
+        )
+        self.assertEqual(
+            [(doc.page_content, doc.metadata['page']) for doc in streamed],
+            [(doc.page_content, doc.metadata['page']) for doc in loaded]
+        )
+
+
+class ParsedPDFCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.pdf_path = make_synthetic_pdf(f"{self.directory}/book.pdf", pages=6, chapters=3)
+
+    def test_outline_and_pages_are_parsed_once(self):
+        headings = extract_main_headings(self.pdf_path)
+        text = extract_topic_text(self.pdf_path, 1, 2)
+        self.assertEqual([page for _, page in headings], [0, 2, 4])
+
+        # A fresh process reads the sidecar file instead of the PDF
+        pdf_processor._parsed_pdfs.invalidate()
+        with mock.patch.object(pdf_processor, 'PdfReader', side_effect=AssertionError("PDF parsed again")):
+            self.assertEqual(extract_main_headings(self.pdf_path), headings)
+            self.assertEqual(extract_topic_text(self.pdf_path, 1, 2), text)
+
+    def test_sidecar_is_removed_with_its_document(self):
+        extract_main_headings(self.pdf_path)
+        sidecar = f"{self.pdf_path}.parsed.json.gz"
+        self.assertTrue(os.path.exists(sidecar))
+        with override_settings(MEDIA_ROOT=self.directory):
+            PDFDocument.objects.create(title="Book", file="book.pdf").delete()
+        self.assertFalse(os.path.exists(sidecar))
+        self.assertTrue(os.path.exists(self.pdf_path))
+
+    def test_heading_text_runs_to_the_next_heading_or_the_end(self):
+        headings = extract_main_headings(self.pdf_path)
+        self.assertEqual(extract_heading_text(self.pdf_path, headings, 1, 2), extract_topic_text(self.pdf_path, 2, 4))
+        self.assertEqual(extract_heading_text(self.pdf_path, headings, 2, 4), extract_topic_text(self.pdf_path, 4, 6))
+
+    def test_cache_is_ignored_when_the_file_changes(self):
+        extract_main_headings(self.pdf_path)
+        make_synthetic_pdf(self.pdf_path, pages=6, chapters=2)
+        self.assertEqual(len(extract_main_headings(self.pdf_path)), 2)
+
+    def test_slow_extraction_does_not_block_other_pdfs(self):
+        other_path = make_synthetic_pdf(self.pdf_path.replace("book.pdf", "other.pdf"), pages=4, chapters=2)
+        extract_main_headings(self.pdf_path)
+        extract_main_headings(other_path)
+        started, release = threading.Event(), threading.Event()
+        real_reader = pdf_processor.PdfReader
+
+        def reader(path, *args, **kwargs):
+            if path == self.pdf_path:
+                started.set()
+                release.wait(5)
+            return real_reader(path, *args, **kwargs)
+
+        with mock.patch.object(pdf_processor, 'PdfReader', side_effect=reader):
+            slow = threading.Thread(target=extract_topic_text, args=(self.pdf_path, 1, 6))
+            slow.start()
+            self.assertTrue(started.wait(5))
+            done = threading.Event()
+            fast = threading.Thread(target=lambda: extract_topic_text(other_path, 1, 2) and done.set())
+            fast.start()
+            try:
+                # Finishes while the first PDF is still being extracted
+                self.assertTrue(done.wait(2))
+            finally:
+                release.set()
+                slow.join(5)
+                fast.join(5)
+
+
+class StubLLM:
+    """Stands in for the Ollama client's ``chat``; records prompts and peak concurrency."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.prompts = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, model, messages, **kwargs):
+        prompt = messages[0]['content']
+        with self._lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if prompt.startswith("The following are summaries"):
+            content = "combined summary"
+        else:
+            # Echo the first word of the chunk so the reduce prompt can be checked
+            first_word = prompt.split("Original Text:\n", 1)[1].split()[0]
+            content = f"<think>reasoning</think>summary of {first_word}"
+        return {'message': {'content': content}}
+
+
+def stub_llm(llm):
+    return mock.patch('flashlearn.utils.summarizer.get_ollama_client', return_value=mock.Mock(chat=llm))
+
+
+class SummarizerTests(TestCase):
+    def test_short_text_is_summarized_in_one_call(self):
+        llm = StubLLM()
+        stats = {}
+        with stub_llm(llm):
+            summary = summarize_text("A short text. It fits in one prompt.", stats=stats)
+
+        self.assertEqual(summary, "summary of A")
+        self.assertEqual(len(llm.prompts), 1)
+        self.assertEqual(stats['chunks'], 1)
+
+    def test_long_text_is_mapped_concurrently_then_reduced(self):
+        text = " ".join(f"Part{i} " + "word " * 60 + "end." for i in range(12))
+        llm = StubLLM()
+        stats = {}
+        with stub_llm(llm):
+            summary = summarize_text(text, max_chunk_tokens=100, concurrency=3, stats=stats)
+
+        self.assertEqual(summary, "combined summary")
+        self.assertEqual(stats['chunks'], 12)
+        self.assertEqual(stats['llm_calls'], 13)
+        self.assertLessEqual(llm.peak, 3)
+        self.assertGreater(llm.peak, 1)
+        self.assertGreater(stats['map_seconds'], 0)
+        # Partial summaries reach the reduce step in document order, without <think>
+        reduce_prompt = llm.prompts[-1]
+        self.assertNotIn("<think>", reduce_prompt)
+        positions = [reduce_prompt.index(f"summary of Part{i}\n") for i in range(12)]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_map_calls_keep_the_correlation_id(self):
+        text = " ".join(f"Part{i} " + "word " * 60 + "end." for i in range(6))
+        llm = StubLLM(delay=0)
+        seen = []
+
+        def chat(**kwargs):
+            seen.append(telemetry.get_correlation_id())
+            return llm(**kwargs)
+
+        with stub_llm(chat), telemetry.correlation_scope("job-42"):
+            summarize_text(text, max_chunk_tokens=100, concurrency=3)
+
+        self.assertGreater(len(seen), 6)
+        self.assertEqual(set(seen), {"job-42"})
+
+    def test_reduce_runs_in_rounds_when_partial_summaries_exceed_budget(self):
+        text = " ".join(f"Part{i} " + "word " * 30 + "end." for i in range(20))
+        llm = StubLLM(delay=0)
+        stats = {}
+        with stub_llm(llm):
+            summarize_text(text, max_chunk_tokens=50, stats=stats)
+
+        self.assertGreater(stats['reduce_rounds'], 1)
+
+    def test_chunks_respect_token_budget(self):
+        text = " ".join(f"Sentence number {i} has a few words." for i in range(200))
+        chunks = split_into_chunks(text, max_tokens=60)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(estimate_tokens(chunk) <= 60 for chunk in chunks))
+        self.assertEqual(" ".join(chunks), text)
+
+
+class SummaryCacheTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        # One LLM call per summary
+        media = override_settings(MEDIA_ROOT=media_root, FLASHLEARN_SUMMARY_CHUNK_TOKENS=100_000)
+        media.enable()
+        self.addCleanup(media.disable)
+        make_synthetic_pdf(f"{media_root}/book.pdf", pages=6, chapters=3)
+        self.first = PDFDocument.objects.create(title="Book", file="book.pdf")
+        self.second = PDFDocument.objects.create(title="Same book", file="book.pdf")
+        self.llm = StubLLM(delay=0)
+
+    def summarize(self, document, **options):
+        title, page = extract_main_headings(document.file.path)[2]
+        job = jobs.enqueue('summary', document_id=document.id, topic_index=2,
+                           topic_title=title, start_page=page, **options)
+        with stub_llm(self.llm):
+            jobs.run_worker('test-worker', max_idle=0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded', job.error)
+        return job.result
+
+    def test_same_topic_text_reuses_summary(self):
+        first = self.summarize(self.first)
+        calls = len(self.llm.prompts)
+        second = self.summarize(self.second)
+        again = self.summarize(self.first)
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(len(self.llm.prompts), calls)
+        copy = Summary.objects.get(id=second['summary_id'])
+        self.assertEqual(copy.document, self.second)
+        self.assertEqual(copy.content, Summary.objects.get(id=first['summary_id']).content)
+        # Asking again for the same document returns the existing summary
+        self.assertEqual(again['summary_id'], first['summary_id'])
+        # The copy for the second document and the reuse for the first both count
+        stats = summary_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        seconds = Summary.objects.get(id=first['summary_id']).generation_seconds
+        self.assertAlmostEqual(stats['seconds_saved'], 2 * seconds)
+
+    def test_last_topic_runs_to_end_of_document(self):
+        self.summarize(self.first)
+        (last_page,) = pdf_processor.get_page_texts(self.first.file.path, [5])
+        self.assertIn(last_page, self.llm.prompts[0])
+
+    def test_regenerate_skips_cache(self):
+        first = self.summarize(self.first)
+        regenerated = self.summarize(self.first, regenerate=True)
+
+        self.assertFalse(regenerated['cached'])
+        self.assertNotEqual(regenerated['summary_id'], first['summary_id'])
+        self.assertEqual(len(self.llm.prompts), 2)
+
+
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        self.persist_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.persist_directory, ignore_errors=True)
+        isolate_embedding_cache(self, self.persist_directory)
+
+    def make_cache(self, signature="v1", **kwargs):
+        cache = AnswerCache("pdf_test", signature=signature, persist_directory=self.persist_directory, **kwargs)
+        cache.store.embeddings = HashingEmbeddings()
+        return cache
+
+    def test_similar_question_gets_cached_answer(self):
+        cache = self.make_cache()
+        cache.put("What is photosynthesis?", "Plants make food from light.")
+        before = answer_cache_stats()
+
+        self.assertEqual(cache.get("what is   Photosynthesis"), "Plants make food from light.")
+        self.assertIsNone(cache.get("Who won the battle of Hastings?"))
+        after = answer_cache_stats()
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+    def test_rebuilt_index_and_expired_answers_are_not_served(self):
+        self.make_cache().put("What is photosynthesis?", "Old answer.")
+        self.assertIsNone(self.make_cache(signature="v2").get("What is photosynthesis?"))
+
+        cache = self.make_cache(ttl_seconds=60)
+        self.assertEqual(cache.get("What is photosynthesis?"), "Old answer.")
+        with mock.patch('flashlearn.utils.answer_cache.time.time', return_value=time.time() + 120):
+            self.assertIsNone(cache.get("What is photosynthesis?"))
+
+    def test_chatbot_answers_repeated_question_without_the_llm(self):
+        with FakeOllamaServer() as server:
+            chatbot = Chatbot(FakeRetriever(), base_url=server.url, answer_cache=self.make_cache())
+
+            async def ask():
+                return "".join([chunk async for chunk in chatbot.astream_response("What is photosynthesis?")])
+
+            first = asyncio.run(ask())
+            second = asyncio.run(ask())
+
+        self.assertEqual(first, "Plants make food from light.")
+        self.assertEqual(second, first)
+        self.assertEqual(len(server.requests), 1)
+
+
+class OllamaClientTests(TestCase):
+    def test_sync_and_async_chat_against_stub(self):
+        with FakeOllamaServer(reply="Plants make food.") as server:
+            client = OllamaClient(host=server.url)
+            response = client.chat(model="m", messages=[{"role": "user", "content": "hi"}], stream=False)
+
+            async def stream():
+                parts = await client.achat(model="m", messages=[{"role": "user", "content": "hi"}], stream=True)
+                return [part['message']['content'] async for part in parts]
+
+            parts = asyncio.run(stream())
+
+        self.assertEqual(response['message']['content'], "Plants make food.")
+        self.assertEqual("".join(parts), "Plants make food.")
+        self.assertGreater(len(parts), 2)
+        self.assertEqual(client.gate.stats()['active'], 0)
+
+    def test_busy_server_is_retried(self):
+        with FakeOllamaServer(reply="ok", fail_first=2) as server:
+            client = OllamaClient(host=server.url, retries=2, backoff=0)
+            parts = list(client.chat(model="m", messages=[{"role": "user", "content": "hi"}], stream=True))
+
+        self.assertEqual("".join(part['message']['content'] for part in parts), "ok")
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(client.gate.stats()['active'], 0)
+
+    def test_gives_up_after_retries(self):
+        with FakeOllamaServer(fail_first=5) as server:
+            client = OllamaClient(host=server.url, retries=1, backoff=0)
+            with self.assertRaises(ollama.ResponseError):
+                client.chat(model="m", messages=[{"role": "user", "content": "hi"}], stream=False)
+
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(client.gate.stats()['active'], 0)
+
+    def test_interactive_requests_are_let_in_before_batch_requests(self):
+        gate = PriorityGate(1)
+        gate.acquire()
+        order = []
+
+        def wait(name, priority):
+            gate.acquire(priority)
+            order.append(name)
+            gate.release()
+
+        threads = []
+        for name, priority in [("batch 1", PRIORITY_BATCH), ("batch 2", PRIORITY_BATCH), ("chat", PRIORITY_INTERACTIVE)]:
+            thread = threading.Thread(target=wait, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            while gate.stats()['waiting'] < len(threads):
+                time.sleep(0.001)
+        gate.release()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ["chat", "batch 1", "batch 2"])
+        self.assertEqual(gate.stats(), {'limit': 1, 'active': 0, 'waiting': 0})
+
+    def test_langchain_embeddings_go_through_the_shared_client(self):
+        with FakeOllamaServer() as server:
+            client = OllamaClient(host=server.url)
+            embeddings = client.bind(OllamaEmbeddings(model="m", base_url=server.url))
+            with mock.patch.object(client.gate, 'acquire', wraps=client.gate.acquire) as acquire:
+                with use_priority(PRIORITY_INTERACTIVE):
+                    vector = embeddings.embed_query("question")
+
+        self.assertEqual(vector, [0.5, 0.5])
+        acquire.assert_called_once_with(PRIORITY_INTERACTIVE)
+        self.assertEqual(server.requests[0][0], '/api/embed')
+
+    def test_closing_a_stream_halfway_frees_the_gate(self):
+        with FakeOllamaServer(reply="Plants make food from light.", chunk_size=2) as server:
+            client = OllamaClient(host=server.url, max_concurrency=1)
+            stream = client.chat(model="m", messages=[{"role": "user", "content": "hi"}], stream=True)
+            next(stream)
+            self.assertEqual(client.gate.stats()['active'], 1)
+            stream.close()
+            self.assertEqual(client.gate.stats()['active'], 0)
+            self.assertEqual(list(stream), [])
+
+    def test_abandoned_chat_answer_frees_the_gate(self):
+        with FakeOllamaServer(chunk_size=2) as server:
+            chatbot = Chatbot(FakeRetriever(), base_url=server.url)
+            gate = get_ollama_client(server.url).gate
+
+            async def read_one_chunk():
+                answer = chatbot.astream_response("What is photosynthesis?")
+                await anext(answer)
+                active = gate.stats()['active']
+                # Langchain keeps the Ollama stream open; closing the answer must still close it
+                await answer.aclose()
+                return active, gate.stats()['active']
+
+            self.assertEqual(asyncio.run(read_one_chunk()), (1, 0))
+
+
+class BulkWriteTests(TestCase):
+    def setUp(self):
+        document = PDFDocument.objects.create(title="Book", file="book.pdf")
+        self.summary = Summary.objects.create(document=document, topic_title="Cells", content="Cells divide.")
+        Flashcard.objects.create(summary=self.summary, question="Old?", answer="Old answer")
+
+    def generate(self, cards):
+        generator = mock.Mock()
+        generator.generate_flashcards.return_value = cards
+        job = jobs.enqueue('flashcards', summary_id=self.summary.id, num_cards=len(cards))
+        with mock.patch('flashlearn.tasks.FlashcardGenerator', return_value=generator):
+            jobs.run_worker('test-worker', max_idle=0)
+        job.refresh_from_db()
+        return job
+
+    def test_new_cards_replace_old_ones(self):
+        cards = [(f"Question {i}?", f"Answer {i}") for i in range(5)]
+        with mock.patch.object(Flashcard.objects, 'create') as create:
+            job = self.generate(cards)
+
+        self.assertEqual(job.status, 'succeeded')
+        create.assert_not_called()
+        saved = list(Flashcard.objects.filter(summary=self.summary).order_by('id').values_list('question', 'answer'))
+        self.assertEqual(saved, cards)
+
+    def test_failed_write_keeps_old_cards(self):
+        with mock.patch.object(Flashcard.objects, 'bulk_create', side_effect=RuntimeError("disk full")):
+            job = self.generate([("New?", "New answer")])
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(list(Flashcard.objects.values_list('question', flat=True)), ["Old?"])
+
+    def test_chat_turn_is_saved_in_one_insert(self):
+        session = ChatSession.objects.create(document=self.summary.document)
+        with self.assertNumQueries(3):  # savepoint, insert, release
+            answer = _save_chat_turn(session, "What is a cell?", "The unit of life.")
+
+        self.assertEqual(answer.role, 'assistant')
+        self.assertEqual(list(session.messages.order_by('id').values_list('role', flat=True)), ['user', 'assistant'])
+
+
+@override_settings(ROOT_URLCONF='flashlearn.urls')
+class PaginatedListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='secret')
+        self.client.force_login(self.user)
+        other = User.objects.create_user('other')
+        PDFDocument.objects.create(title="Not mine", file="other.pdf", user=other)
+
+    def make_documents(self, count):
+        for i in range(count):
+            document = PDFDocument.objects.create(title=f"Book {i}", file=f"book{i}.pdf", user=self.user)
+            Summary.objects.create(document=document, topic_title=f"Topic {i}", content="...")
+
+    def test_home_query_count_does_not_grow_with_documents(self):
+        self.make_documents(2)
+        with self.assertNumQueries(4):  # session, user, documents, summaries
+            self.client.get('/app/')
+
+        self.make_documents(40)
+        with self.assertNumQueries(4):
+            response = self.client.get('/app/')
+        self.assertEqual(len(response.context['documents']), 20)
+        self.assertContains(response, "Topic 39")
+
+    def test_keyset_pages_cover_only_the_users_documents_once(self):
+        self.make_documents(45)
+        titles, cursor = [], None
+        while True:
+            response = self.client.get('/app/', {'cursor': cursor} if cursor else {})
+            page = response.context['documents']
+            titles += [document.title for document in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(titles, [f"Book {i}" for i in reversed(range(45))])
+
+    def test_chat_shows_latest_messages_oldest_first(self):
+        document = PDFDocument.objects.create(title="Book", file="book.pdf", user=self.user)
+        session = ChatSession.objects.create(document=document)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=session, role='user', content=f"Message {i}") for i in range(60)
+        ])
+
+        response = self.client.get(f'/document/{document.id}/chatbot/')
+        shown = [message.content for message in response.context['chat_messages']]
+        self.assertEqual(shown, [f"Message {i}" for i in range(10, 60)])
+
+        response = self.client.get(f'/document/{document.id}/chatbot/',
+                                   {'before': response.context['earlier_messages_cursor']})
+        shown = [message.content for message in response.context['chat_messages']]
+        self.assertEqual(shown, [f"Message {i}" for i in range(10)])
+        self.assertIsNone(response.context['earlier_messages_cursor'])
+
+    def test_other_users_documents_are_not_found(self):
+        other_document = PDFDocument.objects.get(title="Not mine")
+        self.assertEqual(self.client.get(f'/document/{other_document.id}/chatbot/').status_code, 404)
+
+    def test_anonymous_chat_message_redirects_to_login(self):
+        document = PDFDocument.objects.create(title="Book", file="book.pdf", user=self.user)
+        self.client.logout()
+        response = self.client.post(f'/document/{document.id}/chat/message/', {'message': "Hi"})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ChatSession.objects.exists())
+
+
+class HybridRetrievalTests(TestCase):
+    def setUp(self):
+        persist_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, persist_directory, ignore_errors=True)
+        isolate_embedding_cache(self, persist_directory)
+        self.documents, self.queries = make_glossary_corpus(40)
+        self.embeddings = HashingEmbeddings()
+        self.store = EmbeddingStore("pdf_glossary", persist_directory=persist_directory)
+        self.store.embeddings = self.embeddings
+        self.store.sync_vector_store(self.documents)
+
+    def test_bm25_finds_exact_terms_and_survives_reload(self):
+        self.assertEqual(tokenize("Ohm's law for X-rays and H2O."), ["ohm", "law", "x-rays", "h2o"])
+        self.store.build_lexical_index(signature="v1")
+        index = self.store.get_lexical_index()
+
+        self.assertEqual(len(index), 40)
+        self.assertEqual(index.signature, "v1")
+        for text, relevant_id, kind in self.queries[:10]:
+            (best,) = index.get_documents(text, k=1)
+            self.assertEqual(best.metadata['page'], int(relevant_id.split('-')[1]))
+        # Rebuilding for the same signature reuses the index on disk
+        with mock.patch.object(BM25Index, 'build') as build:
+            self.store.build_lexical_index(signature="v1")
+        build.assert_not_called()
+
+    def test_store_returns_hybrid_retriever_once_keyword_index_exists(self):
+        self.assertNotIsInstance(self.store.get_retriever(), HybridRetriever)
+        self.store.build_lexical_index()
+
+        retriever = self.store.get_retriever(k=3)
+        self.assertIsInstance(retriever, HybridRetriever)
+        text, relevant_id, kind = self.queries[0]
+        pages = [document.metadata['page'] for document in retriever.invoke(text)]
+        self.assertIn(int(relevant_id.split('-')[1]), pages)
+        self.assertEqual(len(pages), 3)
+
+    def test_slow_embeddings_fall_back_to_keyword_results(self):
+        index = self.store.build_lexical_index()
+        retriever = HybridRetriever(vector_store=self.store.get_vector_store(), lexical_index=index,
+                                    k=2, dense_timeout=0.05, slow_cooldown=60)
+        self.embeddings.latency_per_call = 0.5
+        text = self.queries[0][0]
+
+        start = time.perf_counter()
+        results = retriever.invoke(text)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual([document.id for document in results],
+                         [document.id for document in index.get_documents(text, k=2)])
+        # While the embedding service is considered slow, it is not asked at all
+        with mock.patch.object(self.store.get_vector_store(), 'similarity_search') as similarity_search:
+            retriever.invoke(text)
+        similarity_search.assert_not_called()
+
+    def test_reciprocal_rank_fusion_rewards_agreement(self):
+        a, b, c = (Document(id=name, page_content=name) for name in "abc")
+        fused = reciprocal_rank_fusion([[a, b, c], [b, c]])
+        self.assertEqual([document.id for document in fused], ["b", "c", "a"])
+
+
+class OverlapReranker(CrossEncoderReranker):
+    """Scores by word overlap instead of a cross-encoder, optionally slowly."""
+
+    def __init__(self, delay=0.0, pair_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.pair_delay = pair_delay
+        self.scored_texts = []
+
+    def is_loaded(self):
+        return True
+
+    def _score_batch(self, query, texts):
+        time.sleep(self.delay + self.pair_delay * len(texts))
+        self.scored_texts.extend(texts)
+        words = set(query.lower().split())
+        return [float(len(words & set(text.lower().split()))) for text in texts]
+
+
+class RerankerTests(TestCase):
+    def setUp(self):
+        self.candidates = [
+            Document(id="a", page_content="cells divide by mitosis"),
+            Document(id="b", page_content="the krebs cycle makes energy in mitochondria"),
+            Document(id="c", page_content="mitochondria energy krebs cycle and atp"),
+        ]
+
+    def test_reorders_candidates_and_caches_scores(self):
+        reranker = OverlapReranker(batch_size=2, top_n=2)
+        results = reranker.rerank("krebs cycle atp energy", self.candidates)
+        self.assertEqual([document.id for document in results], ["c", "b"])
+        self.assertEqual(results[0].metadata['rerank_score'], 4.0)
+
+        reranker.scored_texts.clear()
+        reranker.rerank("krebs cycle atp energy", self.candidates)
+        self.assertEqual(reranker.scored_texts, [])
+        self.assertEqual(reranker.last_stats['cached'], 3)
+
+    def test_latency_budget_leaves_remaining_candidates_in_retrieval_order(self):
+        reranker = OverlapReranker(delay=0.05, batch_size=1, latency_budget=0.02, top_n=3)
+        results = reranker.rerank("krebs cycle atp energy", self.candidates)
+        # Only the first batch fits in the budget
+        self.assertEqual(reranker.last_stats['scored'], 1)
+        self.assertEqual([document.id for document in results], ["a", "b", "c"])
+
+    def test_budget_limits_a_single_large_batch(self):
+        candidates = [Document(id=str(i), page_content=f"chunk {i} about energy") for i in range(12)]
+        reranker = OverlapReranker(pair_delay=0.01, batch_size=16, latency_budget=0.06)
+        reranker.score("energy", candidates)
+        # Batches are sized from the measured per-pair cost, not batch_size
+        self.assertGreater(reranker.last_stats['scored'], 0)
+        self.assertLess(reranker.last_stats['scored'], 12)
+        self.assertLess(reranker.last_stats['seconds'], 0.06 + 0.02)
+
+    def test_cold_model_is_loaded_in_the_background(self):
+        release = threading.Event()
+
+        class SlowLoadingReranker(OverlapReranker):
+            is_loaded = CrossEncoderReranker.is_loaded
+
+            def _load(self):
+                release.wait(5)
+                return "model"
+
+        reranker = SlowLoadingReranker(registry=ModelRegistry(), top_n=3)
+        results = reranker.rerank("krebs cycle atp energy", self.candidates)
+        self.assertTrue(reranker.last_stats['cold'])
+        self.assertEqual([document.id for document in results], ["a", "b", "c"])
+        self.assertEqual(reranker.scored_texts, [])
+
+        release.set()
+        reranker.load_in_background().join(5)
+        results = reranker.rerank("krebs cycle atp energy", self.candidates)
+        self.assertFalse(reranker.last_stats['cold'])
+        self.assertEqual(results[0].id, "c")
+
+    def test_packs_best_chunks_into_token_budget(self):
+        long_chunk = Document(id="long", page_content="krebs cycle atp energy " * 100)
+        reranker = OverlapReranker(max_context_tokens=30, top_n=3)
+        retriever = RerankingRetriever(
+            base_retriever=mock.Mock(invoke=mock.Mock(return_value=[long_chunk] + self.candidates)),
+            reranker=reranker
+        )
+        results = retriever.invoke("krebs cycle atp energy")
+        self.assertNotIn("long", [document.id for document in results])
+        self.assertLessEqual(sum(estimate_tokens(d.page_content) for d in results), 30)
+
+
+class ContextBuilderTests(TestCase):
+    def test_removes_splitter_overlap_and_duplicates_and_labels_sources(self):
+        text = " ".join(f"Sentence number {i} about cell biology." for i in range(30))
+        first, second = text[:600], text[450:]
+        metadata = {'source': '/media/pdf_uploads/bio.pdf', 'page': 3}
+        documents = [
+            Document(id="1", page_content=first, metadata=metadata),
+            Document(id="2", page_content=second, metadata=metadata),
+            Document(id="3", page_content=first[100:300], metadata=metadata),
+        ]
+        packed = ContextBuilder(max_tokens=10_000).build(documents)
+
+        self.assertEqual(packed.duplicates, 1)
+        self.assertEqual(len(packed.documents), 2)
+        self.assertEqual(packed.text.count("Sentence number 12 "), 1)
+        self.assertTrue(packed.text.startswith("[bio.pdf, p. 4]\n"))
+        self.assertEqual(packed.documents[1].metadata['page'], 3)
+
+    def test_trims_to_token_budget(self):
+        documents = [
+            Document(id=str(i), page_content=f"Topic {i}. " + "Plants use light to make sugar. " * 20)
+            for i in range(5)
+        ]
+        packed = ContextBuilder(max_tokens=300).build(documents)
+        self.assertLessEqual(packed.tokens, 300)
+        self.assertLessEqual(estimate_tokens(packed.text), 300)
+        self.assertGreater(packed.dropped, 0)
+        self.assertTrue(packed.text.startswith("Topic 0."))
+
+
+class RecordingRetriever(BaseRetriever):
+    queries: list = []
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        self.queries.append(query)
+        return [Document(page_content="Mitochondria release energy from glucose.")]
+
+
+class ConversationMemoryTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('student')
+        document = PDFDocument.objects.create(title="Biology", file='pdf_uploads/bio.pdf', user=user)
+        self.session = ChatSession.objects.create(document=document)
+
+    def test_follow_up_is_rewritten_for_retrieval_and_history_is_in_the_prompt(self):
+        memory = ConversationMemory("", [('user', "What are mitochondria?"), ('assistant', "Organelles.")])
+        retriever = RecordingRetriever(queries=[])
+        with FakeOllamaServer(reply="<think>hmm</think>What do mitochondria do?") as server:
+            chatbot = Chatbot(retriever, base_url=server.url, context_builder=ContextBuilder())
+            chatbot.get_response("What do they do?", memory=memory)
+            # Self-contained questions are not rewritten, however short
+            chatbot.get_response("Explain the structure of a plant cell wall", memory=memory)
+            chatbot.get_response("What is osmosis?", memory=memory)
+
+        self.assertEqual(retriever.queries,
+                         ["What do mitochondria do?", "Explain the structure of a plant cell wall", "What is osmosis?"])
+        self.assertEqual(len(server.requests), 4)
+        prompt = server.requests[1][1]["messages"][-1]["content"]
+        self.assertIn("Conversation so far:\nStudent: What are mitochondria?\nAssistant: Organelles.", prompt)
+        self.assertIn("Question: What do they do?", prompt)
+
+    def test_only_questions_that_refer_back_need_rewriting(self):
+        for question in ("What do they do?", "And in plants?", "What about mitosis?", "Why is that?"):
+            self.assertTrue(needs_rewrite(question), question)
+        for question in ("What is photosynthesis?", "Define osmosis", "How do enzymes work?"):
+            self.assertFalse(needs_rewrite(question), question)
+
+    @override_settings(FLASHLEARN_IN_PROCESS_JOB_WORKERS=0, FLASHLEARN_CHAT_HISTORY_TURNS=3)
+    def test_old_messages_are_folded_into_the_running_summary(self):
+        for i in range(4):
+            _save_chat_turn(self.session, f"Question {i}?", f"Answer {i}.")
+        self.assertIsNone(_schedule_chat_summary(self.session))
+
+        for i in range(4, 8):
+            _save_chat_turn(self.session, f"Question {i}?", f"Answer {i}.")
+        self.assertIsNotNone(_schedule_chat_summary(self.session))
+        self.assertIsNone(_schedule_chat_summary(self.session))  # already queued
+
+        with mock.patch('flashlearn.tasks.update_running_summary', return_value="Asked questions 0-4.") as update:
+            jobs.run_worker('test-worker', max_idle=0)
+        turns = update.call_args.args[1]
+        self.assertEqual([content for role, content in turns][::2], [f"Question {i}?" for i in range(5)])
+
+        memory = _conversation_memory(self.session)
+        self.assertEqual(memory.summary, "Asked questions 0-4.")
+        self.assertEqual([content for role, content in memory.turns][::2], ["Question 5?", "Question 6?", "Question 7?"])
+        self.assertEqual(memory.pending, [])
+        self.assertIsNone(_schedule_chat_summary(self.session))
+
+    @override_settings(FLASHLEARN_IN_PROCESS_JOB_WORKERS=0, FLASHLEARN_CHAT_HISTORY_TURNS=1)
+    def test_messages_awaiting_the_summary_stay_in_memory(self):
+        for i in range(3):
+            _save_chat_turn(self.session, f"Question {i}?", f"Answer {i}. " + "detail " * 200)
+
+        memory = _conversation_memory(self.session)
+        self.assertEqual([content for role, content in memory.turns], ["Question 2?", memory.turns[1][1]])
+        self.assertEqual([content for role, content in memory.pending][::2], ["Question 0?", "Question 1?"])
+        text = memory.format()
+        self.assertLess(text.index("Question 1?"), text.index("Question 2?"))
+        self.assertIn("Answer 0.", text)
+        self.assertLess(len(text), 2 * len(memory.turns[1][1]))
+
+
+class TelemetryTests(TestCase):
+    def stage(self, name):
+        return telemetry.stage_seconds.snapshot().get((name,), (0, 0.0))
+
+    @override_settings(FLASHLEARN_METRICS_ENABLED=True)
+    def test_span_records_duration_and_errors(self):
+        before = self.stage('test.stage')
+        with telemetry.span('test.stage'):
+            pass
+        with self.assertRaises(ValueError):
+            with telemetry.span('test.stage'):
+                raise ValueError("boom")
+
+        self.assertEqual(self.stage('test.stage')[0], before[0] + 2)
+        self.assertGreaterEqual(telemetry.stage_errors.snapshot()[('test.stage', 'ValueError')], 1)
+        text = telemetry.render_metrics([('flashlearn_test_total', 'counter', "A test.", 3)])
+        self.assertIn('flashlearn_stage_seconds_bucket{stage="test.stage",le="+Inf"}', text)
+        self.assertIn('flashlearn_stage_seconds_count{stage="test.stage"}', text)
+        self.assertIn("# TYPE flashlearn_test_total counter\nflashlearn_test_total 3", text)
+
+    @override_settings(FLASHLEARN_METRICS_ENABLED=False)
+    def test_disabled_span_is_a_shared_no_op(self):
+        before = self.stage('test.disabled')
+        self.assertIs(telemetry.span('test.disabled'), telemetry.span('other'))
+        with telemetry.span('test.disabled'):
+            pass
+        self.assertEqual(self.stage('test.disabled'), before)
+
+    def test_log_records_carry_the_correlation_id(self):
+        record = logging.LogRecord('flashlearn', logging.INFO, __file__, 1, "message", (), None)
+        with telemetry.correlation_scope("req-123"):
+            telemetry.CorrelationIdFilter().filter(record)
+        self.assertEqual(record.correlation_id, "req-123")
+
+
+@override_settings(ROOT_URLCONF='flashlearn.urls', FLASHLEARN_METRICS_ENABLED=True)
+class MetricsViewTests(TestCase):
+    def test_scraper_gets_prometheus_text_and_request_id_is_echoed(self):
+        response = self.client.get('/metrics', HTTP_X_REQUEST_ID="abc-123")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b"# TYPE flashlearn_stage_seconds histogram", response.content)
+        self.assertIn(b"flashlearn_jobs_queued 0", response.content)
+        self.assertEqual(response['X-Request-ID'], "abc-123")
+
+    def test_summary_cache_is_reported(self):
+        document = PDFDocument.objects.create(title="Book", file="book.pdf")
+        Summary.objects.create(document=document, topic_title="Cells", content="...", content_hash="h",
+                               generation_seconds=4.0, reused_count=2)
+        response = self.client.get('/metrics')
+        self.assertIn(b"flashlearn_summary_cache_hits_total 2", response.content)
+        self.assertIn(b"flashlearn_summary_cache_misses_total 1", response.content)
+        self.assertIn(b"flashlearn_summary_cache_seconds_saved_total 8.0", response.content)
+
+    def test_embedding_cache_is_reported(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cache = EmbeddingCache(f"{directory}/embeddings.sqlite3")
+        before = embedding_cache_stats()
+        # Counts from every client are kept, including ones no longer in use
+        for _ in range(2):
+            embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=8), cache, "fake-model")
+            embeddings.embed_documents(["a", "b"])
+            embeddings.embed_query("a")
+        after = embedding_cache_stats()
+        self.assertEqual(after['documents']['hits'] - before['documents']['hits'], 2)
+        self.assertEqual(after['queries']['misses'] - before['queries']['misses'], 1)
+
+        response = self.client.get('/metrics')
+        hits = after['documents']['hits'] + after['queries']['hits']
+        misses = after['documents']['misses'] + after['queries']['misses']
+        self.assertIn(f"flashlearn_embedding_cache_hits_total {hits}".encode(), response.content)
+        self.assertIn(f"flashlearn_embedding_cache_misses_total {misses}".encode(), response.content)
+
+    def test_other_addresses_are_refused(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.9').status_code, 403)
+        with override_settings(FLASHLEARN_METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class PipelineBenchmarkTests(TestCase):
+    def test_benchmark_writes_comparable_json(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        isolate_embedding_cache(self, workdir)
+        path = f"{workdir}/results.json"
+        options = dict(pages=4, chapters=2, repeat=1, chat_requests=4, concurrency=2, num_cards=2,
+                       llm_latency_ms=0, llm_ms_per_prompt_token=0, llm_ms_per_output_token=0,
+                       embed_latency_ms=0, t5_latency_ms=0, stdout=io.StringIO())
+        call_command('bench_pipeline', json=path, **options)
+
+        with open(path) as f:
+            data = json.load(f)
+        results = data['results']
+        self.assertEqual(set(results), {'upload_to_topics', 'topic_to_summary', 'summary_to_flashcards', 'ingest', 'chat'})
+        self.assertEqual(results['upload_to_topics']['topics'], 2)
+        self.assertGreater(results['ingest']['chunks_per_second'], 0)
+        self.assertEqual(results['chat']['latency']['n'], 4)
+        self.assertEqual(data['options']['pages'], 4)
+
+        out = io.StringIO()
+        call_command('bench_pipeline', compare=path, **dict(options, stdout=out))
+        self.assertIn("chat.latency.p95_ms", out.getvalue())
@@ -16,4 +16,8 @@ urlpatterns = [
     path('document/<int:document_id>/chatbot/', views.chatbot, name='chatbot'),
     path('document/<int:document_id>/knowledge-base/create/', views.create_knowledge_base, name='create_knowledge_base'),
     path('document/<int:document_id>/chat/message/', views.chat_message, name='chat_message'),
+    path('document/<int:document_id>/chat/stream/', views.chat_stream, name='chat_stream'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/cancel/', views.cancel_job, name='cancel_job'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,106 @@
+import time
+import logging
+import threading
+from .embedding_cache import text_hash
+from .embedding_store import EmbeddingStore, EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.92
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def answer_cache_stats():
+    """Hits, misses and hit rate of the answer caches in this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def _normalize(question):
+    return " ".join(question.lower().split())
+
+
+class AnswerCache:
+    """Answers to earlier questions about one knowledge base, found by question similarity.
+
+    Past questions are embedded into their own Chroma collection next to the
+    knowledge base. A new question is answered from the cache when a past one
+    is at least ``threshold`` cosine-similar, was asked within ``ttl_seconds``
+    and was answered from the same version of the index (``signature``), so
+    rebuilding the knowledge base invalidates earlier answers.
+    """
+
+    def __init__(self, collection_name, signature=None, persist_directory="./chroma_db",
+                 model=EMBEDDING_MODEL, threshold=DEFAULT_THRESHOLD, ttl_seconds=None):
+        self.signature = signature or ""
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.store = EmbeddingStore(
+            f"answers_{collection_name}",
+            persist_directory=persist_directory,
+            model=model,
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+
+    @property
+    def embeddings(self):
+        return self.store.embeddings
+
+    def _collection(self):
+        return self.store.get_vector_store()._collection
+
+    def _where(self):
+        if not self.ttl_seconds:
+            return {"signature": self.signature}
+        return {"$and": [
+            {"signature": self.signature},
+            {"created_at": {"$gte": time.time() - self.ttl_seconds}},
+        ]}
+
+    def get(self, question):
+        """Return the cached answer to a question similar to ``question``, or None."""
+        vector = self.embeddings.embed_query(_normalize(question))
+        result = self._collection().query(
+            query_embeddings=[vector],
+            n_results=1,
+            where=self._where(),
+            include=["metadatas", "distances", "documents"]
+        )
+        if result['ids'][0]:
+            similarity = 1.0 - result['distances'][0][0]
+            if similarity >= self.threshold:
+                _count('hits')
+                logger.info("Answer cache hit (%.3f) for %r: matched %r",
+                            similarity, question, result['documents'][0][0])
+                return result['metadatas'][0][0]['answer']
+        _count('misses')
+        return None
+
+    def put(self, question, answer):
+        """Remember the answer to ``question`` and drop expired entries."""
+        question = _normalize(question)
+        vector = self.embeddings.embed_query(question)
+        collection = self._collection()
+        collection.upsert(
+            ids=[text_hash(f"{self.signature}\0{question}")],
+            embeddings=[vector],
+            documents=[question],
+            metadatas=[{"answer": answer, "signature": self.signature, "created_at": time.time()}]
+        )
+        _count('stores')
+        if self.ttl_seconds:
+            collection.delete(where={"created_at": {"$lt": time.time() - self.ttl_seconds}})
+
+    def clear(self):
+        """Forget every cached answer, e.g. after the knowledge base was rebuilt."""
+        self.store.delete_collection()
@@ -0,0 +1,143 @@
+import os
+import re
+import gzip
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from langchain_core.documents import Document
+from .cache import BoundedCache
+
+logger = logging.getLogger(__name__)
+
+BM25_INDEX_VERSION = 1
+K1 = 1.2
+B = 0.75
+
+# Very common words carry no signal and bloat the postings
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was "
+    "were what when where which who why how will with does do did can".split()
+)
+
+_TOKEN_RE = re.compile(r"\w+(?:[-'.]\w+)*")
+
+_loaded = BoundedCache(max_size=16)
+_write_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Lowercased word tokens; keeps terms like "h2o" and "x-ray" whole.
+
+    Possessives are dropped, so "Ohm's law" and "ohm law" match.
+    """
+    tokens = (token[:-2] if token.endswith("'s") else token for token in _TOKEN_RE.findall(text.lower()))
+    return [token for token in tokens if token and token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over the chunks of one collection, stored as one gzipped JSON file.
+
+    Postings are kept as flat ``[doc, tf, doc, tf, ...]`` lists, and chunk
+    texts and metadata are stored too, so lexical results need no round-trip
+    to Chroma.
+    """
+
+    def __init__(self, ids, texts, metadatas, postings, doc_lengths, signature=None):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.signature = signature
+        self.average_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, ids, texts, metadatas=None, signature=None):
+        """Index chunk texts under their ids."""
+        metadatas = metadatas or [{} for _ in ids]
+        postings = {}
+        doc_lengths = []
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).extend((doc, tf))
+        return cls(list(ids), list(texts), [dict(m or {}) for m in metadatas], postings, doc_lengths, signature)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k=10):
+        """Return up to ``k`` (score, position) pairs, best first."""
+        if not self.ids:
+            return []
+        scores = {}
+        n = len(self.ids)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings) // 2
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i in range(0, len(postings), 2):
+                doc, tf = postings[i], postings[i + 1]
+                norm = K1 * (1 - B + B * self.doc_lengths[doc] / self.average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(score, doc) for doc, score in best]
+
+    def get_documents(self, query, k=10):
+        """Search and return langchain Documents with their chunk ids and BM25 scores."""
+        return [
+            Document(
+                id=self.ids[doc],
+                page_content=self.texts[doc],
+                metadata={**self.metadatas[doc], 'bm25_score': score}
+            )
+            for score, doc in self.search(query, k)
+        ]
+
+    def save(self, path):
+        """Write the index atomically."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        data = {
+            'version': BM25_INDEX_VERSION,
+            'signature': self.signature,
+            'ids': self.ids,
+            'texts': self.texts,
+            'metadatas': self.metadatas,
+            'doc_lengths': self.doc_lengths,
+            'postings': self.postings,
+        }
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        with _write_lock:
+            os.replace(temp_path, path)
+        _loaded.invalidate(lambda key: key[0] == path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by ``save``, or return None if missing or outdated."""
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Could not read BM25 index %s: %s", path, e)
+            return None
+        if data.get('version') != BM25_INDEX_VERSION:
+            return None
+        return cls(data['ids'], data['texts'], data['metadatas'], data['postings'],
+                   data['doc_lengths'], data.get('signature'))
+
+
+def load_bm25_index(path):
+    """Return the index at ``path``, cached in memory until the file changes."""
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return _loaded.get_or_create((path, stamp), lambda: BM25Index.load(path))
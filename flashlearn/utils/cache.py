@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class BoundedCache:
+    """Thread-safe LRU cache whose entries also expire after sitting idle."""
+
+    def __init__(self, max_size=32, idle_seconds=None):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()  # key -> (value, last_used)
+        self._lock = threading.RLock()
+        self._create_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key`` and mark it as recently used."""
+        with self._lock:
+            self._evict_idle()
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            value, _ = self._entries.pop(key)
+            self._entries[key] = (value, time.monotonic())
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """Return the cached value, building it with ``factory()`` on a miss.
+
+        Concurrent misses for the same key build the value only once. A
+        factory returning None is not cached, so the next call tries again.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        with self._lock:
+            create_lock = self._create_locks.setdefault(key, threading.Lock())
+        with create_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                value = entry[0]
+            else:
+                value = factory()
+                if value is not None:
+                    self.set(key, value)
+        with self._lock:
+            self._create_locks.pop(key, None)
+        return value
+
+    def invalidate(self, match=None):
+        """Drop entries whose key satisfies ``match(key)``, or every entry."""
+        with self._lock:
+            for key in list(self._entries):
+                if match is None or match(key):
+                    del self._entries[key]
+
+    def _evict_idle(self):
+        if self.idle_seconds is None:
+            return
+        cutoff = time.monotonic() - self.idle_seconds
+        # Entries are kept in last-used order, so the idle ones are at the front
+        while self._entries:
+            key, (_, last_used) = next(iter(self._entries.items()))
+            if last_used >= cutoff:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def __len__(self):
+        with self._lock:
+            self._evict_idle()
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
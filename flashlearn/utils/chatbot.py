@@ -1,12 +1,142 @@
-from langchain.chains import RetrievalQA
+import time
+import asyncio
+import logging
+import threading
 from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+from django.conf import settings
+from .cache import BoundedCache
+from .context_builder import ContextBuilder, DEFAULT_CONTEXT_TOKENS
+from .ollama_client import get_ollama_client, track_streams, use_priority, PRIORITY_INTERACTIVE
+from .telemetry import observe, span
+
+logger = logging.getLogger(__name__)
+
+# Chatbots (LLM client, retriever and QA chain) are reused across messages
+_chatbots = BoundedCache(
+    max_size=getattr(settings, 'FLASHLEARN_CHATBOT_CACHE_SIZE', 16),
+    idle_seconds=getattr(settings, 'FLASHLEARN_CACHE_IDLE_SECONDS', None)
+)
+
+
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'context_tokens': 0, 'prompt_tokens': 0, 'prefill_seconds': 0.0}
+
+
+def prompt_stats():
+    """Totals and per-request averages of prompt size and prefill time in this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    requests = stats['requests'] or 1
+    stats['avg_prompt_tokens'] = stats['prompt_tokens'] / requests
+    stats['avg_prefill_seconds'] = stats['prefill_seconds'] / requests
+    return stats
+
+
+def _prompt_usage(packed, metadata):
+    """Prompt size and prefill time of one request, from Ollama's response metadata."""
+    usage = {
+        'context_tokens': packed.tokens,
+        'chunks': len(packed.documents),
+        'duplicate_chunks': packed.duplicates,
+        'dropped_chunks': packed.dropped,
+        'prompt_tokens': metadata.get('prompt_eval_count') or 0,
+        'prefill_seconds': (metadata.get('prompt_eval_duration') or 0) / 1e9,
+    }
+    observe('chat.prefill', usage['prefill_seconds'])
+    with _stats_lock:
+        _stats['requests'] += 1
+        _stats['context_tokens'] += usage['context_tokens']
+        _stats['prompt_tokens'] += usage['prompt_tokens']
+        _stats['prefill_seconds'] += usage['prefill_seconds']
+    logger.info(
+        "Chat prompt: %d tokens (%d of context from %d chunks, %d duplicate, %d over budget), prefill %.2fs",
+        usage['prompt_tokens'], usage['context_tokens'], usage['chunks'],
+        usage['duplicate_chunks'], usage['dropped_chunks'], usage['prefill_seconds']
+    )
+    return usage
+
+
+def get_cached_chatbot(key, factory):
+    """Return the chatbot cached under ``key``, building it with ``factory()`` on a miss.
+
+    Keys start with the document id so that ``invalidate_chatbots`` can drop
+    every chatbot of a document when its knowledge base is rebuilt.
+    """
+    return _chatbots.get_or_create(key, factory)
+
+
+def invalidate_chatbots(document_id=None):
+    """Drop cached chatbots for a document, or all of them."""
+    _chatbots.invalidate(None if document_id is None else lambda key: key[0] == document_id)
+
+
+class ThinkFilter:
+    """Drop ``<think>...</think>`` sections from a stream of text chunks.
+
+    Tags may be split across chunks, so any trailing text that could be the
+    start of a tag is held back until the next chunk arrives.
+    """
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_think = False
+        self._started = False
+
+    def feed(self, text):
+        """Add a chunk and return the text that can be shown so far."""
+        self._buffer += text
+        output = []
+        while True:
+            tag = self.CLOSE_TAG if self._in_think else self.OPEN_TAG
+            index = self._buffer.find(tag)
+            if index >= 0:
+                if not self._in_think:
+                    output.append(self._buffer[:index])
+                self._buffer = self._buffer[index + len(tag):]
+                self._in_think = not self._in_think
+                continue
+
+            keep = self._partial_tag_length(tag)
+            if not self._in_think:
+                output.append(self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            return self._emit("".join(output))
+
+    def flush(self):
+        """Return whatever is still buffered once the stream has ended."""
+        remaining = "" if self._in_think else self._buffer
+        self._buffer = ""
+        return self._emit(remaining)
+
+    def _partial_tag_length(self, tag):
+        for length in range(min(len(tag) - 1, len(self._buffer)), 0, -1):
+            if self._buffer.endswith(tag[:length]):
+                return length
+        return 0
+
+    def _emit(self, text):
+        # Like the old post-hoc strip(), drop whitespace before the answer
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
 
 class Chatbot:
-    def __init__(self, retriever):
+    def __init__(self, retriever, base_url=None, answer_cache=None, context_builder=None):
         self.retriever = retriever
-        self.llm = ChatOllama(model="deepseek-r1:8b", temperature=0.3)
-        self.qa_chain = self._create_qa_chain()
+        self.base_url = base_url
+        self.answer_cache = answer_cache
+        self.context_builder = context_builder or ContextBuilder(
+            getattr(settings, 'FLASHLEARN_CONTEXT_TOKENS', DEFAULT_CONTEXT_TOKENS)
+        )
+        self.llm = ChatOllama(model="deepseek-r1:8b", temperature=0.3, base_url=base_url)
+        # Chat requests go ahead of queued summarization and ingestion work
+        get_ollama_client(base_url).bind(self.llm, PRIORITY_INTERACTIVE)
+        self.prompt = self._get_custom_prompt()
         
     def _get_custom_prompt(self):
         """Define and return the custom prompt template."""
@@ -22,28 +152,117 @@ class Chatbot:
                 "7. Provide examples to clarify concepts when helpful.\n"
                 "8. Keep answers concise, focused, and exam-friendly."
             ),
+            # The guidelines above already cover style; repeating them here only lengthens every prompt
             HumanMessagePromptTemplate.from_template(
-                "Context:\n{context}\n\n"
+                "{history}Context:\n{context}\n\n"
                 "Question: {question}\n\n"
-                "Provide a precise and well-structured answer based on the context above. Ensure your response is easy to understand, includes examples where necessary, and is formatted in a way that students can use it for exams. If applicable, ask if the student needs further clarification."
+                "Answer from the context above."
             )
         ])
     
-    def _create_qa_chain(self):
-        """Create a QA chain for the chatbot."""
-        return RetrievalQA.from_chain_type(
-            self.llm,
-            retriever=self.retriever,
-            chain_type="stuff",
-            chain_type_kwargs={"prompt": self._get_custom_prompt()}
-        )
-    
-    def get_response(self, query):
-        """Get a response from the chatbot."""
+    def _build_prompt(self, query, documents, memory=None):
+        """Return the chat messages for ``query`` and the packed context they contain."""
+        packed = self.context_builder.build(documents)
+        history = f"Conversation so far:\n{memory.format()}\n\n" if memory else ""
+        return self.prompt.format_messages(history=history, context=packed.text, question=query), packed
+
+    def _cached_answer(self, query):
+        """Answer from the answer cache, or None. Cache failures are not fatal."""
+        if self.answer_cache is None:
+            return None
+        try:
+            return self.answer_cache.get(query)
+        except Exception as e:
+            logger.warning("Answer cache lookup failed: %s", e)
+            return None
+
+    def _remember(self, query, answer):
+        if self.answer_cache is None or not answer:
+            return
         try:
-            response = self.qa_chain.invoke({"query": query})
+            self.answer_cache.put(query, answer)
+        except Exception as e:
+            logger.warning("Could not cache answer: %s", e)
+
+    def get_response(self, query, memory=None):
+        """Get a response from the chatbot.
+
+        With a ``ConversationMemory``, follow-up questions are rewritten into
+        standalone ones for the answer cache and retrieval, and the remembered
+        conversation is included in the prompt.
+        """
+        with use_priority(PRIORITY_INTERACTIVE):
+            search_query = memory.standalone_question(query, self.base_url) if memory else query
+            cached = self._cached_answer(search_query)
+        if cached is not None:
+            return cached
+        try:
+            with use_priority(PRIORITY_INTERACTIVE):
+                with span('chat.retrieve'):
+                    documents = self.retriever.invoke(search_query)
+                prompt, packed = self._build_prompt(query, documents, memory)
+                with span('chat.generate'):
+                    response = self.llm.invoke(prompt)
+            _prompt_usage(packed, response.response_metadata)
             # Remove <think> section if present
-            result = response["result"].split("</think>")[-1].strip()
-            return result
+            result = response.content.split("</think>")[-1].strip()
         except Exception as e:
-            return f"Error: {str(e)}"
\ No newline at end of file
+            logger.exception("Chat response failed")
+            return f"Error: {str(e)}"
+        self._remember(search_query, result)
+        return result
+
+    async def astream_response(self, query, memory=None):
+        """Yield the answer to ``query`` chunk by chunk as the model generates it.
+
+        ``memory`` is used as in ``get_response``. An answer found in the
+        answer cache is yielded in one piece.
+        """
+        search_query, cached = query, None
+        with use_priority(PRIORITY_INTERACTIVE):
+            if memory:
+                search_query = await asyncio.to_thread(memory.standalone_question, query, self.base_url)
+            if self.answer_cache is not None:
+                cached = await asyncio.to_thread(self._cached_answer, search_query)
+            if cached is None:
+                with span('chat.retrieve'):
+                    documents = await self.retriever.ainvoke(search_query)
+        if cached is not None:
+            yield cached
+            return
+        prompt, packed = self._build_prompt(query, documents, memory)
+
+        think_filter = ThinkFilter()
+        chunks = []
+        metadata = {}
+        started, first = time.perf_counter(), True
+        stream, opened = self.llm.astream(prompt), []
+        try:
+            while True:
+                # Note the Ollama stream the first read opens, to close it if the reader stops early
+                with track_streams(opened):
+                    chunk = await anext(stream, None)
+                if chunk is None:
+                    break
+                if first:
+                    observe('chat.first_token', time.perf_counter() - started)
+                    first = False
+                # The final chunk carries Ollama's token counts and timings
+                metadata.update(chunk.response_metadata)
+                text = think_filter.feed(chunk.content)
+                if text:
+                    chunks.append(text)
+                    yield text
+        finally:
+            await stream.aclose()
+            for ollama_stream in opened:
+                await ollama_stream.aclose()
+        text = think_filter.flush()
+        if text:
+            chunks.append(text)
+            yield text
+        observe('chat.generate', time.perf_counter() - started)
+        _prompt_usage(packed, metadata)
+
+        if self.answer_cache is not None:
+            await asyncio.to_thread(self._remember, search_query, "".join(chunks).strip())
@@ -0,0 +1,112 @@
+import os
+import logging
+from langchain_core.documents import Document
+from .summarizer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_TOKENS = 1500
+# Overlaps shorter than this are ordinary repeated words, not splitter overlap
+MIN_OVERLAP_CHARS = 20
+# The splitter overlaps chunks by 150 characters; allow for some slack
+MAX_OVERLAP_CHARS = 400
+# A truncated last chunk shorter than this is not worth including
+MIN_PARTIAL_TOKENS = 48
+
+
+def _overlap_length(left, right):
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for length in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def _source_label(metadata):
+    """Short citation like "[biology.pdf, p. 4]" from chunk metadata, or ""."""
+    parts = []
+    if metadata.get('source'):
+        parts.append(os.path.basename(str(metadata['source'])))
+    if isinstance(metadata.get('page'), int):
+        parts.append(f"p. {metadata['page'] + 1}")  # Page numbers are 0-based
+    return f"[{', '.join(parts)}]" if parts else ""
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut ``text`` to about ``max_tokens`` at a sentence or word boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4]
+    for boundary in (". ", "\n", " "):
+        index = cut.rfind(boundary)
+        if index > len(cut) // 2:
+            return cut[:index + 1].rstrip()
+    return cut
+
+
+class PackedContext:
+    """The context text for a prompt and what went into it."""
+
+    def __init__(self, text, documents, tokens, duplicates, dropped):
+        self.text = text
+        self.documents = documents
+        self.tokens = tokens
+        self.duplicates = duplicates
+        self.dropped = dropped
+
+
+class ContextBuilder:
+    """Pack retrieved chunks into a prompt context of at most ``max_tokens``.
+
+    Chunks are taken in retrieval order. Repeated chunks are skipped and the
+    text a chunk shares with one already packed (the splitter's overlap) is
+    cut, so no passage is paid for twice. Each chunk is labelled with its
+    source file and page.
+    """
+
+    def __init__(self, max_tokens=DEFAULT_CONTEXT_TOKENS, separator="\n\n"):
+        self.max_tokens = max_tokens
+        self.separator = separator
+
+    def _dedupe(self, text, kept):
+        """Return ``text`` without what it shares with the kept chunks, or None if nothing new is left."""
+        for other in kept:
+            if text in other:
+                return None
+            text = text[_overlap_length(other, text):]
+            overlap = _overlap_length(text, other)
+            if overlap:
+                text = text[:-overlap]
+        text = text.strip()
+        return text if len(text) >= MIN_OVERLAP_CHARS else None
+
+    def build(self, documents):
+        """Return a ``PackedContext`` for ``documents``, best first."""
+        kept, parts, packed = [], [], []
+        tokens = duplicates = dropped = 0
+        separator_tokens = estimate_tokens(self.separator)
+
+        for document in documents:
+            text = self._dedupe(document.page_content.strip(), kept)
+            if text is None:
+                duplicates += 1
+                continue
+            label = _source_label(document.metadata)
+            header = f"{label}\n" if label else ""
+            cost = estimate_tokens(header + text) + (separator_tokens if parts else 0)
+            remaining = self.max_tokens - tokens
+            if cost > remaining:
+                budget = remaining - estimate_tokens(header) - (separator_tokens if parts else 0)
+                if budget < MIN_PARTIAL_TOKENS:
+                    dropped += 1
+                    continue
+                text = truncate_to_tokens(text, budget)
+                cost = estimate_tokens(header + text) + (separator_tokens if parts else 0)
+            kept.append(document.page_content)
+            parts.append(header + text)
+            packed.append(Document(id=document.id, page_content=text, metadata=document.metadata))
+            tokens += cost
+
+        if duplicates or dropped:
+            logger.debug("Context packing skipped %d duplicate and %d over-budget chunks", duplicates, dropped)
+        return PackedContext(self.separator.join(parts), packed, tokens, duplicates, dropped)
@@ -0,0 +1,130 @@
+import re
+import logging
+from django.conf import settings
+from .context_builder import truncate_to_tokens
+from .ollama_client import get_ollama_client, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from .telemetry import span
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_MODEL = "deepseek-r1:8b"
+DEFAULT_HISTORY_TURNS = 3
+DEFAULT_SUMMARY_TOKENS = 300
+# Each remembered message is cut to this, so one long answer cannot crowd out the rest
+MAX_MESSAGE_TOKENS = 200
+# Messages that left the history window but are not in the summary yet are
+# kept in shorter form, up to this many, until the summary job catches up
+MAX_PENDING_MESSAGES = 12
+PENDING_MESSAGE_TOKENS = 60
+
+# Words that usually point back at an earlier turn ("what about its structure?")
+_REFERRING_WORDS = frozenset(
+    "it its this that these those they them their he she him his her one ones "
+    "above previous earlier same former latter else also again".split()
+)
+# Openings of elliptical follow-ups ("and in animals?", "what about mitosis?")
+_FOLLOW_UP_OPENERS = ("and ", "but ", "so ", "what about ", "how about ", "why not ")
+
+
+def history_window():
+    """Number of recent messages the chatbot sees word for word."""
+    return 2 * getattr(settings, 'FLASHLEARN_CHAT_HISTORY_TURNS', DEFAULT_HISTORY_TURNS)
+
+
+def summary_tokens():
+    """Token limit of a session's running summary."""
+    return getattr(settings, 'FLASHLEARN_CHAT_SUMMARY_TOKENS', DEFAULT_SUMMARY_TOKENS)
+
+
+def needs_rewrite(question):
+    """Whether ``question`` probably depends on earlier turns to make sense.
+
+    Short questions are not enough on their own: "what is osmosis?" is
+    self-contained, and rewriting it would cost a model call before retrieval.
+    """
+    text = question.lower().strip()
+    words = re.findall(r"\w+", text)
+    return text.startswith(_FOLLOW_UP_OPENERS) or any(word in _REFERRING_WORDS for word in words)
+
+
+def _ask(prompt, priority, base_url=None):
+    """Send one prompt to the model and return the answer without <think> sections."""
+    response = get_ollama_client(base_url).chat(
+        model=CONVERSATION_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        priority=priority
+    )
+    return response['message']['content'].split("</think>")[-1].strip()
+
+
+def _speaker(role):
+    return "Student" if role == 'user' else "Assistant"
+
+
+class ConversationMemory:
+    """What the chatbot remembers of a session: a running summary and the latest turns.
+
+    ``turns`` and ``pending`` are lists of (role, content) pairs, oldest
+    first; ``pending`` holds the messages between the summary and the
+    turns that have not been summarized yet. All parts are bounded, so the
+    prompt does not grow with the length of the session.
+    """
+
+    def __init__(self, summary="", turns=(), summary_tokens=DEFAULT_SUMMARY_TOKENS, pending=()):
+        self.summary = summary
+        self.turns = list(turns)
+        self.summary_tokens = summary_tokens
+        self.pending = list(pending)[-MAX_PENDING_MESSAGES:]
+
+    def __bool__(self):
+        return bool(self.summary or self.pending or self.turns)
+
+    def format(self):
+        """Return the memory as prompt text."""
+        lines = []
+        if self.summary:
+            lines.append(f"Summary of the earlier conversation: {truncate_to_tokens(self.summary, self.summary_tokens)}")
+        for role, content in self.pending:
+            lines.append(f"{_speaker(role)}: {truncate_to_tokens(content, PENDING_MESSAGE_TOKENS)}")
+        for role, content in self.turns:
+            lines.append(f"{_speaker(role)}: {truncate_to_tokens(content, MAX_MESSAGE_TOKENS)}")
+        return "\n".join(lines)
+
+    def standalone_question(self, question, base_url=None):
+        """Rewrite a follow-up ``question`` so it can be searched for without the conversation.
+
+        Questions that look self-contained are returned unchanged, as is the
+        original question if the model fails.
+        """
+        if not self.turns or not needs_rewrite(question):
+            return question
+        prompt = (
+            "Rewrite the student's follow-up question as a single standalone question that can be "
+            "understood without the conversation. Reply with the question only.\n\n"
+            f"Conversation:\n{self.format()}\n\n"
+            f"Follow-up question: {question}"
+        )
+        try:
+            with span('chat.rewrite'):
+                rewritten = _ask(prompt, PRIORITY_INTERACTIVE, base_url)
+        except Exception as e:
+            logger.warning("Could not rewrite follow-up question: %s", e)
+            return question
+        lines = rewritten.strip().strip('"').splitlines()
+        return lines[0].strip() if lines and lines[0].strip() else question
+
+
+def update_running_summary(summary, turns, max_tokens=DEFAULT_SUMMARY_TOKENS, base_url=None):
+    """Fold ``turns`` (role, content) into ``summary`` and return the new summary."""
+    transcript = "\n".join(
+        f"{_speaker(role)}: {truncate_to_tokens(content, MAX_MESSAGE_TOKENS * 2)}"
+        for role, content in turns
+    )
+    prompt = (
+        f"Update the summary of a tutoring conversation about a textbook in at most {max_tokens * 3 // 4} words. "
+        "Keep the topics discussed, what the student asked and the key facts of the answers. "
+        "Reply with the summary only.\n\n"
+        f"Current summary: {summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}"
+    )
+    return truncate_to_tokens(_ask(prompt, PRIORITY_BATCH, base_url), max_tokens)
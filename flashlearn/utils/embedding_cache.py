@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of parameters per statement
+_LOOKUP_BATCH_SIZE = 500
+
+# Totals across every CachedEmbeddings in this process, which outlive evicted clients
+_stats_lock = threading.Lock()
+_stats = {
+    'documents': {'hits': 0, 'misses': 0},
+    'queries': {'hits': 0, 'misses': 0},
+}
+
+
+def embedding_cache_stats():
+    """Hits and misses of the embedding cache in this process, per path."""
+    with _stats_lock:
+        return {path: dict(counts) for path, counts in _stats.items()}
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def to_float32(vector):
+    """Round a vector to float32, the precision it is cached at."""
+    return array('f', vector).tolist()
+
+
+class EmbeddingCache:
+    """Disk-backed store of embeddings keyed by (model, SHA-256 of the text).
+
+    Vectors are stored as float32 blobs in SQLite. When the table grows past
+    ``max_entries`` the least recently used tenth is deleted. Rows are only
+    counted once the last count plus the rows inserted since could exceed
+    the limit, so inserts do not scan the table.
+    """
+
+    def __init__(self, path, max_entries=200_000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._size_bound = None  # last row count plus rows inserted since
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " text_hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, text_hash))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, model, texts):
+        """Return a list with the cached vector for each text, or None where missing."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        connection = self._connection()
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _LOOKUP_BATCH_SIZE):
+            batch = unique[start:start + _LOOKUP_BATCH_SIZE]
+            rows = connection.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                f"AND text_hash IN ({','.join('?' * len(batch))})",
+                [model, *batch]
+            )
+            for hash_, blob in rows:
+                found[hash_] = array('f', blob).tolist()
+
+        if found:
+            with self._write_lock, connection:
+                connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(time.time(), model, hash_) for hash_ in found]
+                )
+        return [found.get(hash_) for hash_ in hashes]
+
+    def put_many(self, model, texts, vectors):
+        """Store vectors for texts, then evict old entries if over budget."""
+        now = time.time()
+        rows = [
+            (model, text_hash(text), array('f', vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        connection = self._connection()
+        with self._write_lock, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        self._evict(len(rows))
+
+    def _evict(self, inserted):
+        with self._write_lock:
+            if self._size_bound is not None:
+                self._size_bound += inserted
+                if self._size_bound <= self.max_entries:
+                    return
+        connection = self._connection()
+        (count,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            excess = count - int(self.max_entries * 0.9)
+            with self._write_lock, connection:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+            count -= excess
+            logger.info("Evicted %d embeddings from the cache", excess)
+        with self._write_lock:
+            self._size_bound = count
+
+    def __len__(self):
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from an ``EmbeddingCache``."""
+
+    def __init__(self, embeddings, cache, model):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'documents': {'hits': 0, 'misses': 0},
+            'queries': {'hits': 0, 'misses': 0},
+        }
+
+    def _count(self, path, hits, misses):
+        with self._stats_lock:
+            self.stats[path]['hits'] += hits
+            self.stats[path]['misses'] += misses
+        with _stats_lock:
+            _stats[path]['hits'] += hits
+            _stats[path]['misses'] += misses
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self._count('documents', len(texts) - len(missing), len(missing))
+        if missing:
+            # Embed each distinct missing text once
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            # Round fresh vectors too, so results do not depend on the cache state
+            computed = dict(zip(missing_texts, map(to_float32, self.embeddings.embed_documents(missing_texts))))
+            self.cache.put_many(self.model, missing_texts, [computed[text] for text in missing_texts])
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+        return vectors
+
+    def embed_query(self, text):
+        # Some models embed queries differently from documents, so keep them apart
+        query_model = f"{self.model}#query"
+        (vector,) = self.cache.get_many(query_model, [text])
+        self._count('queries', int(vector is not None), int(vector is None))
+        if vector is None:
+            vector = to_float32(self.embeddings.embed_query(text))
+            self.cache.put_many(query_model, [text], [vector])
+        return vector
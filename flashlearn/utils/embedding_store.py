@@ -1,29 +1,221 @@
 import os
+import hashlib
+import logging
+from django.conf import settings
 from langchain_ollama import OllamaEmbeddings
 from langchain_chroma import Chroma
+from .cache import BoundedCache
+from .embedding_cache import EmbeddingCache, CachedEmbeddings
+from .ollama_client import get_ollama_client
+from .bm25_index import BM25Index, load_bm25_index
+from .hybrid_retriever import HybridRetriever
+from .telemetry import span
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "nomic-embed-text"
+ADD_BATCH_SIZE = 64
+
+# Embedding clients and Chroma clients are reused across requests in a process
+_embeddings = BoundedCache(max_size=4)
+_vector_stores = BoundedCache(
+    max_size=getattr(settings, 'FLASHLEARN_VECTOR_STORE_CACHE_SIZE', 8),
+    idle_seconds=getattr(settings, 'FLASHLEARN_CACHE_IDLE_SECONDS', None)
+)
+
+
+_embedding_cache = None
+
+
+def get_embedding_cache():
+    """Return the on-disk embedding cache, or None if it is disabled."""
+    global _embedding_cache
+    path = getattr(settings, 'FLASHLEARN_EMBEDDING_CACHE_PATH', None)
+    if not path:
+        return None
+    # The path is checked on every call so tests can point it elsewhere
+    if _embedding_cache is None or _embedding_cache.path != str(path):
+        _embedding_cache = EmbeddingCache(
+            path,
+            max_entries=getattr(settings, 'FLASHLEARN_EMBEDDING_CACHE_MAX_ENTRIES', 200_000)
+        )
+    return _embedding_cache
+
+
+def _create_embeddings(model, cache):
+    base_url = getattr(settings, 'OLLAMA_BASE_URL', None)
+    # Requests are batch priority unless made inside use_priority(), e.g. by the chatbot
+    embeddings = get_ollama_client(base_url).bind(OllamaEmbeddings(model=model, base_url=base_url))
+    if cache is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, cache, model)
+
+
+def get_embeddings(model=EMBEDDING_MODEL):
+    """Return a shared embeddings client for ``model``, backed by the embedding cache."""
+    cache = get_embedding_cache()
+    return _embeddings.get_or_create((model, cache and cache.path), lambda: _create_embeddings(model, cache))
+
+
+def document_collection_name(document):
+    """Name of the Chroma collection holding a document's chunks.
+
+    Collections are addressed by the PDF's content hash, so identical
+    uploads share one index. Documents without a hash get their own.
+    """
+    if document.sha256:
+        return f"pdf_{document.sha256[:32]}"
+    return f"document_{document.id}"
+
+
+def chunk_id(document, model=EMBEDDING_MODEL):
+    """Content hash of a chunk, used as its id in the collection."""
+    return hashlib.sha256(f"{model}\0{document.page_content}".encode('utf-8')).hexdigest()
+
+
+def invalidate_vector_stores(persist_directory=None, collection_name=None):
+    """Forget cached Chroma clients, e.g. after an index has been rebuilt."""
+    def match(key):
+        return ((persist_directory is None or key[0] == persist_directory)
+                and (collection_name is None or key[1] == collection_name))
+    _vector_stores.invalidate(match)
+
 
 class EmbeddingStore:
-    def __init__(self, persist_directory="./chroma_db"):
+    def __init__(self, collection_name, persist_directory="./chroma_db", model=EMBEDDING_MODEL,
+                 collection_metadata=None):
+        self.collection_name = collection_name
         self.persist_directory = persist_directory
-        self.embeddings = OllamaEmbeddings(model="nomic-embed-text")
-        
-    def create_vector_store(self, documents):
-        """Create a vector store from documents."""
-        vector_store = Chroma.from_documents(
-            documents=documents,
-            embedding=self.embeddings,
-            persist_directory=self.persist_directory
-        )
-        return vector_store
-    
-    def get_retriever(self):
-        """Get a retriever for the vector store."""
-        try:
-            vector_store = Chroma(
+        self.model = model
+        self.collection_metadata = collection_metadata
+        self.embeddings = get_embeddings(model)
+
+    def sync_vector_store(self, documents, signature=None, batch_size=ADD_BATCH_SIZE, progress=None):
+        """Bring the collection in line with ``documents``, embedding only new chunks.
+
+        ``documents`` may be any iterable, e.g. a generator yielding chunks
+        while the PDF is still being parsed; new chunks are embedded and
+        added in batches of ``batch_size`` as they arrive, and
+        ``progress(last_document, stats)`` is called after each batch.
+        Chunks are stored under their content hash, so chunks already in the
+        collection are kept as they are and chunks no longer present are
+        removed. ``signature`` is recorded on the collection once it is
+        complete; see ``is_indexed``.
+        """
+        vector_store = self.get_vector_store()
+        existing = set(vector_store.get(include=[])['ids'])
+        seen = set()
+        batch, batch_ids = [], []
+        stats = {'added': 0, 'removed': 0, 'unchanged': 0}
+
+        def flush(last_document):
+            if batch:
+                with span('embedding.add_batch'):
+                    vector_store.add_documents(batch, ids=batch_ids)
+                stats['added'] += len(batch)
+                batch.clear()
+                batch_ids.clear()
+            if progress and last_document is not None:
+                progress(last_document, stats)
+
+        document = None
+        for document in documents:
+            id_ = chunk_id(document, self.model)
+            if id_ in seen:
+                continue
+            seen.add(id_)
+            if id_ in existing:
+                stats['unchanged'] += 1
+                continue
+            batch.append(document)
+            batch_ids.append(id_)
+            if len(batch) >= batch_size:
+                flush(document)
+        flush(document)
+
+        stale_ids = list(existing - seen)
+        if stale_ids:
+            vector_store.delete(ids=stale_ids)
+            stats['removed'] = len(stale_ids)
+        if signature:
+            vector_store._collection.modify(metadata={'index_signature': signature})
+        return stats
+
+    def index_signature(self):
+        """Signature recorded by the last complete ``sync_vector_store``, if any."""
+        metadata = self.get_vector_store()._collection.metadata or {}
+        return metadata.get('index_signature')
+
+    def is_indexed(self, signature):
+        """Whether the collection was completely indexed with ``signature``."""
+        return self.index_signature() == signature
+
+    @property
+    def lexical_index_path(self):
+        return os.path.join(self.persist_directory, 'bm25', f"{self.collection_name}.json.gz")
+
+    def get_lexical_index(self):
+        """Return the collection's BM25 index, or None if it has not been built."""
+        return load_bm25_index(self.lexical_index_path)
+
+    def build_lexical_index(self, signature=None):
+        """(Re)build the BM25 index from the chunks stored in the collection.
+
+        Does nothing if the index was already built for ``signature``.
+        """
+        if signature:
+            index = self.get_lexical_index()
+            if index is not None and index.signature == signature:
+                return index
+        with span('bm25.build'):
+            stored = self.get_vector_store().get(include=["documents", "metadatas"])
+            index = BM25Index.build(stored['ids'], stored['documents'], stored['metadatas'], signature=signature)
+            index.save(self.lexical_index_path)
+        return index
+
+    def get_vector_store(self):
+        """Return the cached Chroma client for this store's collection."""
+        return _vector_stores.get_or_create(
+            (self.persist_directory, self.collection_name, self.model),
+            lambda: Chroma(
+                collection_name=self.collection_name,
                 embedding_function=self.embeddings,
-                persist_directory=self.persist_directory
+                persist_directory=self.persist_directory,
+                collection_metadata=self.collection_metadata
             )
-            return vector_store.as_retriever(search_type="mmr", search_kwargs={"k": 3})
+        )
+
+    def delete_collection(self):
+        """Drop the collection and every vector in it."""
+        try:
+            self.get_vector_store().delete_collection()
         except Exception as e:
-            print(f"Error initializing vector store: {e}")
-            return None
\ No newline at end of file
+            logger.warning("Could not delete collection %s: %s", self.collection_name, e)
+        invalidate_vector_stores(self.persist_directory, self.collection_name)
+        try:
+            os.remove(self.lexical_index_path)
+        except FileNotFoundError:
+            pass
+
+    def get_retriever(self, k=3):
+        """Get a retriever for the vector store.
+
+        Collections with a BM25 index get a hybrid lexical + vector retriever
+        unless FLASHLEARN_RETRIEVAL_MODE is 'vector'.
+        """
+        try:
+            vector_store = self.get_vector_store()
+            lexical_index = None
+            if getattr(settings, 'FLASHLEARN_RETRIEVAL_MODE', 'hybrid') == 'hybrid':
+                lexical_index = self.get_lexical_index()
+            if lexical_index is None:
+                return vector_store.as_retriever(search_type="mmr", search_kwargs={"k": k})
+            return HybridRetriever(
+                vector_store=vector_store,
+                lexical_index=lexical_index,
+                k=k,
+                dense_timeout=getattr(settings, 'FLASHLEARN_DENSE_SEARCH_TIMEOUT', 2.0)
+            )
+        except Exception:
+            logger.exception("Could not open vector store %s", self.collection_name)
+            return None
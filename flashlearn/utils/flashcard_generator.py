@@ -1,62 +1,324 @@
 from transformers import T5ForConditionalGeneration, T5Tokenizer
 import torch
+import os
 import re
-import ollama
+import math
+import time
+import shutil
+import logging
+from .model_registry import get_registry
+from .paragraph_selection import rank_paragraphs, NearDuplicateFilter
+from .telemetry import traced
+
+logger = logging.getLogger(__name__)
+
+QG_MODEL_NAME = "valhalla/t5-base-qg-hl"
+QA_MODEL_NAME = "valhalla/t5-small-qa-qg-hl"
+DEFAULT_BATCH_SIZE = 8
+# 'torch' runs the models as published, 'int8' dynamically quantizes their
+# linear layers, 'onnx' runs an ONNX Runtime export; the last two are CPU-only
+T5_BACKENDS = ('torch', 'int8', 'onnx')
+
+# How questions and answers are decoded. 'beam' is the most thorough and the
+# slowest; 'early_exit' decodes greedily and only retries the paragraphs
+# whose greedy question was rejected, with a small beam over the same
+# encoder output.
+DECODING_PROFILES = {
+    'beam': {'qg_beams': 4, 'qg_sequences': 2, 'qa_beams': 4, 'retry_beams': 0},
+    'small_beam': {'qg_beams': 2, 'qg_sequences': 2, 'qa_beams': 2, 'retry_beams': 0},
+    'greedy': {'qg_beams': 1, 'qg_sequences': 1, 'qa_beams': 1, 'retry_beams': 0},
+    'early_exit': {'qg_beams': 1, 'qg_sequences': 1, 'qa_beams': 1, 'retry_beams': 2},
+}
+DEFAULT_DECODING_PROFILE = 'beam'
+# Paragraphs taken per micro-batch, relative to what the acceptance rate predicts
+OVERGENERATION_MARGIN = 1.25
+MIN_ACCEPTANCE_RATE = 0.05
+# Prior for the acceptance rate as (paragraphs, cards): one card per two
+# paragraphs. Each call updates it with its own counts only, so how a
+# summary is batched does not depend on what the process generated before.
+ACCEPTANCE_PRIOR = (2, 1)
+
+
+def is_valid_question(question):
+    return len(question) >= 10 and question.endswith('?')
+
+
+def is_valid_answer(answer):
+    return 5 < len(answer) <= 200
+
+
+def _load_t5(model_name, device, backend='torch', artifact_dir=None, threads=None):
+    """Load a T5 tokenizer and model onto the given device with the given backend."""
+    tokenizer = T5Tokenizer.from_pretrained(model_name)
+    if backend == 'onnx':
+        return tokenizer, _load_onnx_t5(model_name, artifact_dir, threads)
+    model = T5ForConditionalGeneration.from_pretrained(model_name).to(device)
+    model.eval()
+    if backend == 'int8':
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return tokenizer, model
+
+
+def _load_onnx_t5(model_name, artifact_dir, threads=None):
+    """Load the ONNX Runtime export of a T5 model, exporting it on first use.
+
+    Exports are kept in ``artifact_dir`` so only the first load pays for them.
+    """
+    # Imported here so ONNX Runtime stays an optional dependency
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    session_options = onnxruntime.SessionOptions()
+    if threads:
+        session_options.intra_op_num_threads = threads
+    path = os.path.join(artifact_dir, model_name.replace('/', '--'))
+    if not os.path.exists(os.path.join(path, 'config.json')):
+        logger.info("Exporting %s to ONNX in %s", model_name, path)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True).save_pretrained(temp_path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temp_path, path)
+    return ORTModelForSeq2SeqLM.from_pretrained(path, session_options=session_options)
+
 
 class FlashcardGenerator:
-    def __init__(self):
+    def __init__(self, registry=None, batch_size=None, backend=None, decoding=None, embeddings=None):
+        from django.conf import settings
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.qg_model_name = "valhalla/t5-base-qg-hl"
-        self.qa_model_name = "valhalla/t5-small-qa-qg-hl"
-        
-        # Load models and tokenizers
-        self.qg_tokenizer = T5Tokenizer.from_pretrained(self.qg_model_name)
-        self.qg_model = T5ForConditionalGeneration.from_pretrained(self.qg_model_name).to(self.device)
-        
-        self.qa_tokenizer = T5Tokenizer.from_pretrained(self.qa_model_name)
-        self.qa_model = T5ForConditionalGeneration.from_pretrained(self.qa_model_name).to(self.device)
-
-    def generate_flashcards(self, summary_text, num_cards=5):
-        """Generate flashcards from a summary text."""
-        sentences = re.split(r'(?<=[.!?])\s+', summary_text)
-        paragraphs = []
-        current_paragraph = ""
-
-        for sentence in sentences:
-            current_paragraph += sentence + " "
-            if len(current_paragraph.split()) >= 30:
-                paragraphs.append(current_paragraph.strip())
-                current_paragraph = ""
-
-        if current_paragraph.strip():
-            paragraphs.append(current_paragraph.strip())
+        self.batch_size = batch_size or getattr(settings, 'FLASHLEARN_FLASHCARD_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.decoding = decoding or getattr(settings, 'FLASHLEARN_FLASHCARD_DECODING', DEFAULT_DECODING_PROFILE)
+        if self.decoding not in DECODING_PROFILES:
+            raise ValueError(f"Unknown decoding profile {self.decoding!r}; expected one of {tuple(DECODING_PROFILES)}")
+        self.qg_model_name = QG_MODEL_NAME
+        self.qa_model_name = QA_MODEL_NAME
+        self.backend = backend or getattr(settings, 'FLASHLEARN_T5_BACKEND', 'torch')
+        if self.backend not in T5_BACKENDS:
+            raise ValueError(f"Unknown T5 backend {self.backend!r}; expected one of {T5_BACKENDS}")
+        if self.device == "cuda" and self.backend != 'torch':
+            logger.warning("T5 backend %r is CPU-only; using 'torch' on the GPU", self.backend)
+            self.backend = 'torch'
+        threads = getattr(settings, 'FLASHLEARN_T5_THREADS', None)
+        if threads and self.backend != 'onnx':
+            torch.set_num_threads(threads)
+        artifact_dir = getattr(settings, 'FLASHLEARN_T5_ARTIFACT_DIR', 'model_cache')
+        # Embeddings drive paragraph selection and question de-duplication
+        if embeddings is None and getattr(settings, 'FLASHLEARN_FLASHCARD_SELECTION', False):
+            from .embedding_store import get_embeddings
+            embeddings = get_embeddings()
+        self.embeddings = embeddings
+
+        # Models are shared across generators through the process-wide registry
+        registry = registry or get_registry()
+        self.qg_tokenizer, self.qg_model = registry.get(
+            ("t5", self.qg_model_name, self.device, self.backend),
+            lambda: _load_t5(self.qg_model_name, self.device, self.backend, artifact_dir, threads)
+        )
+        self.qa_tokenizer, self.qa_model = registry.get(
+            ("t5", self.qa_model_name, self.device, self.backend),
+            lambda: _load_t5(self.qa_model_name, self.device, self.backend, artifact_dir, threads)
+        )
 
-        flashcards = []
-        cards_generated = 0
+    @traced('flashcards.generate')
+    def generate_flashcards(self, summary_text, num_cards=5, batch_size=None, progress=None, stats=None):
+        """Generate flashcards from a summary text.
 
-        for paragraph in paragraphs:
-            if cards_generated >= num_cards:
-                break
+        With embeddings, paragraphs are taken in the order chosen by
+        ``_select_paragraphs`` and questions too similar to the question of
+        an earlier card are dropped; without, paragraphs are taken in
+        document order. Paragraphs are sent through question generation in
+        micro-batches of at most ``batch_size``; the questions that pass the
+        filters are then answered in one batched QA pass. Each micro-batch
+        only takes as many paragraphs as the acceptance rate seen so far in
+        this call says are needed for the remaining cards, plus a margin. Work stops once
+        ``num_cards`` are found, and cards are returned in document order.
+        ``progress(cards, num_cards)`` is called after every micro-batch.
+        If ``stats`` is a dict, it is filled with counts, timings and the
+        acceptance rate of this call.
+        """
+        batch_size = batch_size or self.batch_size
+        paragraphs = split_paragraphs(summary_text)
+        order = self._select_paragraphs(paragraphs)
+        duplicates = NearDuplicateFilter()
+        flashcards = []  # (paragraph index, question, answer)
+        counts = {'paragraphs': 0, 'questions': 0, 'valid_questions': 0, 'duplicate_questions': 0,
+                  'valid_answers': 0}
+        started = time.perf_counter()
 
-            qg_input = f"generate question: {paragraph}"
-            qg_tokens = self.qg_tokenizer(qg_input, return_tensors="pt", max_length=512, truncation=True).to(self.device)
-            qg_outputs = self.qg_model.generate(qg_tokens.input_ids, max_length=64, num_return_sequences=2, num_beams=4, early_stopping=True)
+        start = 0
+        while start < len(order) and len(flashcards) < num_cards:
+            prior_paragraphs, prior_cards = ACCEPTANCE_PRIOR
+            expected = max((prior_cards + counts['valid_answers']) / (prior_paragraphs + counts['paragraphs']),
+                           MIN_ACCEPTANCE_RATE)
+            wanted = math.ceil((num_cards - len(flashcards)) / expected * OVERGENERATION_MARGIN)
+            indices = order[start:start + min(batch_size, wanted)]
+            start += len(indices)
+            batch = [paragraphs[i] for i in indices]
 
-            for qg_output in qg_outputs:
-                if cards_generated >= num_cards:
-                    break
+            candidates = []
+            for index, questions in zip(indices, self._generate_questions(batch)):
+                counts['questions'] += len(questions)
+                for question in questions:
+                    if is_valid_question(question):
+                        candidates.append((index, question))
+            counts['valid_questions'] += len(candidates)
+            unique = self._drop_duplicate_questions(candidates, duplicates)
+            counts['duplicate_questions'] += len(candidates) - len(unique)
 
-                question = self.qg_tokenizer.decode(qg_output, skip_special_tokens=True)
-                if len(question) < 10 or not question.endswith('?'):
+            answers = self._answer_questions([(question, paragraphs[index]) for index, question, _ in unique])
+            accepted = []
+            for (index, question, vector), answer in zip(unique, answers):
+                if not is_valid_answer(answer):
                     continue
+                # Only questions that become cards rule out their paraphrases
+                if vector is not None and not duplicates.add(vector):
+                    counts['duplicate_questions'] += 1
+                    continue
+                accepted.append((index, question, answer))
+            flashcards.extend(accepted[:num_cards - len(flashcards)])
+            counts['paragraphs'] += len(batch)
+            counts['valid_answers'] += len(accepted)
+
+            if progress:
+                progress(len(flashcards), num_cards)
+
+        if stats is not None:
+            seconds = time.perf_counter() - started
+            stats.update(counts, decoding=self.decoding, available_paragraphs=len(paragraphs),
+                         selected_paragraphs=len(order), cards=len(flashcards), seconds=seconds)
+            stats['cards_per_second'] = len(flashcards) / seconds if seconds else 0.0
+            stats['acceptance_rate'] = counts['valid_answers'] / counts['paragraphs'] if counts['paragraphs'] else 0.0
+        # sorted() is stable, so cards from one paragraph keep their order
+        return [(question, answer) for _, question, answer in sorted(flashcards, key=lambda card: card[0])]
+
+    @traced('flashcards.paragraph_selection')
+    def _select_paragraphs(self, paragraphs):
+        """Return the indices of the paragraphs to generate from, best first.
+
+        The paragraphs are embedded in one call and ranked by maximal
+        marginal relevance, leaving out near-duplicates. Falls back to
+        document order without embeddings or if embedding fails.
+        """
+        if self.embeddings is None or len(paragraphs) < 2:
+            return list(range(len(paragraphs)))
+        try:
+            vectors = self.embeddings.embed_documents(paragraphs)
+        except Exception as e:
+            logger.warning("Paragraph embedding failed, using document order: %s", e)
+            return list(range(len(paragraphs)))
+        return rank_paragraphs(vectors)
+
+    def _drop_duplicate_questions(self, candidates, duplicates):
+        """Keep the (index, question) candidates not too similar to earlier cards' questions.
+
+        Returns (index, question, vector) triples; the vector is None when
+        there are no embeddings to compare with.
+        """
+        if self.embeddings is None or not candidates:
+            return [(index, question, None) for index, question in candidates]
+        try:
+            vectors = self.embeddings.embed_documents([question for _, question in candidates])
+        except Exception as e:
+            logger.warning("Question embedding failed, keeping duplicates: %s", e)
+            return [(index, question, None) for index, question in candidates]
+        return [(index, question, vector) for (index, question), vector, keep
+                in zip(candidates, vectors, duplicates.keep(vectors)) if keep]
+
+    @traced('flashcards.question_generation')
+    def _generate_questions(self, paragraphs):
+        """Generate candidate questions for each paragraph in batched calls.
+
+        With a retry beam the encoder runs once: a greedy pass decodes one
+        question per paragraph, and only the paragraphs whose question fails
+        the filters are decoded again with a beam from the same encoder output.
+        """
+        profile = DECODING_PROFILES[self.decoding]
+        inputs = [f"generate question: {paragraph}" for paragraph in paragraphs]
+        qg_tokens = self.qg_tokenizer(
+            inputs, return_tensors="pt", padding=True, max_length=512, truncation=True
+        ).to(self.device)
+        with torch.inference_mode():
+            if not profile['retry_beams']:
+                return self._decode_questions(
+                    len(paragraphs), profile['qg_beams'], profile['qg_sequences'],
+                    input_ids=qg_tokens.input_ids, attention_mask=qg_tokens.attention_mask
+                )
+
+            encoder_outputs = self.qg_model.get_encoder()(
+                input_ids=qg_tokens.input_ids, attention_mask=qg_tokens.attention_mask
+            )
+            questions = self._decode_questions(
+                len(paragraphs), 1, 1, encoder_outputs=encoder_outputs, attention_mask=qg_tokens.attention_mask
+            )
+            retry = [i for i, (question,) in enumerate(questions) if not is_valid_question(question)]
+            if retry:
+                beams = profile['retry_beams']
+                retried = self._decode_questions(
+                    len(retry), beams, beams,
+                    encoder_outputs=type(encoder_outputs)(last_hidden_state=encoder_outputs.last_hidden_state[retry]),
+                    attention_mask=None if qg_tokens.attention_mask is None else qg_tokens.attention_mask[retry]
+                )
+                for i, candidates in zip(retry, retried):
+                    questions[i] = candidates
+        return questions
+
+    def _decode_questions(self, count, num_beams, num_sequences, **inputs):
+        """Run question generation and group the decoded questions per input."""
+        outputs = self.qg_model.generate(
+            **inputs,
+            max_length=64,
+            num_return_sequences=num_sequences,
+            num_beams=num_beams,
+            early_stopping=num_beams > 1
+        )
+        questions = self.qg_tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        # generate() returns the sequences of each input next to each other
+        return [questions[i * num_sequences:(i + 1) * num_sequences] for i in range(count)]
+
+    @traced('flashcards.answer_generation')
+    def _answer_questions(self, candidates):
+        """Answer (question, paragraph) pairs in one batched call."""
+        if not candidates:
+            return []
+        inputs = [f"question: {question} context: {paragraph}" for question, paragraph in candidates]
+        qa_tokens = self.qa_tokenizer(
+            inputs, return_tensors="pt", padding=True, max_length=512, truncation=True
+        ).to(self.device)
+        with torch.inference_mode():
+            qa_outputs = self.qa_model.generate(
+                qa_tokens.input_ids,
+                attention_mask=qa_tokens.attention_mask,
+                max_length=128,
+                num_beams=DECODING_PROFILES[self.decoding]['qa_beams'],
+                early_stopping=DECODING_PROFILES[self.decoding]['qa_beams'] > 1
+            )
+        return self.qa_tokenizer.batch_decode(qa_outputs, skip_special_tokens=True)
+
+
+def split_paragraphs(text, min_words=30):
+    """Group sentences into paragraphs of at least ``min_words`` words."""
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    paragraphs = []
+    current_paragraph = ""
+
+    for sentence in sentences:
+        current_paragraph += sentence + " "
+        if len(current_paragraph.split()) >= min_words:
+            paragraphs.append(current_paragraph.strip())
+            current_paragraph = ""
 
-                qa_input = f"question: {question} context: {paragraph}"
-                qa_tokens = self.qa_tokenizer(qa_input, return_tensors="pt", max_length=512, truncation=True).to(self.device)
-                qa_outputs = self.qa_model.generate(qa_tokens.input_ids, max_length=128, num_beams=4, early_stopping=True)
-                answer = self.qa_tokenizer.decode(qa_outputs[0], skip_special_tokens=True)
+    if current_paragraph.strip():
+        paragraphs.append(current_paragraph.strip())
 
-                if 5 < len(answer) <= 200:
-                    flashcards.append((question, answer))
-                    cards_generated += 1
+    return paragraphs
 
-        return flashcards
\ No newline at end of file
+def warm_up_models():
+    """Load the flashcard models into the registry so the first request is fast."""
+    from django.conf import settings
+    if not getattr(settings, 'FLASHLEARN_WARM_UP_MODELS', False):
+        return
+    try:
+        FlashcardGenerator()
+    except Exception as e:
+        logger.warning("Flashcard model warm-up failed: %s", e)
+        return
+    logger.info("Model registry warm: %s", get_registry().metrics())
\ No newline at end of file
@@ -0,0 +1,78 @@
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Optional
+from langchain_core.retrievers import BaseRetriever
+from .telemetry import span, traced
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60
+
+# Dense searches run here so a slow embedding model can be abandoned
+_dense_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='dense-search')
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K):
+    """Merge ranked lists of Documents by summing 1 / (k + rank) per chunk id."""
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document.id or document.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(key, document)
+    ranked = sorted(scores, key=lambda key: -scores[key])
+    return [documents[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 and vector search over one collection, fused by reciprocal rank.
+
+    The dense search gets ``dense_timeout`` seconds. If the embedding model
+    does not answer in time, the lexical results are returned alone and
+    dense search is skipped for ``slow_cooldown`` seconds, so questions stay
+    fast while the embedding service is overloaded.
+    """
+
+    vector_store: Any
+    lexical_index: Any
+    k: int = 3
+    fetch_k: int = 20
+    rrf_k: int = RRF_K
+    dense_timeout: Optional[float] = 2.0
+    slow_cooldown: float = 30.0
+    _slow_until: float = 0.0
+    _lock: Any = None
+
+    def model_post_init(self, __context):
+        self._lock = threading.Lock()
+
+    @traced('retrieval.dense')
+    def _dense_search(self, query):
+        if time.monotonic() < self._slow_until:
+            return None
+        # Run in a copy of this context so the caller's request priority applies
+        future = _dense_pool.submit(
+            contextvars.copy_context().run, self.vector_store.similarity_search, query, k=self.fetch_k
+        )
+        try:
+            return future.result(timeout=self.dense_timeout)
+        except TimeoutError:
+            with self._lock:
+                self._slow_until = time.monotonic() + self.slow_cooldown
+            logger.warning("Dense search took over %.1fs; using lexical results for %.0fs",
+                           self.dense_timeout, self.slow_cooldown)
+        except Exception as e:
+            logger.warning("Dense search failed, using lexical results: %s", e)
+        return None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with span('retrieval.bm25'):
+            lexical = self.lexical_index.get_documents(query, self.fetch_k)
+        dense = self._dense_search(query)
+        if dense is None:
+            return lexical[:self.k]
+        return reciprocal_rank_fusion([dense, lexical], k=self.rrf_k)[:self.k]
@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate_size(obj):
+    """Estimate the resident size in bytes of a loaded model (or tuple of them)."""
+    if isinstance(obj, (tuple, list)):
+        return sum(_estimate_size(item) for item in obj)
+    size = 0
+    if hasattr(obj, 'parameters'):
+        size += sum(p.numel() * p.element_size() for p in obj.parameters())
+    if hasattr(obj, 'buffers'):
+        size += sum(b.numel() * b.element_size() for b in obj.buffers())
+    return size
+
+
+def process_rss_bytes():
+    """Return the current resident set size of this process, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is the peak, reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models with a memory budget and LRU eviction."""
+
+    def __init__(self, memory_budget_mb=None):
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self._entries = OrderedDict()  # key -> (model, size_bytes)
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self.load_seconds = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        """Return the model stored under ``key``, calling ``loader()`` on first use."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other models stay available,
+        # but only once per key when several threads ask at the same time.
+        with load_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+                self.misses += 1
+
+            start = time.perf_counter()
+            model = loader()
+            elapsed = time.perf_counter() - start
+            size = _estimate_size(model)
+
+            with self._lock:
+                self.load_seconds[key] = elapsed
+                self._entries[key] = (model, size)
+                self._evict_over_budget(keep=key)
+                self._load_locks.pop(key, None)
+
+        logger.info("Loaded %s in %.2fs (%.1f MB)", key, elapsed, size / (1024 * 1024))
+        return model
+
+    def _evict_over_budget(self, keep):
+        """Drop least-recently-used entries until the registry fits its budget."""
+        if self.memory_budget is None:
+            return
+        while self.resident_bytes() > self.memory_budget:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                logger.warning("%s alone exceeds the model memory budget", keep)
+                break
+            self.evict(oldest)
+
+    def evict(self, key):
+        """Remove a model from the registry."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.evictions += 1
+                logger.info("Evicted %s from model registry", key)
+
+    def clear(self):
+        """Remove every model from the registry."""
+        with self._lock:
+            for key in list(self._entries):
+                self.evict(key)
+
+    def resident_bytes(self):
+        """Total estimated size of the models currently held."""
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def metrics(self):
+        """Return load-time and memory metrics for the registry."""
+        with self._lock:
+            return {
+                'models': {
+                    str(key): {
+                        'size_bytes': size,
+                        'load_seconds': self.load_seconds.get(key),
+                    }
+                    for key, (_, size) in self._entries.items()
+                },
+                'resident_bytes': self.resident_bytes(),
+                'memory_budget_bytes': self.memory_budget,
+                'process_rss_bytes': process_rss_bytes(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide model registry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from django.conf import settings
+                _registry = ModelRegistry(
+                    memory_budget_mb=getattr(settings, 'FLASHLEARN_MODEL_MEMORY_BUDGET_MB', None)
+                )
+    return _registry
@@ -0,0 +1,368 @@
+"""Shared client for the local Ollama server.
+
+Chat, summarization and embeddings all talk to one Ollama process, so they
+share one pooled HTTP client per process and one ``PriorityGate`` that
+limits how many requests are in flight. Interactive requests (the chatbot)
+are let through before queued batch work (summaries, ingestion).
+"""
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+import weakref
+
+import httpx
+import ollama
+
+from .telemetry import observe, span
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Server responses worth retrying: overloaded, restarting or behind a proxy
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_priority = contextvars.ContextVar('ollama_priority', default=PRIORITY_BATCH)
+_open_streams = contextvars.ContextVar('ollama_open_streams', default=None)
+
+
+@contextlib.contextmanager
+def use_priority(priority):
+    """Send Ollama requests made inside the block with ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextlib.contextmanager
+def track_streams(streams):
+    """Append the streams opened inside the block to the list ``streams``.
+
+    Wrappers such as langchain stop reading a stream without closing it, so
+    a caller abandoning an answer closes the streams it tracked itself;
+    otherwise their gate slots stay taken until garbage collection.
+    """
+    token = _open_streams.set(streams)
+    try:
+        yield streams
+    finally:
+        _open_streams.reset(token)
+
+
+class _Waiter:
+    def __init__(self, priority, loop=None):
+        self.priority = priority
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_set_result, self.event)
+
+
+def _set_result(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class PriorityGate:
+    """Semaphore for threads and coroutines that serves lower priority values first."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = []
+        self._counter = itertools.count()
+
+    def _enter_or_wait(self, waiter):
+        with self._lock:
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                return True
+            heapq.heappush(self._waiting, (waiter.priority, next(self._counter), waiter))
+            return False
+
+    def acquire(self, priority=PRIORITY_BATCH):
+        waiter = _Waiter(priority)
+        if not self._enter_or_wait(waiter):
+            waiter.event.wait()
+
+    async def acquire_async(self, priority=PRIORITY_BATCH):
+        waiter = _Waiter(priority, asyncio.get_running_loop())
+        if self._enter_or_wait(waiter):
+            return
+        try:
+            await waiter.event
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiting:
+                _, _, waiter = heapq.heappop(self._waiting)
+                if not waiter.cancelled:
+                    # Hand the slot straight to the next waiter
+                    waiter.granted = True
+                    waiter.wake()
+                    return
+            self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'limit': self.limit, 'active': self._active, 'waiting': len(self._waiting)}
+
+
+def _should_retry(error):
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+class OllamaClient:
+    """Pooled, rate-limited access to one Ollama server.
+
+    ``sync_client()`` and ``async_client()`` return drop-in replacements for
+    ``ollama.Client`` and ``ollama.AsyncClient`` whose ``chat``, ``generate``
+    and ``embed`` calls wait for the gate, time out after ``timeout`` seconds
+    and are retried up to ``retries`` times on connection errors and
+    overloaded-server responses. Streams are retried only until the first
+    chunk arrives and hold their slot until they are exhausted or closed.
+    """
+
+    GATED_METHODS = ('chat', 'generate', 'embed', 'embeddings')
+
+    def __init__(self, host=None, timeout=300, retries=2, backoff=0.5, max_concurrency=2,
+                 max_connections=8, gate=None):
+        self.host = host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.gate = gate or PriorityGate(max_concurrency)
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = ollama.Client(host=host, timeout=timeout, limits=self._limits)
+        # httpx async connections belong to the event loop that opened them
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+
+    def _raw_async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = ollama.AsyncClient(host=self.host, timeout=self.timeout, limits=self._limits)
+                self._async_clients[loop] = client
+            return client
+
+    def sync_client(self, priority=None):
+        """Gated stand-in for ``ollama.Client``; ``priority`` None follows ``use_priority``."""
+        return _GatedClient(self, priority)
+
+    def async_client(self, priority=None):
+        """Gated stand-in for ``ollama.AsyncClient``."""
+        return _AsyncGatedClient(self, priority)
+
+    def chat(self, priority=None, **kwargs):
+        return self.sync_client(priority).chat(**kwargs)
+
+    async def achat(self, priority=None, **kwargs):
+        return await self.async_client(priority).chat(**kwargs)
+
+    def embed(self, priority=None, **kwargs):
+        return self.sync_client(priority).embed(**kwargs)
+
+    async def aembed(self, priority=None, **kwargs):
+        return await self.async_client(priority).embed(**kwargs)
+
+    def bind(self, model, priority=None):
+        """Point a langchain ``ChatOllama`` or ``OllamaEmbeddings`` at this client."""
+        model._client = self.sync_client(priority)
+        model._async_client = self.async_client(priority)
+        return model
+
+    def _retry_delay(self, attempt, error):
+        delay = self.backoff * 2 ** attempt
+        reason = f"HTTP {error.status_code}" if isinstance(error, ollama.ResponseError) else error
+        logger.warning("Ollama request failed (%s), retrying in %.1fs", reason, delay)
+        return delay
+
+
+class _GatedStream:
+    """Streamed response that gives its gate slot back once exhausted, failed or closed."""
+
+    def __init__(self, gate, first, rest):
+        self._gate = gate
+        self._first = first
+        self._rest = rest
+        self._lock = threading.Lock()
+        self._released = False
+        streams = _open_streams.get()
+        if streams is not None:
+            streams.append(self)
+
+    def _release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._gate.release()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._released:
+            raise StopIteration
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        try:
+            return next(self._rest)
+        except BaseException:
+            self._release()
+            raise
+
+    def close(self):
+        self._release()
+        if hasattr(self._rest, 'close'):
+            self._rest.close()
+
+    def __del__(self):
+        self._release()
+
+
+class _AsyncGatedStream(_GatedStream):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._released:
+            raise StopAsyncIteration
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        try:
+            return await anext(self._rest)
+        except BaseException:
+            self._release()
+            raise
+
+    async def aclose(self):
+        self._release()
+        if hasattr(self._rest, 'aclose'):
+            await self._rest.aclose()
+
+
+class _GatedClient:
+    def __init__(self, owner, priority):
+        self._owner = owner
+        self._priority = priority
+
+    def __getattr__(self, name):
+        method = getattr(self._owner._client, name)
+        if name not in OllamaClient.GATED_METHODS:
+            return method
+        return lambda *args, **kwargs: self._call(name, method, args, kwargs)
+
+    def _call(self, name, method, args, kwargs):
+        owner = self._owner
+        priority = self._priority if self._priority is not None else _priority.get()
+        waited = time.perf_counter()
+        owner.gate.acquire(priority)
+        observe('ollama.queue_wait', time.perf_counter() - waited)
+        streaming = False
+        try:
+            # Streams are timed until their first chunk
+            with span(f'ollama.{name}'):
+                for attempt in itertools.count():
+                    try:
+                        result = method(*args, **kwargs)
+                        if not kwargs.get('stream'):
+                            return result
+                        # The request is only sent when the stream is first read
+                        first = next(result, None)
+                        streaming = True
+                        return _GatedStream(owner.gate, first, result)
+                    except Exception as e:
+                        if attempt >= owner.retries or not _should_retry(e):
+                            raise
+                        time.sleep(owner._retry_delay(attempt, e))
+        finally:
+            if not streaming:
+                owner.gate.release()
+
+
+class _AsyncGatedClient:
+    def __init__(self, owner, priority):
+        self._owner = owner
+        self._priority = priority
+
+    def __getattr__(self, name):
+        if name not in OllamaClient.GATED_METHODS:
+            return getattr(self._owner._raw_async_client(), name)
+
+        async def call(*args, **kwargs):
+            return await self._call(name, args, kwargs)
+        return call
+
+    async def _call(self, name, args, kwargs):
+        owner = self._owner
+        priority = self._priority if self._priority is not None else _priority.get()
+        method = getattr(owner._raw_async_client(), name)
+        waited = time.perf_counter()
+        await owner.gate.acquire_async(priority)
+        observe('ollama.queue_wait', time.perf_counter() - waited)
+        streaming = False
+        try:
+            with span(f'ollama.{name}'):
+                for attempt in itertools.count():
+                    try:
+                        result = await method(*args, **kwargs)
+                        if not kwargs.get('stream'):
+                            return result
+                        first = await anext(result, None)
+                        streaming = True
+                        return _AsyncGatedStream(owner.gate, first, result)
+                    except Exception as e:
+                        if attempt >= owner.retries or not _should_retry(e):
+                            raise
+                        await asyncio.sleep(owner._retry_delay(attempt, e))
+        finally:
+            if not streaming:
+                owner.gate.release()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_ollama_client(host=None):
+    """Return the process-wide client for ``host`` (default ``OLLAMA_BASE_URL``)."""
+    from django.conf import settings
+    host = host or getattr(settings, 'OLLAMA_BASE_URL', None)
+    with _clients_lock:
+        if host not in _clients:
+            _clients[host] = OllamaClient(
+                host=host,
+                timeout=getattr(settings, 'FLASHLEARN_OLLAMA_TIMEOUT', 300),
+                retries=getattr(settings, 'FLASHLEARN_OLLAMA_RETRIES', 2),
+                max_concurrency=getattr(settings, 'FLASHLEARN_OLLAMA_MAX_CONCURRENCY', 2)
+            )
+        return _clients[host]
@@ -0,0 +1,70 @@
+"""Choosing which summary paragraphs become flashcards, and dropping repeated questions.
+
+Paragraphs are embedded in one batch and ordered by maximal marginal
+relevance: each pick is close to what the summary as a whole is about but
+far from the paragraphs already picked, so the deck covers the summary
+instead of its opening. Near-duplicate paragraphs are left out entirely.
+"""
+import numpy as np
+
+# Weight of relevance against diversity in the MMR score
+DEFAULT_MMR_LAMBDA = 0.6
+# Cosine similarity from which two paragraphs, or two questions, count as the same
+DUPLICATE_PARAGRAPH_SIMILARITY = 0.95
+DUPLICATE_QUESTION_SIMILARITY = 0.9
+
+
+def normalize(vectors):
+    """Return ``vectors`` as a 2-D array of unit rows."""
+    vectors = np.asarray(vectors, dtype=float)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def rank_paragraphs(vectors, lambda_mult=DEFAULT_MMR_LAMBDA, duplicate_similarity=DUPLICATE_PARAGRAPH_SIMILARITY):
+    """Order paragraph indices by maximal marginal relevance.
+
+    Relevance is the similarity to the mean of all paragraphs. A paragraph
+    at least ``duplicate_similarity`` similar to one already picked is
+    dropped from the ranking.
+    """
+    if not len(vectors):
+        return []
+    vectors = normalize(vectors)
+    relevance = vectors @ normalize([vectors.mean(axis=0)])[0]
+    similarity = vectors @ vectors.T
+    closest = np.zeros(len(vectors))
+    available = np.ones(len(vectors), dtype=bool)
+    ranking = []
+    while available.any():
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * closest, -np.inf)
+        index = int(np.argmax(scores))
+        ranking.append(index)
+        closest = np.maximum(closest, similarity[index])
+        available[index] = False
+        available &= closest < duplicate_similarity
+    return ranking
+
+
+class NearDuplicateFilter:
+    """Remembers the vectors added to it and tells which vectors are too close to them."""
+
+    def __init__(self, threshold=DUPLICATE_QUESTION_SIMILARITY):
+        self.threshold = threshold
+        self._seen = None
+
+    def keep(self, vectors):
+        """Return one bool per vector: whether it is far from every vector added so far."""
+        if not len(vectors):
+            return []
+        if self._seen is None:
+            return [True] * len(vectors)
+        return [bool((self._seen @ vector).max() < self.threshold) for vector in normalize(vectors)]
+
+    def add(self, vector):
+        """Remember ``vector`` unless it is too close to one added before; return whether it was added."""
+        (vector,) = normalize([vector])
+        if self._seen is not None and (self._seen @ vector).max() >= self.threshold:
+            return False
+        self._seen = vector[None, :] if self._seen is None else np.vstack([self._seen, vector])
+        return True
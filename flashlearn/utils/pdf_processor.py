@@ -1,44 +1,257 @@
 import os
+import gzip
+import json
+import hashlib
 import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PDFPlumberLoader
+from langchain_core.documents import Document
+from .cache import BoundedCache
+from .telemetry import span, traced
 
-def extract_main_headings(pdf_path):
-    """Extract main headings from a PDF document."""
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+
+# Parsed outlines and page texts are kept in a sidecar file next to each PDF
+PARSED_CACHE_VERSION = 1
+_parsed_pdfs = BoundedCache(max_size=8)
+# One lock per sidecar file, so extracting pages of one PDF does not block another
+_sidecar_locks = {}
+_sidecar_locks_lock = threading.Lock()
+MAX_IDLE_SIDECAR_LOCKS = 64
+
+
+def file_sha256(file):
+    """SHA-256 of a file, given a path or an open (e.g. uploaded) file."""
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    else:
+        for block in file.chunks():
+            digest.update(block)
+        file.seek(0)
+    return digest.hexdigest()
+
+def _sidecar_path(pdf_path):
+    return f"{pdf_path}.parsed.json.gz"
+
+
+def _file_stamp(pdf_path):
+    """Size and modification time; a parsed cache is only valid for the same stamp."""
+    stat = os.stat(pdf_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_sidecar(pdf_path, stamp):
+    try:
+        with gzip.open(_sidecar_path(pdf_path), 'rt', encoding='utf-8') as f:
+            parsed = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if parsed.get('version') != PARSED_CACHE_VERSION or parsed.get('stamp') != stamp:
+        return None
+    return parsed
+
+
+def _write_sidecar(pdf_path, parsed):
+    """Write the sidecar atomically so readers never see a partial file."""
+    path = _sidecar_path(pdf_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(parsed, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The cache is an optimisation; a read-only media directory is fine
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@traced('pdf.parse_outline')
+def _parse_outline(pdf_path, stamp):
     toc = []
     with open(pdf_path, 'rb') as file:
         reader = PdfReader(file)
-        if not reader.outline:
-            return []
-        for item in reader.outline:
+        for item in reader.outline or []:
             if isinstance(item, list):
                 continue  # Skip subheadings
             else:
                 if '.' not in item.title:  # Filter main headings
                     toc.append((item.title, reader.get_destination_page_number(item)))
-    return toc
+        parsed = {
+            'version': PARSED_CACHE_VERSION,
+            'stamp': stamp,
+            'page_count': len(reader.pages),
+            'outline': toc,
+            'pages': {},  # page index -> text, filled in as pages are requested
+        }
+    _write_sidecar(pdf_path, parsed)
+    return parsed
+
+
+def load_parsed_pdf(pdf_path):
+    """Return the parsed outline and page count of a PDF, parsing it only once.
+
+    The result is persisted in a sidecar file next to the PDF and kept in
+    memory; both are ignored once the PDF's size or mtime changes.
+    """
+    stamp = _file_stamp(pdf_path)
+    return _parsed_pdfs.get_or_create(
+        (os.path.abspath(pdf_path), *stamp),
+        lambda: _read_sidecar(pdf_path, stamp) or _parse_outline(pdf_path, stamp)
+    )
+
+
+def delete_parsed_pdf(pdf_path):
+    """Forget a PDF's parsed outline and page texts and remove its sidecar file."""
+    path = os.path.abspath(pdf_path)
+    _parsed_pdfs.invalidate(lambda key: key[0] == path)
+    with _sidecar_lock(pdf_path):
+        try:
+            os.remove(_sidecar_path(pdf_path))
+        except FileNotFoundError:
+            pass
+
+
+def get_page_count(pdf_path):
+    return load_parsed_pdf(pdf_path)['page_count']
+
+
+def _sidecar_lock(pdf_path):
+    """The lock guarding the page texts and sidecar file of one PDF."""
+    key = _sidecar_path(os.path.abspath(pdf_path))
+    with _sidecar_locks_lock:
+        if key not in _sidecar_locks and len(_sidecar_locks) >= MAX_IDLE_SIDECAR_LOCKS:
+            for idle_key in [k for k, lock in _sidecar_locks.items() if not lock.locked()]:
+                del _sidecar_locks[idle_key]
+        return _sidecar_locks.setdefault(key, threading.Lock())
+
+
+def get_page_texts(pdf_path, page_numbers):
+    """Return the text of the given 0-based pages, extracting each page only once."""
+    parsed = load_parsed_pdf(pdf_path)
+    page_numbers = [n for n in page_numbers if 0 <= n < parsed['page_count']]
+    with _sidecar_lock(pdf_path):
+        missing = [n for n in page_numbers if str(n) not in parsed['pages']]
+        if missing:
+            with span('pdf.extract_text'):
+                reader = PdfReader(pdf_path)
+                for page_num in missing:
+                    parsed['pages'][str(page_num)] = reader.pages[page_num].extract_text()
+                _write_sidecar(pdf_path, parsed)
+    return [parsed['pages'][str(n)] for n in page_numbers]
+
+
+def extract_main_headings(pdf_path):
+    """Extract main headings from a PDF document."""
+    return [tuple(heading) for heading in load_parsed_pdf(pdf_path)['outline']]
 
 def extract_topic_text(pdf_path, start_page, end_page):
     """Extract text from a range of pages in a PDF."""
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page_num in range(start_page - 1, end_page):  # Page numbers are 0-based
-        if page_num < len(reader.pages):
-            text += reader.pages[page_num].extract_text()
-    return text
+    return "".join(get_page_texts(pdf_path, range(start_page - 1, end_page)))  # Page numbers are 0-based
 
-def process_document_for_vector_store(pdf_path):
-    """Process a PDF document for the vector store."""
-    # Load the document
-    loader = PDFPlumberLoader(pdf_path)
-    documents = loader.load()
-    
-    # Split documents into chunks
+
+def extract_heading_text(pdf_path, headings, topic_index, start_page):
+    """Extract the text of topic ``topic_index`` of ``headings``, from ``start_page`` to the next heading.
+
+    The last topic runs to the end of the document.
+    """
+    if topic_index + 1 < len(headings):
+        end_page = headings[topic_index + 1][1]
+    else:
+        end_page = get_page_count(pdf_path)
+    return extract_topic_text(pdf_path, start_page, end_page)
+
+
+def _extract_pages(pdf_path, page_numbers):
+    """Extract the given pages as Documents, like PDFPlumberLoader does.
+
+    Runs in a worker process, so it opens the PDF itself.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        file_metadata = {k: v for k, v in pdf.metadata.items() if type(v) in [str, int]}
+        documents = []
+        for page_number in page_numbers:
+            page = pdf.pages[page_number]
+            documents.append(Document(
+                page_content=(page.extract_text() or "") + "\n",
+                metadata={
+                    "source": pdf_path,
+                    "file_path": pdf_path,
+                    "page": page_number,
+                    "total_pages": len(pdf.pages),
+                    **file_metadata,
+                }
+            ))
+            page.close()  # release the page's parsed objects
+        return documents
+
+
+def iter_pdf_pages(pdf_path, workers=None, pages_per_task=16, max_pending=None):
+    """Yield the pages of a PDF in order, extracting them in a process pool.
+
+    At most ``max_pending`` groups of ``pages_per_task`` pages are extracted
+    ahead of the consumer, so memory stays bounded however long the PDF is
+    and a slow consumer (e.g. embedding) throttles extraction.
+    """
+    total_pages = len(PdfReader(pdf_path).pages)
+    page_groups = (
+        list(range(start, min(start + pages_per_task, total_pages)))
+        for start in range(0, total_pages, pages_per_task)
+    )
+
+    if workers == 0 or total_pages <= pages_per_task:
+        for pages in page_groups:
+            with span('pdf.extract_pages'):
+                documents = _extract_pages(pdf_path, pages)
+            yield from documents
+        return
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    # Spawned workers are safe to start from threaded web and job processes
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        pending = deque()
+        for pages in page_groups:
+            pending.append(pool.submit(_extract_pages, pdf_path, pages))
+            if len(pending) >= max_pending:
+                yield from _next_result(pending)
+        while pending:
+            yield from _next_result(pending)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _next_result(pending):
+    # Only the time the consumer waits for extraction is recorded
+    with span('pdf.extract_pages'):
+        return pending.popleft().result()
+
+
+def iter_document_chunks(pdf_path, **kwargs):
+    """Yield chunks for the vector store as pages are extracted.
+
+    Keyword arguments are passed to ``iter_pdf_pages``.
+    """
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1200,
-        chunk_overlap=150
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
     )
-    splits = text_splitter.split_documents(documents)
-    
-    return splits
\ No newline at end of file
+    for page in iter_pdf_pages(pdf_path, **kwargs):
+        with span('pdf.split'):
+            chunks = text_splitter.split_documents([page])
+        yield from chunks
+
+
+def process_document_for_vector_store(pdf_path):
+    """Process a PDF document for the vector store."""
+    return list(iter_document_chunks(pdf_path))
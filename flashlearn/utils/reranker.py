@@ -0,0 +1,209 @@
+import time
+import hashlib
+import logging
+import threading
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+from .cache import BoundedCache
+from .model_registry import get_registry
+from .summarizer import estimate_tokens
+from .telemetry import traced
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_BATCH_SIZE = 16
+# Pairs scored when the per-pair cost is not known yet
+PROBE_BATCH_SIZE = 2
+# Weight of the newest batch in the running per-pair cost
+COST_SMOOTHING = 0.3
+
+
+def _load_cross_encoder(model_name):
+    """Load a cross-encoder tokenizer and model for CPU inference."""
+    # Imported here so reranking stays optional
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    return tokenizer, model
+
+
+def _chunk_key(document):
+    return document.id or hashlib.sha256(document.page_content.encode('utf-8')).hexdigest()
+
+
+class CrossEncoderReranker:
+    """Score (question, chunk) pairs with a small cross-encoder and keep the best chunks.
+
+    Each batch is sized from the measured cost per pair so that it fits in
+    what is left of ``latency_budget``; candidates left unscored keep their
+    retrieval order behind the scored ones. While the model is not loaded,
+    nothing is scored and it is loaded in the background, so a cold model
+    never costs a request its load time. Scores are cached per (question
+    hash, chunk id). The chosen chunks are packed best-first into
+    ``max_context_tokens``.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL_NAME, registry=None, batch_size=DEFAULT_BATCH_SIZE,
+                 latency_budget=0.5, max_context_tokens=1500, top_n=3, cache_size=10_000):
+        self.model_name = model_name
+        self.registry = registry or get_registry()
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self.max_context_tokens = max_context_tokens
+        self.top_n = top_n
+        self.scores = BoundedCache(max_size=cache_size)
+        self.pair_seconds = None
+        self.last_stats = {}
+        self._loading = None
+        self._loading_lock = threading.Lock()
+
+    @property
+    def model_key(self):
+        return ("cross-encoder", self.model_name, "cpu")
+
+    def _load(self):
+        return _load_cross_encoder(self.model_name)
+
+    def is_loaded(self):
+        return self.model_key in self.registry
+
+    def load_in_background(self):
+        """Start loading the model on a thread unless that is already happening."""
+        with self._loading_lock:
+            if self._loading is None or not self._loading.is_alive():
+                self._loading = threading.Thread(target=self._load_quietly, name='reranker-load', daemon=True)
+                self._loading.start()
+            return self._loading
+
+    def _load_quietly(self):
+        try:
+            self.registry.get(self.model_key, self._load)
+        except Exception as e:
+            logger.warning("Could not load reranker model %s: %s", self.model_name, e)
+
+    def warm_up(self):
+        """Load the model and measure the cost of scoring a pair."""
+        self.registry.get(self.model_key, self._load)
+        start = time.perf_counter()
+        self._score_batch("warm up", ["warm up"] * PROBE_BATCH_SIZE)
+        self.pair_seconds = (time.perf_counter() - start) / PROBE_BATCH_SIZE
+
+    def _score_batch(self, query, texts):
+        """Relevance logits for ``query`` against each text."""
+        import torch
+        tokenizer, model = self.registry.get(self.model_key, self._load)
+        inputs = tokenizer([query] * len(texts), texts, padding=True, truncation=True,
+                           max_length=512, return_tensors="pt")
+        with torch.inference_mode():
+            logits = model(**inputs).logits
+        return logits[:, 0].tolist()
+
+    @traced('rerank.score')
+    def score(self, query, documents):
+        """Return a score per document, or None for those the budget did not allow."""
+        start = time.perf_counter()
+        query_hash = hashlib.sha256(query.encode('utf-8')).hexdigest()
+        keys = [(query_hash, _chunk_key(document)) for document in documents]
+        scores = [self.scores.get(key) for key in keys]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        cached = len(documents) - len(pending)
+
+        cold = bool(pending) and not self.is_loaded()
+        if cold:
+            self.load_in_background()
+            pending = []
+        while pending:
+            # Only take as many pairs as the measured cost says fit in what is left
+            remaining = self.latency_budget - (time.perf_counter() - start)
+            if self.pair_seconds:
+                size = min(self.batch_size, int(remaining / self.pair_seconds))
+            else:
+                size = min(self.batch_size, PROBE_BATCH_SIZE)
+            if size < 1 or remaining <= 0:
+                break
+            batch, pending = pending[:size], pending[size:]
+            batch_began = time.perf_counter()
+            for i, score in zip(batch, self._score_batch(query, [documents[i].page_content for i in batch])):
+                scores[i] = score
+                self.scores.set(keys[i], score)
+            cost = (time.perf_counter() - batch_began) / len(batch)
+            self.pair_seconds = cost if self.pair_seconds is None else (
+                COST_SMOOTHING * cost + (1 - COST_SMOOTHING) * self.pair_seconds
+            )
+
+        self.last_stats = {
+            'candidates': len(documents),
+            'cached': cached,
+            'scored': sum(score is not None for score in scores) - cached,
+            'unscored': sum(score is None for score in scores),
+            'cold': cold,
+            'seconds': time.perf_counter() - start,
+        }
+        if cold:
+            logger.info("Reranker model is still loading; kept %d candidates in retrieval order", len(documents))
+        elif self.last_stats['unscored']:
+            logger.info("Rerank budget of %.2fs left %d of %d candidates unscored",
+                        self.latency_budget, self.last_stats['unscored'], len(documents))
+        return scores
+
+    def rerank(self, query, documents):
+        """Return the best documents for ``query`` that fit the context token budget."""
+        scores = self.score(query, documents)
+        scored = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: -scores[i])
+        order = scored + [i for i, score in enumerate(scores) if score is None]
+
+        selected, tokens = [], 0
+        for i in order:
+            document = documents[i]
+            document_tokens = estimate_tokens(document.page_content)
+            if tokens + document_tokens > self.max_context_tokens:
+                continue
+            if scores[i] is not None:
+                document.metadata = {**document.metadata, 'rerank_score': scores[i]}
+            selected.append(document)
+            tokens += document_tokens
+            if len(selected) >= self.top_n:
+                break
+        return selected
+
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetch candidates from ``base_retriever`` and keep what ``reranker`` ranks best."""
+
+    base_retriever: Any
+    reranker: Any
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        candidates = self.base_retriever.invoke(query)
+        return self.reranker.rerank(query, candidates)
+
+
+_reranker = None
+
+
+def get_reranker():
+    """Return the process-wide reranker configured in settings."""
+    global _reranker
+    if _reranker is None:
+        from django.conf import settings
+        _reranker = CrossEncoderReranker(
+            model_name=getattr(settings, 'FLASHLEARN_RERANK_MODEL', RERANK_MODEL_NAME),
+            latency_budget=getattr(settings, 'FLASHLEARN_RERANK_LATENCY_BUDGET', 0.5),
+            max_context_tokens=getattr(settings, 'FLASHLEARN_RERANK_CONTEXT_TOKENS', 1500),
+            top_n=getattr(settings, 'FLASHLEARN_RERANK_TOP_N', 3)
+        )
+    return _reranker
+
+
+def warm_up_reranker():
+    """Load the reranker when a worker starts, if reranking and warm-up are enabled."""
+    from django.conf import settings
+    if not (getattr(settings, 'FLASHLEARN_RERANK_ENABLED', False)
+            and getattr(settings, 'FLASHLEARN_WARM_UP_MODELS', False)):
+        return
+    try:
+        get_reranker().warm_up()
+    except Exception as e:
+        logger.warning("Reranker warm-up failed: %s", e)
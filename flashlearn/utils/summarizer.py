@@ -1,13 +1,75 @@
 import re
-import ollama
+import time
+import hashlib
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from .ollama_client import get_ollama_client, PRIORITY_BATCH
+from .telemetry import observe, traced
 
-def summarize_text(text, model_name="deepseek-r1:8b"):
-    """Summarize text using DeepSeek model."""
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = "deepseek-r1:8b"
+# Bump when the prompts or the chunking change, so cached summaries are not reused
+PROMPT_VERSION = 1
+
+# Rough token budget per LLM call, leaving room for the prompt and the answer
+DEFAULT_CHUNK_TOKENS = 1500
+DEFAULT_CONCURRENCY = 2
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def text_fingerprint(text):
+    """SHA-256 of text with whitespace normalized, used to recognise the same topic."""
+    return hashlib.sha256(" ".join(text.split()).encode('utf-8')).hexdigest()
+
+
+def split_into_chunks(text, max_tokens=DEFAULT_CHUNK_TOKENS):
+    """Split text into chunks of at most ``max_tokens``, breaking between sentences."""
+    sentences = re.split(r'(?<=[.!?])\s+|\n{2,}', text)
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for sentence in sentences:
+        if not sentence or not sentence.strip():
+            continue
+        # A single over-long sentence is cut into budget-sized pieces
+        pieces = [sentence[i:i + max_tokens * 4] for i in range(0, len(sentence), max_tokens * 4)]
+        for piece in pieces:
+            tokens = estimate_tokens(piece) + 1
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _chat(model_name, prompt):
+    """Send one prompt to the model and return the answer without <think> sections."""
+    response = get_ollama_client().chat(
+        model=model_name,
+        messages=[{"role": "user", "content": prompt}],
+        priority=PRIORITY_BATCH
+    )
+    summary = response['message']['content']
+
+    # Remove any "<think>...</think>" sections (if generated)
+    return re.sub(r"<think>.*?</think>", "", summary, flags=re.DOTALL).strip()
+
+
+def _summary_prompt(text):
     # Compute target length (~1/3rd of original)
     target_length = max(len(text.split()) // 3, 50)
-
-    # Construct prompt
-    prompt = (
+    return (
         f"Summarize the following text to approximately 1/3rd of its length while maintaining quality. "
         f"Ensure key concepts and keywords remain intact but simplify explanations where possible. "
         f"The summary should be concise yet informative, structured in a professional manner. "
@@ -17,11 +79,94 @@ def summarize_text(text, model_name="deepseek-r1:8b"):
         f"Ensure the summary is about {target_length} words long."
     )
 
-    # Generate summary
-    response = ollama.chat(model=model_name, messages=[{"role": "user", "content": prompt}])
-    summary = response['message']['content']
 
-    # Remove any "<think>...</think>" sections (if generated)
-    summary = re.sub(r"<think>.*?</think>", "", summary, flags=re.DOTALL).strip()
+def _reduce_prompt(partial_summaries, target_length):
+    joined = "\n\n".join(partial_summaries)
+    return (
+        f"The following are summaries of consecutive parts of one text. "
+        f"Combine them into a single coherent summary that keeps every key concept and keyword, "
+        f"removes repetition and follows the order of the original text. "
+        f"Do not include greetings, conversational phrases, or additional thoughts. "
+        f"Answer in the style of a professionally trained summarization model.\n\n"
+        f"Partial Summaries:\n{joined}\n\n"
+        f"Ensure the summary is about {target_length} words long."
+    )
+
+
+@traced('summarizer.summarize')
+def summarize_text(text, model_name=SUMMARY_MODEL, max_chunk_tokens=DEFAULT_CHUNK_TOKENS,
+                   concurrency=DEFAULT_CONCURRENCY, stats=None):
+    """Summarize text using DeepSeek model.
+
+    Text that fits in ``max_chunk_tokens`` is summarized in one call. Longer
+    text is split into chunks that are summarized concurrently (at most
+    ``concurrency`` requests to Ollama at a time), and the partial summaries
+    are then combined, in several rounds if they are still too long.
+    Timings of each stage are recorded in ``stats`` if a dict is given.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({'chunks': 0, 'llm_calls': 0, 'map_seconds': 0.0, 'reduce_seconds': 0.0, 'reduce_rounds': 0})
+
+    chunks = split_into_chunks(text, max_chunk_tokens)
+    if len(chunks) <= 1:
+        start = time.perf_counter()
+        summary = _chat(model_name, _summary_prompt(text))
+        stats.update({'chunks': 1, 'llm_calls': 1, 'map_seconds': time.perf_counter() - start})
+        observe('summarizer.map', stats['map_seconds'])
+        return summary
+
+    target_length = max(len(text.split()) // 3, 50)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        # Map: summarize every chunk
+        start = time.perf_counter()
+        summaries = _map_in_context(pool, lambda chunk: _chat(model_name, _summary_prompt(chunk)), chunks)
+        stats['map_seconds'] = time.perf_counter() - start
+        stats['chunks'] = len(chunks)
+        stats['llm_calls'] = len(chunks)
+
+        # Reduce: combine groups of partial summaries until one call can take them all
+        start = time.perf_counter()
+        while True:
+            stats['reduce_rounds'] += 1
+            groups = _group_by_budget(summaries, max_chunk_tokens)
+            if len(groups) == 1:
+                summary = _chat(model_name, _reduce_prompt(groups[0], target_length))
+                stats['llm_calls'] += 1
+                break
+            summaries = _map_in_context(
+                pool,
+                lambda group: _chat(model_name, _reduce_prompt(group, max(target_length // len(groups), 50))),
+                groups
+            )
+            stats['llm_calls'] += len(groups)
+        stats['reduce_seconds'] = time.perf_counter() - start
+
+    observe('summarizer.map', stats['map_seconds'])
+    observe('summarizer.reduce', stats['reduce_seconds'])
+    logger.info("Summarized %d tokens in %d chunks: %s", estimate_tokens(text), len(chunks), stats)
+    return summary
+
+
+def _map_in_context(pool, function, items):
+    """Like ``pool.map``, but each call runs in a copy of the caller's context.
+
+    Worker threads do not inherit contextvars, so without this the spans and
+    logs of the LLM calls would lose the job's correlation id.
+    """
+    futures = [pool.submit(contextvars.copy_context().run, function, item) for item in items]
+    return [future.result() for future in futures]
+
 
-    return summary
\ No newline at end of file
+def _group_by_budget(summaries, max_tokens):
+    """Group consecutive summaries so each group fits in one prompt."""
+    groups = [[]]
+    tokens = 0
+    for summary in summaries:
+        summary_tokens = estimate_tokens(summary)
+        # Always put at least two summaries in a group so every round shrinks the list
+        if len(groups[-1]) >= 2 and tokens + summary_tokens > max_tokens:
+            groups.append([])
+            tokens = 0
+        groups[-1].append(summary)
+        tokens += summary_tokens
+    return groups
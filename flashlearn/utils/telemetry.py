@@ -0,0 +1,215 @@
+"""Lightweight tracing and Prometheus metrics for the FlashLearn pipelines.
+
+``span(stage)`` times a block into the ``flashlearn_stage_seconds``
+histogram and counts its failures in ``flashlearn_stage_errors_total``.
+Each HTTP request and job runs under a correlation id, which
+``CorrelationIdFilter`` adds to log records. When FLASHLEARN_METRICS_ENABLED
+is off, ``span`` returns a shared no-op context manager and records nothing.
+"""
+import time
+import uuid
+import bisect
+import logging
+import functools
+import threading
+import contextlib
+import contextvars
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+logger = logging.getLogger(__name__)
+
+CORRELATION_HEADER = 'X-Request-ID'
+# Seconds; wide enough for both BM25 lookups and multi-minute summaries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_correlation_id = contextvars.ContextVar('flashlearn_correlation_id', default='-')
+_NOOP = contextlib.nullcontext()
+
+
+def metrics_enabled():
+    from django.conf import settings
+    return getattr(settings, 'FLASHLEARN_METRICS_ENABLED', False)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """A Prometheus histogram with one series per combination of label values."""
+
+    def __init__(self, name, help_text, label_names=('stage',), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """Return {label values: (count, sum)}."""
+        with self._lock:
+            return {labels: (series[2], series[1]) for labels, series in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """A Prometheus counter with one series per combination of label values."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return "\n".join(lines)
+
+
+stage_seconds = Histogram('flashlearn_stage_seconds', "Time spent in each pipeline stage.")
+stage_errors = Counter('flashlearn_stage_errors_total', "Pipeline stages that raised, by exception type.",
+                       label_names=('stage', 'error'))
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        stage_seconds.observe(seconds, self.stage)
+        if exc_type is not None:
+            stage_errors.inc(self.stage, exc_type.__name__)
+            logger.debug("%s failed after %.3fs: %r", self.stage, seconds, exc)
+        return False
+
+
+def span(stage):
+    """Context manager timing ``stage``; a no-op while metrics are disabled."""
+    if not metrics_enabled():
+        return _NOOP
+    return _Span(stage)
+
+
+def traced(stage):
+    """Decorator form of ``span``."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(stage, seconds):
+    """Record a duration measured elsewhere, e.g. reported by Ollama."""
+    if metrics_enabled():
+        stage_seconds.observe(seconds, stage)
+
+
+def render_metrics(extra=()):
+    """Prometheus text exposition of the stage metrics and ``extra`` (name, type, help, value) samples."""
+    parts = [stage_seconds.render(), stage_errors.render()]
+    for name, kind, help_text, value in extra:
+        parts.append(f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n{name} {value}")
+    return "\n".join(parts) + "\n"
+
+
+def get_correlation_id():
+    return _correlation_id.get()
+
+
+@contextlib.contextmanager
+def correlation_scope(correlation_id=None):
+    """Run the block under ``correlation_id`` (a new one if None)."""
+    correlation_id = correlation_id or uuid.uuid4().hex[:16]
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        _correlation_id.reset(token)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Add ``correlation_id`` to every log record."""
+
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class CorrelationIdMiddleware:
+    """Give each request a correlation id, taken from ``X-Request-ID`` if the proxy set one."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _incoming(self, request):
+        value = request.headers.get(CORRELATION_HEADER, '')
+        return value[:64] if value.replace('-', '').isalnum() else None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with correlation_scope(self._incoming(request)) as correlation_id:
+            response = self.get_response(request)
+        response[CORRELATION_HEADER] = correlation_id
+        return response
+
+    async def __acall__(self, request):
+        with correlation_scope(self._incoming(request)) as correlation_id:
+            response = await self.get_response(request)
+        response[CORRELATION_HEADER] = correlation_id
+        return response
@@ -2,23 +2,47 @@ from django.shortcuts import render
 
 # Create your views here.
 import os
+import json
+import logging
+from contextlib import aclosing
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+)
 from django.views.decorators.http import require_POST
 from django.core.files.storage import default_storage
 from django.conf import settings
-from .models import PDFDocument, Summary, Flashcard, ChatSession, ChatMessage
+from django.db import transaction
+from django.db.models import Subquery
+from .models import PDFDocument, Summary, Flashcard, ChatSession, ChatMessage, Job
 from .forms import PDFUploadForm, SummaryTopicForm, FlashcardGenerationForm, ChatForm
-from .utils.pdf_processor import extract_main_headings, extract_topic_text, process_document_for_vector_store
-from .utils.summarizer import summarize_text
-from .utils.flashcard_generator import FlashcardGenerator
-from .utils.embedding_store import EmbeddingStore
-from .utils.chatbot import Chatbot
+from .jobs import enqueue, cancel
+from .pagination import keyset_paginate
+from .utils.pdf_processor import extract_main_headings, file_sha256
+from .utils.embedding_store import EmbeddingStore, EMBEDDING_MODEL, document_collection_name
+from .utils.embedding_cache import embedding_cache_stats
+from .utils.answer_cache import AnswerCache, answer_cache_stats
+from .utils.reranker import RerankingRetriever, get_reranker
+from .utils.chatbot import Chatbot, get_cached_chatbot, prompt_stats
+from .utils.conversation import ConversationMemory, MAX_PENDING_MESSAGES, history_window, summary_tokens
+from .utils.model_registry import get_registry
+from .utils.ollama_client import get_ollama_client
+from .utils.telemetry import metrics_enabled, render_metrics
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS_PER_PAGE = 20
+SUMMARIES_PER_PAGE = 10
+CHAT_MESSAGES_PER_PAGE = 50
+# Messages that have left the history window are summarized this many at a time
+CHAT_SUMMARY_BATCH = 4
+
 
 def register_user(request):
     """Handle user registration."""
@@ -81,12 +105,18 @@ def landing_page(request):
 def home(request):
     """Home page view."""
     form = PDFUploadForm()
-    documents = PDFDocument.objects.all().order_by('-uploaded_at')
     
     # If user is not logged in, show landing page
     if not request.user.is_authenticated:
         return render(request, 'landing.html')
     
+    documents = keyset_paginate(
+        PDFDocument.objects.filter(user=request.user).prefetch_related('summaries'),
+        'uploaded_at',
+        cursor=request.GET.get('cursor'),
+        page_size=DOCUMENTS_PER_PAGE
+    )
+    
     return render(request, 'summarizer.html', {
         'form': form,
         'documents': documents,
@@ -101,6 +131,7 @@ def upload_pdf(request):
         if form.is_valid():
             document = form.save(commit=False)
             document.user = request.user  # Assign document to the logged-in user
+            document.sha256 = file_sha256(form.cleaned_data['file'])
             document.save()
             messages.success(request, f"PDF '{document.title}' uploaded successfully.")
             return redirect('document_topics', document_id=document.id)
@@ -132,9 +163,18 @@ def document_topics(request, document_id):
     
     form = SummaryTopicForm(topics=topics)
     
+    summaries = keyset_paginate(
+        Summary.objects.filter(document=document),
+        'created_at',
+        cursor=request.GET.get('cursor'),
+        page_size=SUMMARIES_PER_PAGE
+    )
+    
     return render(request, 'summarizer.html', {
         'document': document,
         'form': form,
+        'summaries': summaries,
+        'job': _requested_job(request),
         'active_tab': 'summarizer'
     })
 
@@ -142,7 +182,7 @@ def document_topics(request, document_id):
 @login_required
 def generate_summary(request, document_id):
     """Generate summary for selected topic."""
-    document = get_object_or_404(PDFDocument, id=document_id)
+    document = get_object_or_404(PDFDocument, id=document_id, user=request.user)
     
     if request.method == 'POST':
         topics = [(f"{i}:{title}:{page}", f"{title} (Page {page})") 
@@ -157,32 +197,27 @@ def generate_summary(request, document_id):
             topic_title = topic_data[1]
             start_page = int(topic_data[2])
             
-            # Extract and process text
-            file_path = os.path.join(settings.MEDIA_ROOT, document.file.name)
-            headings = extract_main_headings(file_path)
-            
-            end_page = headings[topic_index + 1][1] if topic_index + 1 < len(headings) else start_page + 10
-            topic_text = extract_topic_text(file_path, start_page, end_page)
-            
-            # Generate summary
-            summary_content = summarize_text(topic_text)
-            
-            # Save summary
-            summary = Summary.objects.create(
-                document=document,
+            job = enqueue(
+                'summary',
+                user=request.user,
+                document_id=document.id,
+                topic_index=topic_index,
                 topic_title=topic_title,
-                content=summary_content
+                start_page=start_page,
+                regenerate=form.cleaned_data['regenerate']
             )
             
-            messages.success(request, f"Summary generated for '{topic_title}'")
-            return redirect('view_summary', summary_id=summary.id)
+            messages.info(request, f"Generating summary for '{topic_title}'...")
+            return redirect(f"{reverse('document_topics', args=[document.id])}?job={job.id}")
     
     return redirect('document_topics', document_id=document_id)
 
 @login_required
 def view_summary(request, summary_id):
     """View a generated summary."""
-    summary = get_object_or_404(Summary, id=summary_id)
+    summary = get_object_or_404(
+        Summary.objects.select_related('document'), id=summary_id, document__user=request.user
+    )
     
     return render(request, 'summarizer.html', {
         'document': summary.document,
@@ -193,7 +228,9 @@ def view_summary(request, summary_id):
 @login_required
 def flashcards(request, summary_id):
     """Flashcards view for a summary."""
-    summary = get_object_or_404(Summary, id=summary_id)
+    summary = get_object_or_404(
+        Summary.objects.select_related('document'), id=summary_id, document__user=request.user
+    )
     flashcards = Flashcard.objects.filter(summary=summary).order_by('id')
     
     form = FlashcardGenerationForm()
@@ -202,6 +239,7 @@ def flashcards(request, summary_id):
         'summary': summary,
         'flashcards': flashcards,
         'form': form,
+        'job': _requested_job(request),
         'active_tab': 'flashcards'
     })
 
@@ -209,7 +247,7 @@ def flashcards(request, summary_id):
 @login_required
 def generate_flashcards(request, summary_id):
     """Generate flashcards for a summary."""
-    summary = get_object_or_404(Summary, id=summary_id)
+    summary = get_object_or_404(Summary, id=summary_id, document__user=request.user)
     
     if request.method == 'POST':
         form = FlashcardGenerationForm(request.POST)
@@ -217,22 +255,10 @@ def generate_flashcards(request, summary_id):
         if form.is_valid():
             num_cards = form.cleaned_data['num_cards']
             
-            # Delete existing flashcards
-            Flashcard.objects.filter(summary=summary).delete()
+            job = enqueue('flashcards', user=request.user, summary_id=summary.id, num_cards=num_cards)
             
-            # Generate new flashcards
-            generator = FlashcardGenerator()
-            flashcard_data = generator.generate_flashcards(summary.content, num_cards)
-            
-            # Save flashcards
-            for question, answer in flashcard_data:
-                Flashcard.objects.create(
-                    summary=summary,
-                    question=question,
-                    answer=answer
-                )
-            
-            messages.success(request, f"{len(flashcard_data)} flashcards generated successfully.")
+            messages.info(request, "Generating flashcards...")
+            return redirect(f"{reverse('flashcards', args=[summary.id])}?job={job.id}")
     
     return redirect('flashcards', summary_id=summary.id)
 
@@ -240,56 +266,54 @@ def generate_flashcards(request, summary_id):
 @login_required
 def chatbot(request, document_id):
     """Chatbot view for a document."""
-    document = get_object_or_404(PDFDocument, id=document_id)
+    document = get_object_or_404(PDFDocument, id=document_id, user=request.user)
     
     # Get or create chat session
     chat_session, created = ChatSession.objects.get_or_create(document=document)
     
-    # Get chat messages
-    chat_messages = ChatMessage.objects.filter(session=chat_session).order_by('timestamp')
+    # Get the latest chat messages; older ones are paged in with ?before=
+    history = keyset_paginate(
+        ChatMessage.objects.filter(session=chat_session),
+        'timestamp',
+        cursor=request.GET.get('before'),
+        page_size=CHAT_MESSAGES_PER_PAGE
+    )
+    chat_messages = history.items[::-1]
     
     form = ChatForm()
     
-    # Check if vector store is created
-    vector_store_exists = os.path.exists(os.path.join(settings.BASE_DIR, 'chroma_db'))
+    # Check if this document's knowledge base is created
+    vector_store_exists = document.processed
     
     return render(request, 'chatbot.html', {
         'document': document,
         'chat_session': chat_session,
         'chat_messages': chat_messages,
+        'earlier_messages_cursor': history.next_cursor,
         'form': form,
         'vector_store_exists': vector_store_exists,
         'active_tab': 'chatbot'
     })
 
+@login_required
 @require_POST
 def create_knowledge_base(request, document_id):
-    """Create knowledge base for document."""
-    document = get_object_or_404(PDFDocument, id=document_id)
+    """Queue knowledge base creation for a document."""
+    document = get_object_or_404(PDFDocument, id=document_id, user=request.user)
     
-    try:
-        # Process document for vector store
-        file_path = os.path.join(settings.MEDIA_ROOT, document.file.name)
-        splits = process_document_for_vector_store(file_path)
-        
-        # Create vector store
-        embedding_store = EmbeddingStore()
-        embedding_store.create_vector_store(splits)
-        
-        # Mark document as processed
-        document.processed = True
-        document.save()
-        
-        messages.success(request, "Knowledge base created successfully.")
-        return JsonResponse({'status': 'success'})
-    except Exception as e:
-        messages.error(request, f"Error creating knowledge base: {str(e)}")
-        return JsonResponse({'status': 'error', 'message': str(e)})
+    job = enqueue('knowledge_base', user=request.user, document_id=document.id)
+    
+    return JsonResponse({
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': reverse('job_status', args=[job.id])
+    })
 
+@login_required
 @require_POST
 def chat_message(request, document_id):
     """Handle chat message submission."""
-    document = get_object_or_404(PDFDocument, id=document_id)
+    document = get_object_or_404(PDFDocument, id=document_id, user=request.user)
     
     # Get chat session
     chat_session, created = ChatSession.objects.get_or_create(document=document)
@@ -299,33 +323,248 @@ def chat_message(request, document_id):
     if form.is_valid():
         user_message = form.cleaned_data['message']
         
-        # Save user message
-        ChatMessage.objects.create(
-            session=chat_session,
-            role='user',
-            content=user_message
-        )
-        
         # Get response from chatbot
-        embedding_store = EmbeddingStore()
-        retriever = embedding_store.get_retriever()
+        chatbot = _get_chatbot(document)
         
-        if retriever:
-            chatbot = Chatbot(retriever)
-            response = chatbot.get_response(user_message)
-            
-            # Save assistant message
-            ChatMessage.objects.create(
-                session=chat_session,
-                role='assistant',
-                content=response
-            )
+        if chatbot:
+            response = chatbot.get_response(user_message, memory=_conversation_memory(chat_session))
         else:
-            # Save error message
-            ChatMessage.objects.create(
-                session=chat_session,
-                role='assistant',
-                content="Please create a knowledge base first."
+            response = "Please create a knowledge base first."
+        
+        # Save both messages in one write
+        _save_chat_turn(chat_session, user_message, response)
+        _schedule_chat_summary(chat_session)
+    
+    return redirect('chatbot', document_id=document.id)
+
+
+def _sse(data, event=None):
+    """Format one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _save_chat_turn(chat_session, user_message, response):
+    """Persist a question and its answer in one transaction once the answer is complete."""
+    with transaction.atomic():
+        question, answer = ChatMessage.objects.bulk_create([
+            ChatMessage(session=chat_session, role='user', content=user_message),
+            ChatMessage(session=chat_session, role='assistant', content=response),
+        ])
+    return answer
+
+
+def _conversation_memory(chat_session):
+    """The session's running summary and its unsummarized messages, for the next question.
+
+    The latest messages are kept as turns; older ones the summary job has not
+    reached yet are kept in shorter form, so no message drops out of memory
+    while the summary catches up.
+    """
+    summary, summarized_through = ChatSession.objects.values_list('summary', 'summarized_through').get(
+        id=chat_session.id
+    )
+    window = history_window()
+    messages = list(
+        chat_session.messages.filter(id__gt=summarized_through)
+        .order_by('-timestamp', '-id')
+        .values_list('role', 'content')[:window + MAX_PENDING_MESSAGES]
+    )[::-1]
+    turns = messages[-window:] if window else []
+    pending = messages[:len(messages) - len(turns)]
+    return ConversationMemory(summary, turns, summary_tokens=summary_tokens(), pending=pending)
+
+
+def _schedule_chat_summary(chat_session):
+    """Queue a summary update once enough messages have left the history window."""
+    unsummarized = ChatMessage.objects.filter(
+        session=chat_session,
+        id__gt=Subquery(ChatSession.objects.filter(id=chat_session.id).values('summarized_through'))
+    ).count()
+    if unsummarized < history_window() + CHAT_SUMMARY_BATCH:
+        return None
+    pending = Job.objects.filter(
+        kind='chat_summary', status__in=['queued', 'running'], payload__session_id=chat_session.id
+    )
+    if pending.exists():
+        return None
+    return enqueue('chat_summary', session_id=chat_session.id)
+
+
+def _get_chatbot(document):
+    """Return the cached chatbot for the document, or None without a knowledge base."""
+    if not document.processed:
+        return None
+    
+    def build():
+        collection_name = document_collection_name(document)
+        embedding_store = EmbeddingStore(collection_name)
+        rerank = getattr(settings, 'FLASHLEARN_RERANK_ENABLED', False)
+        if rerank:
+            retriever = embedding_store.get_retriever(k=getattr(settings, 'FLASHLEARN_RERANK_CANDIDATES', 12))
+        else:
+            retriever = embedding_store.get_retriever()
+        if not retriever:
+            return None
+        if rerank:
+            retriever = RerankingRetriever(base_retriever=retriever, reranker=get_reranker())
+        answer_cache = None
+        if getattr(settings, 'FLASHLEARN_ANSWER_CACHE_ENABLED', False):
+            answer_cache = AnswerCache(
+                collection_name,
+                signature=embedding_store.index_signature(),
+                threshold=getattr(settings, 'FLASHLEARN_ANSWER_CACHE_THRESHOLD', 0.92),
+                ttl_seconds=getattr(settings, 'FLASHLEARN_ANSWER_CACHE_TTL', None)
             )
+        return Chatbot(retriever, base_url=settings.OLLAMA_BASE_URL, answer_cache=answer_cache)
+    
+    # indexed_at changes whenever the knowledge base is rebuilt, in any process
+    return get_cached_chatbot((document.id, document.indexed_at, EMBEDDING_MODEL), build)
+
+
+async def _chat_event_stream(chat_session, user_message, chatbot):
+    """Stream answer chunks as SSE, then save the finished exchange."""
+    if chatbot is None:
+        response = "Please create a knowledge base first."
+        yield _sse({'token': response})
+    else:
+        chunks = []
+        try:
+            memory = await sync_to_async(_conversation_memory)(chat_session)
+            # Closed explicitly so a client that disconnects frees the Ollama slot at once
+            async with aclosing(chatbot.astream_response(user_message, memory=memory)) as answer:
+                async for text in answer:
+                    chunks.append(text)
+                    yield _sse({'token': text})
+            response = "".join(chunks).strip()
+        except Exception as e:
+            logger.exception("Streaming chat response failed")
+            response = f"Error: {str(e)}"
+            yield _sse({'error': response}, event='error')
+
+    message = await sync_to_async(_save_chat_turn)(chat_session, user_message, response)
+    await sync_to_async(_schedule_chat_summary)(chat_session)
+    yield _sse({'message_id': message.id}, event='done')
+
+
+async def chat_stream(request, document_id):
+    """Stream the chatbot's answer token by token as Server-Sent Events.
+
+    Tokens reach the browser as they are generated when the site is served
+    through the ASGI application in ``django_flashlearn/asgi.py``.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'status': 'error', 'message': "Please log in."}, status=401)
+    
+    document = await sync_to_async(get_object_or_404)(PDFDocument, id=document_id, user=request.user)
+    form = ChatForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'message': "Please enter a message."}, status=400)
+    
+    chat_session, created = await sync_to_async(ChatSession.objects.get_or_create)(document=document)
+    chatbot = await sync_to_async(_get_chatbot)(document)
     
-    return redirect('chatbot', document_id=document.id)
\ No newline at end of file
+    response = StreamingHttpResponse(
+        _chat_event_stream(chat_session, form.cleaned_data['message'], chatbot),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+
+def _job_result_url(job):
+    """Return the page that shows the output of a finished job."""
+    result = job.result or {}
+    if job.kind == 'summary' and 'summary_id' in result:
+        return reverse('view_summary', args=[result['summary_id']])
+    if job.kind == 'flashcards' and 'summary_id' in result:
+        return reverse('flashcards', args=[result['summary_id']])
+    if job.kind == 'knowledge_base' and 'document_id' in result:
+        return reverse('chatbot', args=[result['document_id']])
+    return None
+
+
+def _get_user_job(request, job_id):
+    return get_object_or_404(Job, id=job_id, user=request.user)
+
+
+def _requested_job(request):
+    """Return the job named in the ``job`` query parameter, if it is the user's."""
+    job_id = request.GET.get('job')
+    if not job_id or not job_id.isdigit():
+        return None
+    return Job.objects.filter(id=job_id, user=request.user).first()
+
+
+@login_required
+def job_status(request, job_id):
+    """Report the status and progress of a background job."""
+    job = _get_user_job(request, job_id)
+    
+    return JsonResponse({
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'error': job.error,
+        'result': job.result,
+        'result_url': _job_result_url(job) if job.status == 'succeeded' else None,
+    })
+
+
+@login_required
+@require_POST
+def cancel_job(request, job_id):
+    """Cancel a queued or running background job."""
+    job = _get_user_job(request, job_id)
+    
+    return JsonResponse({'job_id': job.id, 'cancelled': cancel(job)})
+
+
+def metrics(request):
+    """Prometheus metrics for this process.
+
+    Served to staff users and to the addresses in FLASHLEARN_METRICS_ALLOWED_IPS
+    (the scraper), and only while FLASHLEARN_METRICS_ENABLED is on.
+    """
+    if not metrics_enabled():
+        raise Http404
+    allowed_ips = getattr(settings, 'FLASHLEARN_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    answers = answer_cache_stats()
+    prompts = prompt_stats()
+    registry = get_registry().metrics()
+    gate = get_ollama_client().gate.stats()
+    embeddings = embedding_cache_stats()
+    # Imported here: the task module loads the flashcard models' libraries
+    from .tasks import summary_cache_stats
+    summaries = summary_cache_stats()
+    samples = [
+        ('flashlearn_answer_cache_hits_total', 'counter', "Questions answered from the answer cache.", answers['hits']),
+        ('flashlearn_answer_cache_misses_total', 'counter', "Answer cache lookups that missed.", answers['misses']),
+        ('flashlearn_embedding_cache_hits_total', 'counter', "Embeddings served from the embedding cache.",
+         embeddings['documents']['hits'] + embeddings['queries']['hits']),
+        ('flashlearn_embedding_cache_misses_total', 'counter', "Embeddings computed by the model.",
+         embeddings['documents']['misses'] + embeddings['queries']['misses']),
+        ('flashlearn_chat_requests_total', 'counter', "Chat answers generated by the model.", prompts['requests']),
+        ('flashlearn_chat_prompt_tokens_total', 'counter', "Prompt tokens sent for chat answers.", prompts['prompt_tokens']),
+        ('flashlearn_chat_context_tokens_total', 'counter', "Retrieved-context tokens in chat prompts.", prompts['context_tokens']),
+        ('flashlearn_model_registry_resident_bytes', 'gauge', "Estimated size of the loaded local models.", registry['resident_bytes']),
+        ('flashlearn_process_rss_bytes', 'gauge', "Resident memory of this process.", registry['process_rss_bytes'] or 0),
+        ('flashlearn_ollama_active_requests', 'gauge', "Ollama requests in flight.", gate['active']),
+        ('flashlearn_ollama_waiting_requests', 'gauge', "Ollama requests waiting for a slot.", gate['waiting']),
+        ('flashlearn_jobs_queued', 'gauge', "Background jobs waiting for a worker.", Job.objects.filter(status='queued').count()),
+        # Stored in the database, so these cover every process
+        ('flashlearn_summary_cache_hits_total', 'counter', "Topic summaries reused instead of generated.", summaries['hits']),
+        ('flashlearn_summary_cache_misses_total', 'counter', "Topic summaries generated by the model.", summaries['misses']),
+        ('flashlearn_summary_cache_seconds_saved_total', 'counter', "LLM time saved by reused summaries.", summaries['seconds_saved']),
+    ]
+    return HttpResponse(render_metrics(samples), content_type='text/plain; version=0.0.4; charset=utf-8')
+